@@ -0,0 +1,338 @@
+"""
+Standalone ASGI App
+
+Serves the erg image pipeline without the Azure Functions host, for load testing
+and on-prem deployment behind our own load balancer:
+1. POST /api/process     same request and response contract as azure_function_entrypoint.main
+2. POST /api/jobs        queues a submission like main_submit; GET /api/jobs/{jobId}
+                         reports it like main_status
+3. GET  /health          liveness: the process is up and its event loop is responsive
+4. GET  /ready           readiness: warm-up has finished and there is capacity for
+                         another pipeline run; also reports OCR hedging and circuit
+                         breaker metrics when either is enabled
+
+The app is a plain ASGI callable with no web framework dependency, so it runs
+under any ASGI server with as many worker processes as the host has cores, e.g.:
+    uvicorn shared_code.asgi_app:app --workers 4
+
+Pipeline runs are CPU-bound, so they are offloaded to a bounded thread pool and
+the event loop keeps answering health checks while they run. Once every pipeline
+thread is busy and OCR_ASGI_MAX_PENDING runs are waiting, new runs get 503 with
+Retry-After before their body is read, and /ready reports not ready so the load
+balancer can route elsewhere. Unexpected errors get main's 500 JSON body.
+
+Unlike the Functions binding, NDJSON event streams are sent as events happen.
+A stream's HTTP status is therefore always 200; the final result event carries
+the status code main would have returned. If the client disconnects mid-stream,
+the run stops at its next event.
+
+Configuration:
+    OCR_ASGI_WORKERS        Pipeline threads per process (default: CPU count)
+    OCR_ASGI_MAX_PENDING    Runs allowed to wait for a pipeline thread (default 2 x workers)
+    OCR_ASGI_MAX_BODY_MB    Largest accepted request body (default 64)
+"""
+
+import asyncio
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from shared_code.job_queue import get_job_service
+from shared_code.pipeline_service import (
+    NDJSON_MIMETYPE,
+    build_pipeline_options,
+    iter_pipeline_events,
+    ndjson_lines,
+    run_pipeline,
+    unhandled_exception_body,
+    validate_request_body,
+)
+from shared_code.warmup import WARMUP_ON_START, last_warmup, start_background_warmup
+
+ASGI_WORKERS = int(os.environ.get("OCR_ASGI_WORKERS", "0")) or os.cpu_count() or 1
+MAX_PENDING = int(os.environ.get("OCR_ASGI_MAX_PENDING", "0")) or 2 * ASGI_WORKERS
+MAX_BODY_BYTES = int(os.environ.get("OCR_ASGI_MAX_BODY_MB", "64")) << 20
+
+JSON_MIMETYPE = "application/json"
+
+# Seconds a client is asked to wait before retrying a 503
+RETRY_AFTER_SECONDS = 1
+
+_pipeline_executor: Optional[ThreadPoolExecutor] = None
+_warmup_thread: Optional[threading.Thread] = None
+
+# Pipeline runs admitted and not yet finished; only touched on the event loop
+_in_flight = 0
+
+
+class RequestError(Exception):
+    """A request that can't be processed; carries the HTTP status and response body"""
+
+    def __init__(self, status: int, body: Dict[str, Any]):
+        super().__init__(body.get("error"))
+        self.status = status
+        self.body = body
+
+
+def get_pipeline_executor() -> ThreadPoolExecutor:
+    """Return the thread pool pipeline runs are offloaded to"""
+    global _pipeline_executor
+    if _pipeline_executor is None:
+        _pipeline_executor = ThreadPoolExecutor(max_workers=ASGI_WORKERS, thread_name_prefix="ocr-asgi")
+    return _pipeline_executor
+
+
+def ensure_warmup():
+    """Start the background warm-up once per process, if OCR_WARMUP_ON_START allows it"""
+    global _warmup_thread
+    if WARMUP_ON_START and _warmup_thread is None:
+        _warmup_thread = start_background_warmup()
+
+
+def has_capacity() -> bool:
+    return _in_flight < ASGI_WORKERS + MAX_PENDING
+
+
+def readiness() -> Tuple[bool, Dict[str, Any]]:
+    """
+    Report whether this process should receive traffic
+
+    Returns:
+        Tuple of (ready, details) where details has warmedUp, inFlight, capacity
+        and, when hedging or the circuit breaker is enabled, ocrResilience metrics
+    """
+    from shared_code.ocr_resilience import get_resilience_metrics, resilience_enabled
+
+    ensure_warmup()
+    warmed_up = not WARMUP_ON_START or last_warmup() is not None
+    ready = warmed_up and has_capacity()
+    details = {
+        "ready": ready,
+        "warmedUp": warmed_up,
+        "inFlight": _in_flight,
+        "capacity": ASGI_WORKERS + MAX_PENDING
+    }
+    if resilience_enabled({}):
+        details["ocrResilience"] = get_resilience_metrics()
+    return ready, details
+
+
+async def send_response(send, status: int, body: bytes, content_type: str = JSON_MIMETYPE,
+                        headers: Optional[List[Tuple[bytes, bytes]]] = None):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", content_type.encode("latin-1")),
+            (b"content-length", str(len(body)).encode("latin-1")),
+            *(headers or [])
+        ]
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def send_json(send, status: int, payload: Any, headers: Optional[List[Tuple[bytes, bytes]]] = None):
+    await send_response(send, status, json.dumps(payload).encode("utf-8"), headers=headers)
+
+
+async def read_json_body(receive) -> Any:
+    """
+    Read and decode a JSON request body
+
+    Raises:
+        RequestError: 413 if the body exceeds OCR_ASGI_MAX_BODY_MB, 400 if it isn't valid JSON
+    """
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            raise RequestError(400, {"success": False, "error": "Client disconnected"})
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > MAX_BODY_BYTES:
+            raise RequestError(413, {"success": False,
+                                     "error": f"Request body exceeds {MAX_BODY_BYTES >> 20} MB"})
+        chunks.append(chunk)
+        if not message.get("more_body", False):
+            break
+
+    try:
+        return json.loads(b"".join(chunks))
+    except ValueError as ve:
+        raise RequestError(400, {"success": False, "error": f"Invalid JSON in request body: {str(ve)}"})
+
+
+async def read_submission(receive) -> Tuple[Dict[str, Any], List[str], Dict[str, Any]]:
+    """Read and validate a pipeline request; returns (request body, images, pipeline options)"""
+    req_body = await read_json_body(receive)
+    validation_error = validate_request_body(req_body)
+    if validation_error:
+        raise RequestError(400, {"error": validation_error})
+    return req_body, req_body["images"], build_pipeline_options(req_body.get("options", {}))
+
+
+def wants_event_stream(scope: Dict[str, Any], req_body: Dict[str, Any]) -> bool:
+    """True if the client asked for NDJSON pipeline events instead of a single result"""
+    for name, value in scope.get("headers", []):
+        if name.lower() == b"accept" and NDJSON_MIMETYPE.encode("latin-1") in value:
+            return True
+    return bool(req_body.get("options", {}).get("stream", False))
+
+
+async def watch_disconnect(receive, stop: threading.Event):
+    """Set stop once the client disconnects; the request body must already have been read"""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            stop.set()
+            return
+
+
+async def stream_events(receive, send, images: List[str], options: Dict[str, Any]):
+    """
+    Run the pipeline on a pipeline thread, sending each event as an NDJSON line when it happens
+
+    A disconnect is seen on receive() rather than through a failing send(), since
+    some servers silently drop sends to a closed connection.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    stop = threading.Event()
+
+    def produce():
+        events = iter_pipeline_events(images, options)
+        try:
+            for event in events:
+                if stop.is_set():
+                    break
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+        finally:
+            events.close()
+            loop.call_soon_threadsafe(queue.put_nowait, None)
+
+    producer = loop.run_in_executor(get_pipeline_executor(), produce)
+    watcher = asyncio.ensure_future(watch_disconnect(receive, stop))
+    try:
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", NDJSON_MIMETYPE.encode("latin-1"))]
+        })
+        while True:
+            event = await queue.get()
+            if event is None or stop.is_set():
+                break
+            for line in ndjson_lines([event]):
+                await send({"type": "http.response.body", "body": line.encode("utf-8"), "more_body": True})
+        if not stop.is_set():
+            await send({"type": "http.response.body", "body": b""})
+    finally:
+        # Stop the run early if the client went away or sending failed
+        stop.set()
+        watcher.cancel()
+        await producer
+
+
+async def handle_process(scope, receive, send):
+    global _in_flight
+    # Shed load before reading a body of up to OCR_ASGI_MAX_BODY_MB; the run's
+    # slot is held from here on, so bodies being read count toward capacity
+    if not has_capacity():
+        raise RequestError(503, {"success": False, "error": "Server is at capacity, please retry shortly"})
+
+    _in_flight += 1
+    try:
+        req_body, images, options = await read_submission(receive)
+        logging.info(f"Configuration: model_id={options['modelId']}, api_version={options['apiVersion']}")
+
+        if wants_event_stream(scope, req_body):
+            await stream_events(receive, send, images, options)
+            return
+
+        loop = asyncio.get_running_loop()
+        status_code, result = await loop.run_in_executor(get_pipeline_executor(), run_pipeline, images, options)
+        await send_json(send, status_code, result)
+    finally:
+        _in_flight -= 1
+
+
+async def handle_submit(scope, receive, send):
+    req_body, images, options = await read_submission(receive)
+    job_id = await asyncio.to_thread(lambda: get_job_service().submit(images, options))
+    status_url = f"/api/jobs/{job_id}"
+
+    logging.info(f"Queued job {job_id} with {len(images)} images")
+    await send_json(send, 202, {"jobId": job_id, "status": "queued", "statusUrl": status_url},
+                    headers=[(b"location", status_url.encode("latin-1"))])
+
+
+async def handle_status(scope, receive, send, job_id: str):
+    job = await asyncio.to_thread(get_job_service().get_status, job_id)
+    if job is None:
+        raise RequestError(404, {"error": f"Job {job_id} not found"})
+    await send_json(send, 200, job)
+
+
+async def lifespan(receive, send):
+    """Handle the ASGI lifespan protocol: warm up on startup, release the pool on shutdown"""
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            # Warm-up runs in the background; /ready reports not ready until it finishes
+            ensure_warmup()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            if _pipeline_executor is not None:
+                _pipeline_executor.shutdown(wait=False)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    """ASGI entry point"""
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    # Track whether a response has started, so an unexpected error can still be answered
+    response_started = False
+    raw_send = send
+
+    async def send(message):
+        nonlocal response_started
+        if message["type"] == "http.response.start":
+            response_started = True
+        await raw_send(message)
+
+    method = scope["method"]
+    path = scope["path"].rstrip("/") or "/"
+    try:
+        if path == "/health" and method in ("GET", "HEAD"):
+            await send_json(send, 200, {"status": "ok"})
+        elif path == "/ready" and method in ("GET", "HEAD"):
+            ready, details = readiness()
+            await send_json(send, 200 if ready else 503, details)
+        elif path == "/api/process" and method == "POST":
+            await handle_process(scope, receive, send)
+        elif path == "/api/jobs" and method == "POST":
+            await handle_submit(scope, receive, send)
+        elif path.startswith("/api/jobs/") and method == "GET":
+            await handle_status(scope, receive, send, path[len("/api/jobs/"):])
+        elif path in ("/health", "/ready", "/api/process", "/api/jobs") or path.startswith("/api/jobs/"):
+            raise RequestError(405, {"error": f"Method {method} not allowed for {path}"})
+        else:
+            raise RequestError(404, {"error": f"No route for {path}"})
+    except RequestError as e:
+        headers = [(b"retry-after", str(RETRY_AFTER_SECONDS).encode("latin-1"))] if e.status == 503 else None
+        await send_json(send, e.status, e.body, headers=headers)
+    except Exception as e:
+        body = unhandled_exception_body(e)
+        # Mid-stream there is no status left to send; the error has been logged
+        if not response_started:
+            await send_json(send, 500, body)
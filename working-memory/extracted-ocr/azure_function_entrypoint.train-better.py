@@ -8,13 +8,21 @@ import sys
 dir_path = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
 sys.path.append(dir_path)
 
-from shared_code.image_processor import process_erg_images
+from shared_code.pipeline_service import (
+    NDJSON_MIMETYPE,
+    build_pipeline_options,
+    iter_pipeline_events,
+    ndjson_lines,
+    run_pipeline,
+    unhandled_exception_body,
+    validate_request_body,
+)
+from shared_code.job_queue import get_job_service
+from shared_code.warmup import WARMUP_ON_START, start_background_warmup, warm_up
 
-# Load configuration from environment with defaults
-DEFAULT_MODEL_ID = os.environ.get("ERG_MONITOR_MODEL_ID", "erg-monitor-reader-v4")
-DEFAULT_API_VERSION = os.environ.get("AZURE_DOC_INTELLIGENCE_API_VERSION", "2024-11-30")
-DEFAULT_ENHANCE_READABILITY = os.environ.get("DEFAULT_ENHANCE_READABILITY", "true").lower() == "true"
-DEFAULT_STITCH_IMAGES = os.environ.get("DEFAULT_STITCH_IMAGES", "true").lower() == "true"
+# Warm the instance while the host finishes starting, instead of on the first request
+if WARMUP_ON_START:
+    start_background_warmup()
 
 def main(req: func.HttpRequest) -> func.HttpResponse:
     """
@@ -27,6 +35,13 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
     4. Parses the OCR results into structured workout data
     5. Returns everything as JSON response
     
+    Clients that send "Accept: application/x-ndjson" (or "stream": true in options)
+    get the pipeline's events instead, one JSON object per line: detection, partial,
+    stitched, ocr_started, ocr_complete and finally result. The Functions HTTP
+    binding sends the body when the function returns, so the events arrive together;
+    clients that need them while processing runs should use main_submit and poll
+    main_status, whose progress carries the partial results.
+    
     Request body format:
     {
         "images": ["base64string1", "base64string2", ...],
@@ -45,71 +60,26 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
         # Parse request body
         req_body = req.get_json()
         
-        if not req_body or 'images' not in req_body:
+        validation_error = validate_request_body(req_body)
+        if validation_error:
             return func.HttpResponse(
-                json.dumps({"error": "Request must include 'images' array"}),
+                json.dumps({"error": validation_error}),
                 status_code=400,
                 mimetype="application/json"
             )
         
-        # Extract images
-        images = req_body.get('images', [])
-        
-        # Get options with defaults from environment variables
-        client_options = req_body.get('options', {})
-        options = {
-            "modelId": client_options.get("modelId", DEFAULT_MODEL_ID),
-            "apiVersion": client_options.get("apiVersion", DEFAULT_API_VERSION),
-            "enhanceReadability": client_options.get("enhanceReadability", DEFAULT_ENHANCE_READABILITY),
-            "stitchImages": client_options.get("stitchImages", DEFAULT_STITCH_IMAGES),
-            "performOcr": client_options.get("performOcr", True)
-        }
+        images = req_body['images']
+        options = build_pipeline_options(req_body.get('options', {}))
         
         logging.info(f"Configuration: model_id={options['modelId']}, api_version={options['apiVersion']}")
         
-        # Validate input
-        if not isinstance(images, list) or len(images) == 0:
-            return func.HttpResponse(
-                json.dumps({"error": "The 'images' field must be a non-empty array of base64 strings"}),
-                status_code=400,
-                mimetype="application/json"
-            )
-        
-        # Check if OCR is requested
-        do_ocr = options.get('performOcr', True)
-        
-        # Process images
-        logging.info(f'Processing {len(images)} images with options: {options}')
+        if wants_event_stream(req, req_body):
+            return event_stream_response(images, options)
         
-        logging.info(f'Processing images with OCR={do_ocr}')
-        options['ocr'] = do_ocr  # Set the OCR flag in options
-        result = process_erg_images(images, options)
-        
-        # Check for processing errors - improved error handling
-        if not isinstance(result, dict):
-            error_msg = "Processing returned invalid result type"
-            logging.error(error_msg)
-            return func.HttpResponse(
-                json.dumps({"success": False, "error": error_msg}),
-                status_code=500,
-                mimetype="application/json"
-            )
-            
-        # If success is explicitly False, return error
-        if result.get('success') is False:
-            error_msg = result.get('error', 'Unknown error')
-            logging.error(f"Processing error: {error_msg}")
-            return func.HttpResponse(
-                json.dumps(result),
-                status_code=500,
-                mimetype="application/json"
-            )
-        
-        # Return successful result
-        logging.info('Processing completed successfully')
+        status_code, result = run_pipeline(images, options)
         return func.HttpResponse(
             json.dumps(result),
-            status_code=200,
+            status_code=status_code,
             mimetype="application/json"
         )
         
@@ -122,22 +92,132 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
             status_code=400,
             mimetype="application/json"
         )
-        
+    
     except Exception as e:
-        # Add detailed error logging
-        import traceback
-        trace = traceback.format_exc()
-        error_msg = f"Unhandled exception: {str(e)}"
-        logging.error(error_msg)
-        logging.error(f"Trace: {trace}")
-        
-        # Return a more detailed error response
+        return unhandled_exception_response(e)
+
+
+def unhandled_exception_response(e: Exception) -> func.HttpResponse:
+    """500 JSON response for an exception nothing else handled"""
+    return func.HttpResponse(
+        json.dumps(unhandled_exception_body(e)),
+        status_code=500,
+        mimetype="application/json"
+    )
+
+
+def wants_event_stream(req: func.HttpRequest, req_body: dict) -> bool:
+    """True if the client asked for NDJSON pipeline events instead of a single result"""
+    if NDJSON_MIMETYPE in (req.headers.get('Accept') or ''):
+        return True
+    return bool(req_body.get('options', {}).get('stream', False))
+
+
+def event_stream_response(images: list, options: dict) -> func.HttpResponse:
+    """Relay pipeline events as an NDJSON response; the status code is the final result's"""
+    lines = []
+    status_code = 500
+    for event in iter_pipeline_events(images, options):
+        if event['event'] == 'result':
+            status_code = event['statusCode']
+        lines.extend(ndjson_lines([event]))
+    
+    return func.HttpResponse(
+        ''.join(lines),
+        status_code=status_code,
+        mimetype=NDJSON_MIMETYPE
+    )
+
+
+def main_submit(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Azure Function endpoint that queues erg monitor images for background processing.
+    
+    Accepts the same request body as main, but returns 202 Accepted with a job id
+    immediately instead of holding the connection open for the whole pipeline.
+    Bound in function.json with "entryPoint": "main_submit".
+    
+    Response body format:
+    {
+        "jobId": "...",
+        "status": "queued",
+        "statusUrl": "/api/jobs/<jobId>"
+    }
+    """
+    try:
+        req_body = req.get_json()
+    except ValueError as ve:
+        return func.HttpResponse(
+            json.dumps({"success": False, "error": f"Invalid JSON in request body: {str(ve)}"}),
+            status_code=400,
+            mimetype="application/json"
+        )
+    
+    validation_error = validate_request_body(req_body)
+    if validation_error:
         return func.HttpResponse(
-            json.dumps({
-                "success": False, 
-                "error": error_msg,
-                "trace": trace
-            }),
-            status_code=500,
+            json.dumps({"error": validation_error}),
+            status_code=400,
             mimetype="application/json"
-        )
\ No newline at end of file
+        )
+    
+    try:
+        options = build_pipeline_options(req_body.get('options', {}))
+        job_id = get_job_service().submit(req_body['images'], options)
+    except Exception as e:
+        return unhandled_exception_response(e)
+    status_url = f"/api/jobs/{job_id}"
+    
+    logging.info(f"Queued job {job_id} with {len(req_body['images'])} images")
+    return func.HttpResponse(
+        json.dumps({"jobId": job_id, "status": "queued", "statusUrl": status_url}),
+        status_code=202,
+        mimetype="application/json",
+        headers={"Location": status_url}
+    )
+
+
+def main_status(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Azure Function endpoint that reports the progress and result of a queued job.
+    
+    Bound in function.json with "entryPoint": "main_status" and route "jobs/{job_id}".
+    Returns 404 for unknown job ids. Finished jobs include the same result payload
+    that main returns.
+    """
+    job_id = req.route_params.get('job_id') or req.params.get('jobId')
+    if not job_id:
+        return func.HttpResponse(
+            json.dumps({"error": "A job id is required"}),
+            status_code=400,
+            mimetype="application/json"
+        )
+    
+    job = get_job_service().get_status(job_id)
+    if job is None:
+        return func.HttpResponse(
+            json.dumps({"error": f"Job {job_id} not found"}),
+            status_code=404,
+            mimetype="application/json"
+        )
+    
+    return func.HttpResponse(
+        json.dumps(job),
+        status_code=200,
+        mimetype="application/json"
+    )
+
+
+def main_warmup(timer: func.TimerRequest) -> None:
+    """
+    Timer-triggered warm-up that keeps an instance's runtime state initialized.
+    
+    Bound in function.json with "entryPoint": "main_warmup" and a timer trigger
+    (e.g. "schedule": "0 */5 * * * *"). Each run re-opens the pooled OCR connection
+    and logs the warm-up duration per step.
+    """
+    if timer.past_due:
+        logging.info('Warm-up timer is past due')
+    
+    report = warm_up()
+    logging.info(f"Warm-up report: {json.dumps(report)}")
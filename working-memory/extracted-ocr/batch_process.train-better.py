@@ -0,0 +1,188 @@
+"""
+Batch Processing of Erg Image Submissions
+
+Runs the full image pipeline over many submissions for backfills and model
+evaluation (the batch mode of image_processor's command line):
+1. Inputs are files, directories or glob patterns (see batch_support). Each
+   input can be one of:
+   - a JSON submission, {"images": [...], "options": {...}} as taken by --input
+     (a JSON array holds several submissions)
+   - a JSONL manifest with one submission per line. A line can also give
+     "paths" to image files, resolved relative to the manifest, instead of
+     base64 "images"
+   - an image file (.jpg, .jpeg, .png), processed as a single-image submission
+2. Submissions are processed by N worker threads, with at most two per worker in
+   flight. OpenCV releases the GIL while it works, and OCR calls spend most of their
+   time waiting, so threads overlap both
+3. One JSONL line per submission is written as soon as it finishes
+4. With an archive, processed images go to a crop_archive pack under the record id
+   and results carry archivedImages references instead of base64 images
+5. A rerun with the same output file resumes where the last one stopped
+6. Throughput and per-submission latency percentiles are reported at the end
+
+Configuration:
+    OCR_BATCH_WORKERS    Worker threads (default: twice the CPU count)
+"""
+
+import base64
+import logging
+import os
+import time
+from contextlib import nullcontext
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from shared_code.batch_support import (
+    DEFAULT_INPUT_EXTENSIONS, JsonlWriter, ThroughputMeter, completed_ids, decode_record,
+    iter_input_paths, iter_raw_records
+)
+from shared_code.crop_archive import CropArchive
+
+BATCH_WORKERS = int(os.environ.get("OCR_BATCH_WORKERS", "0")) or 2 * (os.cpu_count() or 1)
+
+# Image files processed as single-image submissions
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+def iter_submissions(inputs: Sequence[str]) -> Iterator[Tuple[str, Any, str]]:
+    """
+    Yield (record id, raw submission, directory image paths are relative to)
+
+    JSONL lines are yielded undecoded; decode them with load_submission.
+    """
+    extensions = tuple(DEFAULT_INPUT_EXTENSIONS) + IMAGE_EXTENSIONS
+    for path in iter_input_paths(inputs, extensions):
+        base_dir = os.path.dirname(os.path.abspath(path))
+        if path.lower().endswith(IMAGE_EXTENSIONS):
+            yield path, {"paths": [os.path.abspath(path)]}, base_dir
+            continue
+        for record_id, record in iter_raw_records(path):
+            yield record_id, record, base_dir
+
+
+def load_submission(record: Any, base_dir: str) -> Tuple[List[str], Dict[str, Any]]:
+    """
+    Decode a submission and read any image files it refers to
+
+    Returns:
+        Tuple of (base64 images, submission options)
+
+    Raises:
+        ValueError: If the submission isn't a JSON object or has no images
+        OSError: If an image file can't be read
+    """
+    record = decode_record(record)
+    if not isinstance(record, dict):
+        raise ValueError("Submission must be a JSON object")
+
+    images = list(record.get("images") or [])
+    for path in record.get("paths") or []:
+        with open(os.path.join(base_dir, path), "rb") as f:
+            images.append(base64.b64encode(f.read()).decode("ascii"))
+
+    if not images:
+        raise ValueError("Submission has no images")
+    return images, dict(record.get("options") or {})
+
+
+def process_submission(record_id: str, record: Any, base_dir: str, options: Dict[str, Any],
+                       include_images: bool = False, archive: Optional[CropArchive] = None) -> Dict[str, Any]:
+    """
+    Run the pipeline on one submission
+
+    Args:
+        record_id: Positional id of the submission (see batch_support)
+        record: Raw submission
+        base_dir: Directory image paths are relative to
+        options: Processing options; they override the submission's own options
+        include_images: Keep processedImages and stitchedImage in the result
+        archive: Archive the processed images are added to
+
+    Returns:
+        Dictionary with id, success, latencySeconds and result (or error if the
+        submission couldn't be loaded). If its images couldn't be archived, the
+        result has archiveError instead of archivedImages.
+    """
+    from shared_code.image_processor import process_erg_images
+
+    started = time.perf_counter()
+    try:
+        images, submission_options = load_submission(record, base_dir)
+    except (OSError, ValueError) as e:
+        return {"id": record_id, "success": False, "error": str(e),
+                "latencySeconds": round(time.perf_counter() - started, 3)}
+
+    # Submissions already run side by side; their images don't need their own threads
+    run_options = {**submission_options, **options, "parallelPreprocessing": False}
+    result = process_erg_images(images, run_options)
+    if archive is not None and isinstance(result, dict):
+        # A full disk or bad permissions fails this record's archiving, not the batch
+        try:
+            result["archivedImages"] = archive.append_result(record_id, result)
+        except OSError as e:
+            logging.warning(f"Could not archive the images of submission {record_id}: {e}")
+            result["archiveError"] = str(e)
+    if not include_images and isinstance(result, dict):
+        result.pop("processedImages", None)
+        result.pop("stitchedImage", None)
+
+    return {
+        "id": record_id,
+        "success": bool(isinstance(result, dict) and result.get("success")),
+        "latencySeconds": round(time.perf_counter() - started, 3),
+        "result": result
+    }
+
+
+def process_batch(inputs: Sequence[str], output_path: str, options: Optional[Dict[str, Any]] = None,
+                  workers: int = BATCH_WORKERS, include_images: bool = False,
+                  resume: bool = True, archive_dir: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Process every submission under inputs into a JSONL file
+
+    Results are written in completion order. At most two submissions per worker
+    are loaded at a time, so memory stays bounded however many there are.
+
+    Args:
+        inputs: Files, directories or glob patterns of submissions and images
+        output_path: JSONL file results are appended to
+        options: Processing options applied to every submission
+        workers: Worker threads
+        include_images: Keep the processed images in the written results
+        resume: Skip submissions already in output_path (otherwise it is overwritten)
+        archive_dir: Crop archive directory processed images are added to
+
+    Returns:
+        Summary with processed, succeeded, failed and skipped counts, elapsed
+        time, submissions per second and latency percentiles
+    """
+    options = options or {}
+    done = completed_ids(output_path) if resume else set()
+    counts = {"succeeded": 0, "failed": 0, "skipped": 0}
+    meter = ThroughputMeter("Batch")
+
+    def write_result(writer: JsonlWriter, result: Dict[str, Any]):
+        counts["succeeded" if result["success"] else "failed"] += 1
+        writer.write(result)
+        meter.add(1, result["latencySeconds"])
+
+    archive_context = CropArchive(archive_dir, writable=True) if archive_dir else nullcontext()
+    with archive_context as archive, JsonlWriter(output_path, append=resume) as writer:
+        with ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="ocr-batch") as pool:
+            in_flight = set()
+            for record_id, record, base_dir in iter_submissions(inputs):
+                if record_id in done:
+                    counts["skipped"] += 1
+                    continue
+                in_flight.add(pool.submit(process_submission, record_id, record, base_dir,
+                                          options, include_images, archive))
+                if len(in_flight) >= 2 * max(workers, 1):
+                    finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        write_result(writer, future.result())
+            for future in wait(in_flight).done:
+                write_result(writer, future.result())
+
+    summary = {**counts, **meter.summary()}
+    logging.info(f"Batch finished: {summary}")
+    return summary
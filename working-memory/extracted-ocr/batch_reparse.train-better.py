@@ -0,0 +1,231 @@
+"""
+Batch Re-parse of Archived OCR Results
+
+Re-runs parse_ocr_results over stored OCR results after a parser change:
+1. Archived JSON/JSONL files are streamed from disk (see batch_support); records
+   are decoded and parsed in a process pool, a chunk of records per task
+2. Each result is appended to a JSONL output file as soon as its chunk finishes
+3. A rerun with the same output file resumes where the last one stopped
+4. Each new parse is compared with the parse stored alongside the OCR result,
+   and the changed paths are recorded
+
+Archived records may be the pipeline's result ({"ocrResults": ..., "parsedData": ...}),
+a job record whose "result" holds that, or a bare OCR result ({"success": ..., "results": ...}).
+
+Configuration:
+    OCR_REPARSE_WORKERS       Worker processes (default: CPU count)
+    OCR_REPARSE_CHUNK_SIZE    Records per worker task (default 64)
+
+Usage:
+    python -m shared_code.batch_reparse archive/ --output reparsed.jsonl
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from shared_code.batch_support import (
+    JsonlWriter, ThroughputMeter, chunked, completed_ids, decode_record, iter_input_paths, iter_raw_records
+)
+from shared_code.workout_parser import parse_ocr_results
+
+REPARSE_WORKERS = int(os.environ.get("OCR_REPARSE_WORKERS", "0")) or os.cpu_count() or 1
+REPARSE_CHUNK_SIZE = int(os.environ.get("OCR_REPARSE_CHUNK_SIZE", "64"))
+
+# Changed paths recorded per document; the count is always exact
+MAX_DIFF_ENTRIES = 20
+
+
+def split_archived_record(record: Any) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """
+    Find the OCR result and the previously parsed data in an archived record
+
+    Returns:
+        Tuple of (OCR result or None, previous parsedData or None)
+    """
+    if not isinstance(record, dict):
+        return None, None
+    if isinstance(record.get("result"), dict) and "ocrResults" in record["result"]:
+        record = record["result"]
+    if "ocrResults" in record:
+        return record.get("ocrResults"), record.get("parsedData")
+    if "results" in record or "analyzeResult" in record:
+        return record, None
+    return None, None
+
+
+def diff_parsed(old: Any, new: Any, path: str = "") -> List[Dict[str, Any]]:
+    """
+    List the paths where two parsed results differ
+
+    Returns:
+        One {"path", "old", "new"} entry per differing leaf; containers of
+        different type or length are reported whole
+    """
+    if isinstance(old, dict) and isinstance(new, dict):
+        changes = []
+        for key in sorted(set(old) | set(new), key=str):
+            child = f"{path}.{key}" if path else str(key)
+            if key not in old:
+                changes.append({"path": child, "old": None, "new": new[key]})
+            elif key not in new:
+                changes.append({"path": child, "old": old[key], "new": None})
+            else:
+                changes.extend(diff_parsed(old[key], new[key], child))
+        return changes
+
+    if isinstance(old, list) and isinstance(new, list) and len(old) == len(new):
+        changes = []
+        for index, (old_item, new_item) in enumerate(zip(old, new)):
+            changes.extend(diff_parsed(old_item, new_item, f"{path}[{index}]"))
+        return changes
+
+    return [] if old == new else [{"path": path, "old": old, "new": new}]
+
+
+def _normalized(value: Any) -> Any:
+    # Compare parsed data the way it was archived: as decoded JSON
+    return json.loads(json.dumps(value, default=lambda v: dict(v) if hasattr(v, "keys") else str(v)))
+
+
+def reparse_record(record_id: str, record: Any, include_data: bool = True) -> Dict[str, Any]:
+    """
+    Re-parse one archived record
+
+    Returns:
+        Dictionary with id, success, changed (None when no previous parse was
+        stored), diffCount, diff and, if include_data, the new data. Records without
+        an OCR result or that fail to decode get success False and an error.
+    """
+    try:
+        ocr_results, previous = split_archived_record(decode_record(record))
+    except ValueError as e:
+        return {"id": record_id, "success": False, "error": f"Invalid JSON: {str(e)}"}
+
+    if ocr_results is None:
+        return {"id": record_id, "success": False, "error": "No OCR result in record"}
+
+    parsed = parse_ocr_results(ocr_results)
+    result = {"id": record_id, "success": bool(parsed.get("success"))}
+    if not parsed.get("success"):
+        result["error"] = parsed.get("error")
+        return result
+
+    data = _normalized(parsed.get("data"))
+    if previous is None:
+        result["changed"] = None
+    else:
+        changes = diff_parsed(previous, data)
+        result["changed"] = bool(changes)
+        result["diffCount"] = len(changes)
+        result["diff"] = changes[:MAX_DIFF_ENTRIES]
+    if include_data:
+        result["data"] = data
+    return result
+
+
+def reparse_chunk(chunk: List[Tuple[str, Any]], include_data: bool = True) -> Tuple[List[Dict[str, Any]], float]:
+    """Re-parse a chunk of records in a worker process; returns (results, seconds taken)"""
+    # The parser logs every classification decision at INFO
+    previous_disable = logging.root.manager.disable
+    logging.disable(max(previous_disable, logging.INFO))
+    try:
+        start = time.perf_counter()
+        results = [reparse_record(record_id, record, include_data) for record_id, record in chunk]
+        return results, time.perf_counter() - start
+    finally:
+        logging.disable(previous_disable)
+
+
+def reparse_archive(inputs: Sequence[str], output_path: str, workers: int = REPARSE_WORKERS,
+                    chunk_size: int = REPARSE_CHUNK_SIZE, include_data: bool = True,
+                    resume: bool = True) -> Dict[str, Any]:
+    """
+    Re-parse every archived OCR result under inputs into a JSONL file
+
+    At most two chunks per worker are in flight, so memory stays bounded however
+    large the archive is. Results are written in completion order.
+
+    Args:
+        inputs: Files, directories or glob patterns of archived JSON/JSONL
+        output_path: JSONL file results are appended to
+        workers: Worker processes; 1 parses in this process
+        chunk_size: Records per worker task
+        include_data: Write the new parsed data, not just the diff
+        resume: Skip records already in output_path (otherwise it is overwritten)
+
+    Returns:
+        Summary with counts (processed, skipped, failed, changed, unchanged,
+        noPrevious) and throughput (see ThroughputMeter.summary)
+    """
+    done = completed_ids(output_path) if resume else set()
+    counts = {"skipped": 0, "failed": 0, "changed": 0, "unchanged": 0, "noPrevious": 0}
+    meter = ThroughputMeter("Re-parse")
+
+    def pending_records():
+        for path in iter_input_paths(inputs):
+            for record_id, record in iter_raw_records(path):
+                if record_id in done:
+                    counts["skipped"] += 1
+                    continue
+                yield record_id, record
+
+    def write_results(writer: JsonlWriter, results: List[Dict[str, Any]], seconds: float):
+        for result in results:
+            if not result["success"]:
+                counts["failed"] += 1
+            elif result.get("changed") is None:
+                counts["noPrevious"] += 1
+            else:
+                counts["changed" if result["changed"] else "unchanged"] += 1
+            writer.write(result)
+        meter.add(len(results), seconds)
+
+    chunks = chunked(pending_records(), chunk_size)
+    with JsonlWriter(output_path, append=resume) as writer:
+        if workers <= 1:
+            for chunk in chunks:
+                write_results(writer, *reparse_chunk(chunk, include_data))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                in_flight = set()
+                for chunk in chunks:
+                    in_flight.add(pool.submit(reparse_chunk, chunk, include_data))
+                    if len(in_flight) >= 2 * workers:
+                        finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                        for future in finished:
+                            write_results(writer, *future.result())
+                for future in wait(in_flight).done:
+                    write_results(writer, *future.result())
+
+    summary = {**counts, **meter.summary()}
+    summary["chunkLatency"] = summary.pop("latency")
+    logging.info(f"Re-parse finished: {summary}")
+    return summary
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Re-parse archived OCR results with the current parser")
+    parser.add_argument("inputs", nargs="+", help="Archived JSON/JSONL files, directories or glob patterns")
+    parser.add_argument("--output", required=True, help="JSONL file to write results to")
+    parser.add_argument("--workers", type=int, default=REPARSE_WORKERS, help="Worker processes")
+    parser.add_argument("--chunk-size", type=int, default=REPARSE_CHUNK_SIZE, help="Records per worker task")
+    parser.add_argument("--diff-only", action="store_true", help="Write only the diff, not the new parsed data")
+    parser.add_argument("--restart", action="store_true", help="Overwrite the output instead of resuming")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    summary = reparse_archive(args.inputs, args.output, workers=args.workers, chunk_size=args.chunk_size,
+                              include_data=not args.diff_only, resume=not args.restart)
+    print(json.dumps(summary, indent=2))
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,207 @@
+"""
+Batch Job Support
+
+Shared plumbing for the offline batch tools:
+1. Input discovery - files, directories and glob patterns expanded to JSON/JSONL files
+2. Streaming input - JSONL lines are read as raw text, so decoding can happen in
+   the worker processes instead of the reading loop
+3. Incremental JSONL output - each result is flushed as soon as it is written
+4. Resume - ids already present in the output file are skipped on the next run;
+   a line cut off by an interruption is dropped first
+
+Record ids are positional ("<file>:<line>" for JSONL, "<file>" for a JSON
+document, "<file>:<index>" for items of a JSON array), so resuming never
+requires decoding the input.
+"""
+
+import glob
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+from shared_code.perf_stats import latency_summary
+
+# Extensions picked up when an input is a directory
+DEFAULT_INPUT_EXTENSIONS = (".json", ".jsonl")
+
+
+def iter_input_paths(inputs: Sequence[str], extensions: Sequence[str] = DEFAULT_INPUT_EXTENSIONS) -> Iterator[str]:
+    """
+    Expand inputs into file paths, in sorted order within each input
+
+    Args:
+        inputs: File paths, directories (searched recursively) or glob patterns
+        extensions: File extensions collected from directories
+    """
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, _, files in sorted(os.walk(item)):
+                for name in sorted(files):
+                    if name.endswith(tuple(extensions)):
+                        yield os.path.join(root, name)
+        elif os.path.isfile(item):
+            yield item
+        else:
+            matches = sorted(glob.glob(item, recursive=True))
+            if not matches:
+                logging.warning(f"No input files match {item}")
+            for path in matches:
+                if os.path.isfile(path):
+                    yield path
+
+
+def iter_raw_records(path: str) -> Iterator[Tuple[str, Any]]:
+    """
+    Yield (record id, record) pairs from a JSON or JSONL file
+
+    JSONL records are yielded as undecoded text; blank lines are skipped. A JSON
+    file holding an array yields each item, anything else is one record.
+    """
+    if path.endswith(".jsonl"):
+        with open(path, "r", encoding="utf-8") as f:
+            for line_number, line in enumerate(f, start=1):
+                if line.strip():
+                    yield f"{path}:{line_number}", line
+        return
+
+    with open(path, "r", encoding="utf-8") as f:
+        document = json.load(f)
+    if isinstance(document, list):
+        for index, item in enumerate(document):
+            yield f"{path}:{index}", item
+    else:
+        yield path, document
+
+
+def decode_record(record: Any) -> Any:
+    """Decode a record yielded as raw JSONL text; decoded records pass through"""
+    return json.loads(record) if isinstance(record, str) else record
+
+
+def chunked(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """Yield lists of up to size items"""
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def completed_ids(output_path: str, id_key: str = "id") -> Set[str]:
+    """
+    Return the ids already written to a JSONL output file
+
+    A final line without a newline was cut off mid-write; it is truncated away
+    so the record is processed again.
+    """
+    done: Set[str] = set()
+    if not os.path.exists(output_path):
+        return done
+
+    with open(output_path, "rb+") as f:
+        good_length = 0
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            good_length += len(line)
+            try:
+                done.add(json.loads(line)[id_key])
+            except (ValueError, KeyError, TypeError):
+                logging.warning(f"Skipping unreadable line in {output_path}")
+        if f.tell() != good_length:
+            logging.warning(f"Dropping partial last line of {output_path}")
+            f.truncate(good_length)
+    return done
+
+
+class JsonlWriter:
+    """
+    Append-only JSONL writer that flushes every record
+
+    Use as a context manager. fsync_every > 0 also syncs to disk every that many
+    records, bounding what a machine crash can lose.
+    """
+
+    def __init__(self, path: str, append: bool = True, fsync_every: int = 0):
+        self.path = path
+        self.append = append
+        self.fsync_every = fsync_every
+        self.count = 0
+        self._file = None
+
+    def __enter__(self) -> "JsonlWriter":
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        self._file = open(self.path, "a" if self.append else "w", encoding="utf-8")
+        return self
+
+    def write(self, record: Dict[str, Any]):
+        self._file.write(json.dumps(record, default=_json_default) + "\n")
+        self._file.flush()
+        self.count += 1
+        if self.fsync_every and self.count % self.fsync_every == 0:
+            os.fsync(self._file.fileno())
+
+    def __exit__(self, *exc_info):
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
+
+
+def _json_default(value: Any) -> Any:
+    # Parsed OCR data can hold read-only mappings and tuples from the OCR view
+    if hasattr(value, "keys"):
+        return dict(value)
+    if isinstance(value, (tuple, set)):
+        return list(value)
+    return str(value)
+
+
+class ThroughputMeter:
+    """
+    Counts processed items and batch latencies, logging progress periodically
+
+    Attributes:
+        processed: Items finished so far
+        started: time.monotonic() at creation
+    """
+
+    def __init__(self, label: str, log_every_seconds: float = 10.0):
+        self.label = label
+        self.log_every_seconds = log_every_seconds
+        self.processed = 0
+        self.started = time.monotonic()
+        self.latencies: List[float] = []
+        self._last_log = self.started
+
+    def add(self, items: int, latency: Optional[float] = None):
+        self.processed += items
+        if latency is not None:
+            self.latencies.append(latency)
+        now = time.monotonic()
+        if now - self._last_log >= self.log_every_seconds:
+            self._last_log = now
+            logging.info(f"{self.label}: {self.processed} done, {self.rate():.1f}/s")
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def rate(self) -> float:
+        elapsed = self.elapsed()
+        return self.processed / elapsed if elapsed > 0 else 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        """Return processed count, elapsed seconds, items per second and latency percentiles"""
+        return {
+            "processed": self.processed,
+            "elapsedSeconds": round(self.elapsed(), 3),
+            "perSecond": round(self.rate(), 1),
+            "latency": latency_summary(self.latencies)
+        }
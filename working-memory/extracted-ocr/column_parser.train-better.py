@@ -0,0 +1,181 @@
+"""
+Vectorized Column Parser
+
+Parses whole table columns of monitor readings (times, splits, distances, rates)
+in one NumPy pass instead of one Python parse per cell:
+1. Cells are packed into a fixed-width uint8 matrix
+2. Common OCR confusions (O -> 0, l -> 1, S -> 5, B -> 8, ...) are mapped through a
+   lookup table, but only for letters next to a digit or separator and not part of a
+   word, so "1:4S.0" reads as 1:45.0 while "500Sec" stays 500
+3. The numeric core of each cell is located; prefixes such as the rest marker "r"
+   and unit suffixes such as "m" or "min" are ignored. After a digit, a space
+   followed by a letter ends the reading ("500 Sec")
+4. Colon groups are weighted as h:mm:ss, and digits after the decimal point as tenths/hundredths
+
+Cells that can't be read as a value become NaN, with a matching validity mask.
+"""
+
+from typing import Any, Sequence, Tuple
+
+import numpy as np
+
+# Longest cell considered; longer cells are not monitor readings
+MAX_CELL_WIDTH = 24
+
+_ZERO = ord("0")
+_COLON = ord(":")
+_DOT = ord(".")
+_SPACE = ord(" ")
+
+_LETTER = np.zeros(256, dtype=bool)
+_LETTER[ord("A"):ord("Z") + 1] = True
+_LETTER[ord("a"):ord("z") + 1] = True
+
+# Byte lookup table mapping characters OCR confuses with digits onto the digit
+_CONFUSION_LUT = np.arange(256, dtype=np.uint8)
+for _char, _digit in {"o": "0", "O": "0", "D": "0", "l": "1", "I": "1", "|": "1",
+                      "Z": "2", "S": "5", "B": "8"}.items():
+    _CONFUSION_LUT[ord(_char)] = ord(_digit)
+
+# Bytes allowed between digits: padding, space and thousands separator
+_FILLER = np.zeros(256, dtype=bool)
+_FILLER[[0, ord(" "), ord(",")]] = True
+
+
+def _pack(values: Sequence[Any], width: int) -> Tuple[np.ndarray, np.ndarray]:
+    encoded = [b"" if v is None else str(v).strip().encode("ascii", "replace") for v in values]
+    too_long = np.fromiter((len(b) > width for b in encoded), dtype=bool, count=len(encoded))
+    matrix = np.array(encoded, dtype=f"S{width}").view(np.uint8).reshape(len(encoded), width)
+    return matrix, too_long
+
+
+def _reverse_cumsum(mask: np.ndarray) -> np.ndarray:
+    return mask[:, ::-1].cumsum(axis=1)[:, ::-1]
+
+
+def _beside(mask: np.ndarray) -> np.ndarray:
+    """True where the left or right neighbour is set"""
+    left = np.zeros_like(mask)
+    left[:, 1:] = mask[:, :-1]
+    right = np.zeros_like(mask)
+    right[:, :-1] = mask[:, 1:]
+    return left | right
+
+
+def _map_confusions(raw: np.ndarray, real_digit: np.ndarray, separator: np.ndarray) -> np.ndarray:
+    """
+    Return the digit mask with confusable letters that sit inside a number promoted
+
+    A letter such as O or S counts as a digit only next to a digit or separator
+    and never next to a letter that isn't confusable (it is then part of a word).
+    Two passes let a pair of confusable letters ("lO") read as digits.
+    """
+    confusable = _CONFUSION_LUT[raw] != raw
+    in_word = _beside(_LETTER[raw] & ~confusable)
+    digit = real_digit
+    for _ in range(2):
+        digit = real_digit | (confusable & ~in_word & _beside(digit | separator))
+    return digit
+
+
+def parse_time_column(values: Sequence[Any]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Parse a column of time-like cells into seconds
+
+    Accepts s, m:ss, h:mm:ss with optional tenths/hundredths ("1:45.3", "1:02:03.4").
+    Cells without a colon are read as plain numbers, so the same parser serves
+    distance and rate columns.
+
+    Args:
+        values: Cell values (strings, numbers or None)
+
+    Returns:
+        Tuple of (float64 array with NaN for unreadable cells, boolean validity mask)
+    """
+    n = len(values)
+    if n == 0:
+        return np.empty(0, dtype=np.float64), np.empty(0, dtype=bool)
+
+    width = min(max(len(str(v)) for v in values) if values else 1, MAX_CELL_WIDTH) or 1
+    raw, too_long = _pack(values, width)
+    positions = np.arange(width)
+
+    # After a digit, a space followed by a letter starts a unit or word ("500 Sec");
+    # the reading ends there, and the rest of the cell is treated as padding
+    real_digit = (raw >= _ZERO) & (raw <= _ZERO + 9)
+    word_start = np.zeros_like(real_digit)
+    word_start[:, :-1] = (raw[:, :-1] == _SPACE) & _LETTER[raw[:, 1:]] & (real_digit.cumsum(axis=1)[:, :-1] > 0)
+    cut = np.where(word_start.any(axis=1), word_start.argmax(axis=1), width)
+    raw = np.where(positions >= cut[:, None], 0, raw).astype(np.uint8)
+    real_digit &= positions < cut[:, None]
+
+    colon = raw == _COLON
+    dot = raw == _DOT
+    digit = _map_confusions(raw, real_digit, colon | dot)
+    mapped = np.where(digit, _CONFUSION_LUT[raw], raw)
+    numeric = digit | colon | dot
+
+    # The numeric core runs from the first to the last digit/separator; anything
+    # else inside it means the cell isn't a reading
+    first = numeric.argmax(axis=1)
+    last = width - 1 - numeric[:, ::-1].argmax(axis=1)
+    core = (positions >= first[:, None]) & (positions <= last[:, None])
+    stray = core & ~numeric & ~_FILLER[raw]
+
+    valid = real_digit.any(axis=1) & ~stray.any(axis=1) & ~too_long
+
+    # Colon groups counted from the right: 0 = seconds, 1 = minutes, 2 = hours
+    n_colons = colon.sum(axis=1)
+    group = _reverse_cumsum(colon) - colon
+    valid &= n_colons <= 2
+
+    # At most one decimal point, and only in the seconds group
+    after_dot = (dot.cumsum(axis=1) > 0) & ~dot
+    valid &= (dot.sum(axis=1) <= 1) & ~(dot & (group > 0)).any(axis=1)
+
+    int_digit = digit & core & ~after_dot
+    frac_digit = digit & core & after_dot
+    digit_value = mapped.astype(np.float64) - _ZERO
+
+    # Place value of each integer digit within its colon group
+    group_counts = np.stack([(int_digit & (group == g)).sum(axis=1) for g in range(3)], axis=1)
+    digits_right_of_group = np.concatenate(
+        [np.zeros((n, 1), dtype=np.int64), group_counts.cumsum(axis=1)[:, :2]], axis=1
+    )
+    below = np.take_along_axis(digits_right_of_group, np.minimum(group, 2), axis=1)
+    place = _reverse_cumsum(int_digit) - below - 1
+
+    frac_place = frac_digit.cumsum(axis=1)
+    contribution = np.where(int_digit, digit_value * 10.0 ** np.maximum(place, 0), 0.0)
+    contribution += np.where(frac_digit, digit_value * 10.0 ** -frac_place.astype(np.float64), 0.0)
+
+    group_values = np.stack([(contribution * (group == g)).sum(axis=1) for g in range(3)], axis=1)
+
+    # Seconds (and minutes below an hour group) need one or two digits and stay under 60
+    has_minutes = n_colons >= 1
+    has_hours = n_colons >= 2
+    valid &= ~has_minutes | ((group_counts[:, 0] >= 1) & (group_counts[:, 0] <= 2) & (group_values[:, 0] < 60))
+    valid &= ~has_hours | ((group_counts[:, 1] >= 1) & (group_counts[:, 1] <= 2) & (group_values[:, 1] < 60))
+
+    seconds = group_values[:, 0] + 60.0 * group_values[:, 1] + 3600.0 * group_values[:, 2]
+    seconds[~valid] = np.nan
+    return seconds, valid
+
+
+def parse_number_column(values: Sequence[Any]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Parse a column of distance or rate cells ("2,000m", "r120", "24")
+
+    Returns:
+        Tuple of (float64 array with NaN for unreadable cells, boolean validity mask)
+    """
+    numbers, valid = parse_time_column(values)
+    has_colon = np.fromiter((v is not None and ":" in str(v) for v in values), dtype=bool, count=len(values))
+    valid &= ~has_colon
+    numbers[has_colon] = np.nan
+    return numbers, valid
+
+
+def parse_time(value: Any) -> float:
+    """Parse a single time cell to seconds (NaN if unreadable)"""
+    return float(parse_time_column([value])[0][0])
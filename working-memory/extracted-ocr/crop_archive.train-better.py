@@ -0,0 +1,380 @@
+"""
+Packed Archive of Processed Images
+
+Retains the pipeline's processed crops and stitched images for auditing and
+model retraining, without keeping them as base64 inside JSON results:
+1. crops.pack holds the encoded images (JPEG/PNG bytes as the pipeline produced
+   them) back to back; it is only ever appended to
+2. crops.idx.jsonl has one line per archived image: request id, kind ("crop" or
+   "stitched"), position in the submission, SHA-256 content hash, offset and length
+3. An image whose hash is already in the archive isn't written again; its new
+   index line points at the stored bytes
+4. Reads map crops.pack with mmap and return memoryview slices of the mapping,
+   so scans copy nothing until an image is decoded (np.frombuffer over the slice
+   is zero-copy too), and bulk scans read the pack sequentially in offset order
+
+The index is the source of truth: bytes are appended before their index line, so
+after a crash the pack may hold bytes no entry refers to, never the reverse.
+Appends hold an exclusive lock on the index (where fcntl is available), so
+several processes can share an archive directory.
+
+A memoryview from an archive is only valid while the archive is open.
+
+Configuration:
+    OCR_CROP_ARCHIVE_DIR    Archive directory job results' images are added to (default: none)
+
+Usage:
+    python -m shared_code.crop_archive archive/                      # summary
+    python -m shared_code.crop_archive archive/ --extract out/ [--request ID ...]
+"""
+
+import base64
+import binascii
+import hashlib
+import json
+import logging
+import mmap
+import os
+import sys
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: one writing process per archive
+    fcntl = None
+
+CROP_ARCHIVE_DIR = os.environ.get("OCR_CROP_ARCHIVE_DIR", "")
+
+PACK_FILENAME = "crops.pack"
+INDEX_FILENAME = "crops.idx.jsonl"
+
+KIND_CROP = "crop"
+KIND_STITCHED = "stitched"
+
+_crop_archive: Optional["CropArchive"] = None
+_crop_archive_lock = threading.Lock()
+
+
+def _image_format(data: bytes) -> str:
+    if data[:2] == b"\xff\xd8":
+        return "jpg"
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return "png"
+    return "bin"
+
+
+def _decode_base64(image: str) -> Optional[bytes]:
+    # Same data URL handling as decode_base64_image
+    if ',' in image:
+        image = image.split(',')[1]
+    try:
+        return base64.b64decode(image, validate=True)
+    except (binascii.Error, ValueError):
+        return None
+
+
+class CropArchive:
+    """
+    Append-only pack of encoded images with an offset index
+
+    Entries are dictionaries with requestId, kind, position, hash, offset,
+    length, format and archivedAt.
+    """
+
+    def __init__(self, directory: str, writable: bool = False):
+        """
+        Open an archive, creating it if writable
+
+        Args:
+            directory: Archive directory
+            writable: Allow appends
+
+        Raises:
+            FileNotFoundError: If the archive doesn't exist and writable is False
+        """
+        self.directory = directory
+        self.writable = writable
+        self.pack_path = os.path.join(directory, PACK_FILENAME)
+        self.index_path = os.path.join(directory, INDEX_FILENAME)
+        self.entries: List[Dict[str, Any]] = []
+        self._by_hash: Dict[str, Dict[str, Any]] = {}
+        self._by_request: Dict[str, List[Dict[str, Any]]] = {}
+        self._index_read = 0
+        self._map: Optional[mmap.mmap] = None
+        self._lock = threading.Lock()
+
+        if writable:
+            os.makedirs(directory, exist_ok=True)
+            self._pack = open(self.pack_path, "ab")
+            self._index = open(self.index_path, "ab")
+        else:
+            if not os.path.exists(self.index_path):
+                raise FileNotFoundError(f"No crop archive in {directory}")
+            self._pack = None
+            self._index = None
+        self.refresh()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def refresh(self) -> int:
+        """
+        Load index lines added since the last refresh (by this or another process)
+
+        Returns:
+            Number of entries loaded
+        """
+        pack_size = os.path.getsize(self.pack_path) if os.path.exists(self.pack_path) else 0
+        with open(self.index_path, "rb") as f:
+            f.seek(self._index_read)
+            data = f.read()
+
+        # A line still being written has no newline yet; leave it for the next refresh
+        complete = data[:data.rfind(b"\n") + 1]
+        self._index_read += len(complete)
+
+        loaded = 0
+        for line in complete.splitlines():
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                logging.warning(f"Skipping unreadable index line in {self.index_path}")
+                continue
+            if entry["offset"] + entry["length"] > pack_size:
+                logging.warning(f"Skipping index entry past the end of {self.pack_path}")
+                continue
+            self._add_entry(entry)
+            loaded += 1
+        return loaded
+
+    def _add_entry(self, entry: Dict[str, Any]):
+        self.entries.append(entry)
+        self._by_hash.setdefault(entry["hash"], entry)
+        self._by_request.setdefault(entry["requestId"], []).append(entry)
+
+    def append(self, request_id: str, kind: str, position: int, data: bytes) -> Dict[str, Any]:
+        """
+        Archive one encoded image
+
+        Args:
+            request_id: Job, batch record or request the image belongs to
+            kind: KIND_CROP or KIND_STITCHED
+            position: Position of the image in the submission (0 for stitched images)
+            data: Encoded image bytes
+
+        Returns:
+            The new index entry
+        """
+        if not self.writable:
+            raise ValueError("Crop archive was opened read-only")
+
+        content_hash = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            if fcntl is not None:
+                fcntl.flock(self._index.fileno(), fcntl.LOCK_EX)
+            try:
+                # Pick up other processes' appends so their images aren't stored twice
+                self.refresh()
+                if os.fstat(self._index.fileno()).st_size > self._index_read:
+                    # A line cut short by a crash; end it so it can't swallow the next one
+                    self._index.write(b"\n")
+                    self._index.flush()
+                    self.refresh()
+                stored = self._by_hash.get(content_hash)
+                if stored is not None:
+                    offset = stored["offset"]
+                else:
+                    self._pack.seek(0, os.SEEK_END)
+                    offset = self._pack.tell()
+                    self._pack.write(data)
+                    self._pack.flush()
+
+                entry = {
+                    "requestId": request_id,
+                    "kind": kind,
+                    "position": position,
+                    "hash": content_hash,
+                    "offset": offset,
+                    "length": len(data),
+                    "format": _image_format(data),
+                    "archivedAt": round(time.time(), 3)
+                }
+                line = (json.dumps(entry, separators=(",", ":")) + "\n").encode("utf-8")
+                self._index.write(line)
+                self._index.flush()
+                self._index_read += len(line)
+                self._add_entry(entry)
+                return entry
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self._index.fileno(), fcntl.LOCK_UN)
+
+    def append_result(self, request_id: str, result: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Archive a pipeline result's processedImages and stitchedImage
+
+        Returns:
+            References ({kind, position, hash}) to the archived images, in the
+            order they appear in the result
+        """
+        images = [(KIND_CROP, position, image) for position, image in enumerate(result.get("processedImages") or [])]
+        if result.get("stitchedImage"):
+            images.append((KIND_STITCHED, 0, result["stitchedImage"]))
+
+        references = []
+        for kind, position, image in images:
+            data = _decode_base64(image) if isinstance(image, str) else None
+            if data is None:
+                logging.warning(f"Not archiving {kind} {position} of {request_id}: not base64 image data")
+                continue
+            entry = self.append(request_id, kind, position, data)
+            references.append({"kind": kind, "position": position, "hash": entry["hash"]})
+        return references
+
+    def _mapped(self, end: int) -> mmap.mmap:
+        # Map the pack again once it has grown past the current mapping. Slices of an
+        # older mapping stay valid; it is unmapped when the last of them is released.
+        if self._map is None or len(self._map) < end:
+            with open(self.pack_path, "rb") as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map
+
+    def read(self, entry: Dict[str, Any]) -> memoryview:
+        """Return an entry's encoded bytes as a zero-copy view of the mapped pack"""
+        end = entry["offset"] + entry["length"]
+        return memoryview(self._mapped(end))[entry["offset"]:end]
+
+    def get(self, content_hash: str) -> Optional[memoryview]:
+        """Return the encoded bytes with a given SHA-256 hash, or None if they aren't archived"""
+        entry = self._by_hash.get(content_hash)
+        return self.read(entry) if entry is not None else None
+
+    def decode(self, entry: Dict[str, Any]) -> Optional[np.ndarray]:
+        """Decode an entry's image straight from the mapped pack"""
+        return cv2.imdecode(np.frombuffer(self.read(entry), np.uint8), cv2.IMREAD_COLOR)
+
+    def request_entries(self, request_id: str) -> List[Dict[str, Any]]:
+        """Return a request's entries, crops by position followed by any stitched image"""
+        return sorted(self._by_request.get(request_id, []),
+                      key=lambda entry: (entry["kind"] == KIND_STITCHED, entry["position"]))
+
+    def request_images(self, request_id: str, kind: str = KIND_CROP) -> List[str]:
+        """Return a request's images as base64 strings, ready to resubmit to the pipeline"""
+        return [base64.b64encode(self.read(entry)).decode("ascii")
+                for entry in self.request_entries(request_id) if entry["kind"] == kind]
+
+    def scan(self, kind: Optional[str] = None,
+             request_ids: Optional[Iterable[str]] = None) -> Iterator[Tuple[Dict[str, Any], memoryview]]:
+        """
+        Yield (entry, encoded bytes) for every archived image, in pack order
+
+        Entries are visited by offset so the pack is read front to back; an image
+        stored once for several requests is yielded for each of them.
+
+        Args:
+            kind: Only yield KIND_CROP or KIND_STITCHED entries
+            request_ids: Only yield entries of these requests
+        """
+        wanted = set(request_ids) if request_ids is not None else None
+        entries = [
+            entry for entry in self.entries
+            if (kind is None or entry["kind"] == kind) and (wanted is None or entry["requestId"] in wanted)
+        ]
+        if not entries:
+            return
+        entries.sort(key=lambda entry: entry["offset"])
+
+        mapped = self._mapped(max(entry["offset"] + entry["length"] for entry in entries))
+        if hasattr(mmap, "MADV_SEQUENTIAL"):
+            mapped.madvise(mmap.MADV_SEQUENTIAL)
+        view = memoryview(mapped)
+        for entry in entries:
+            yield entry, view[entry["offset"]:entry["offset"] + entry["length"]]
+
+    def summary(self) -> Dict[str, Any]:
+        """Entry, request and unique image counts and the pack size"""
+        return {
+            "entries": len(self.entries),
+            "requests": len(self._by_request),
+            "uniqueImages": len(self._by_hash),
+            "crops": sum(1 for entry in self.entries if entry["kind"] == KIND_CROP),
+            "stitched": sum(1 for entry in self.entries if entry["kind"] == KIND_STITCHED),
+            "packBytes": os.path.getsize(self.pack_path) if os.path.exists(self.pack_path) else 0
+        }
+
+    def close(self):
+        """Close the archive; views already returned keep their mapping alive until released"""
+        self._map = None
+        for handle in (self._pack, self._index):
+            if handle is not None:
+                handle.close()
+        self._pack = self._index = None
+
+
+def get_crop_archive() -> Optional[CropArchive]:
+    """Return the process-wide writable archive in OCR_CROP_ARCHIVE_DIR, or None if it isn't set"""
+    global _crop_archive
+    if not CROP_ARCHIVE_DIR:
+        return None
+    with _crop_archive_lock:
+        if _crop_archive is None:
+            _crop_archive = CropArchive(CROP_ARCHIVE_DIR, writable=True)
+        return _crop_archive
+
+
+def extract(archive: CropArchive, output_dir: str, request_ids: Optional[List[str]] = None) -> int:
+    """
+    Write archived images to files named <request id>-<kind>-<position>.<format>
+
+    Returns:
+        Number of files written
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    written = 0
+    for entry, data in archive.scan(request_ids=request_ids):
+        safe_id = "".join(c if c.isalnum() or c in "-_." else "_" for c in entry["requestId"])
+        filename = f"{safe_id}-{entry['kind']}-{entry['position'] + 1}.{entry['format']}"
+        with open(os.path.join(output_dir, filename), "wb") as f:
+            f.write(data)
+        written += 1
+    return written
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    # argparse stays off the import path of the job workers that archive crops
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Inspect or extract a packed archive of processed images")
+    parser.add_argument("archive", help="Archive directory")
+    parser.add_argument("--extract", metavar="DIR", help="Write the archived images to DIR")
+    parser.add_argument("--request", nargs="+", metavar="ID", help="Only these request ids")
+    args = parser.parse_args(argv)
+
+    try:
+        archive = CropArchive(args.archive)
+    except FileNotFoundError as e:
+        print(e, file=sys.stderr)
+        return 1
+
+    with archive:
+        if args.extract:
+            written = extract(archive, args.extract, args.request)
+            print(json.dumps({"extracted": written, "directory": args.extract}, indent=2))
+        else:
+            print(json.dumps(archive.summary(), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,242 @@
+"""
+Process-Pool Frame Farm
+
+Runs the CPU-heavy per-image stages in worker processes, so preprocessing scales
+across cores even where Python-level loops (detection scoring, contour filtering)
+hold the GIL:
+1. The caller decodes each image once, straight into a multiprocessing.shared_memory
+   block; a worker receives only a FrameDescriptor (block name, shape, dtype) and
+   maps the same pages
+2. The worker runs monitor detection, cropping, enhancement and encoding on the
+   mapped frame and writes the crop into a new shared block, returning its
+   descriptor with the detection results
+3. The caller copies the crop out and unlinks both blocks; nothing frame-sized is
+   pickled in either direction
+4. At most one frame per worker is decoded ahead, so shared memory stays bounded
+   however many images a submission has
+5. If the pool breaks (a worker crashed or was killed), the image is processed
+   in-process instead
+
+Enable with the 'preprocessMode': 'processes' option, OCR_PREPROCESS_MODE (see
+image_processor.preprocess_mode), or image_processor's --processes in batch mode.
+This module is only imported once a run uses it, so multiprocessing stays off the
+cold-start path. Stages run in worker processes don't appear in pipeline_timings.
+
+Configuration:
+    OCR_FRAME_FARM_WORKERS      Worker processes (default: CPU count)
+"""
+
+import importlib
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+FRAME_FARM_WORKERS = int(os.environ.get("OCR_FRAME_FARM_WORKERS", "0")) or os.cpu_count() or 1
+
+_frame_farm: Optional[ProcessPoolExecutor] = None
+_frame_farm_workers = FRAME_FARM_WORKERS
+_frame_farm_lock = threading.Lock()
+
+
+class FrameDescriptor(NamedTuple):
+    """Locates a frame in shared memory; small enough to pickle with every task"""
+    name: str
+    shape: Tuple[int, ...]
+    dtype: str
+
+
+def share_frame(frame: np.ndarray) -> Tuple[shared_memory.SharedMemory, FrameDescriptor]:
+    """
+    Copy a frame into a new shared memory block
+
+    Returns:
+        Tuple of (the block, which the caller must close and eventually unlink, its descriptor)
+    """
+    block = shared_memory.SharedMemory(create=True, size=max(frame.nbytes, 1))
+    view = np.ndarray(frame.shape, dtype=frame.dtype, buffer=block.buf)
+    view[...] = frame
+    del view
+    return block, FrameDescriptor(block.name, tuple(frame.shape), frame.dtype.str)
+
+
+def frame_view(block: shared_memory.SharedMemory, descriptor: FrameDescriptor) -> np.ndarray:
+    """Return an array over a shared block; drop every view before closing the block"""
+    return np.ndarray(descriptor.shape, dtype=np.dtype(descriptor.dtype), buffer=block.buf)
+
+
+def take_frame(descriptor: FrameDescriptor) -> np.ndarray:
+    """Copy a frame out of its shared block and unlink the block"""
+    block = shared_memory.SharedMemory(name=descriptor.name)
+    try:
+        view = frame_view(block, descriptor)
+        frame = view.copy()
+        del view
+        return frame
+    finally:
+        block.close()
+        block.unlink()
+
+
+def frame_farm_workers() -> int:
+    """Return the size of the worker pool (what it will be, if it hasn't started yet)"""
+    return _frame_farm_workers
+
+
+def _warm_worker(quiet: bool):
+    if quiet:
+        sys.stdout = open(os.devnull, "w")
+    # Import the pipeline (OpenCV, NumPy, the detectors) once per worker, not on its first task
+    importlib.import_module("shared_code.image_processor")
+
+
+def get_frame_farm(workers: Optional[int] = None, quiet: bool = False) -> ProcessPoolExecutor:
+    """
+    Return the process-wide worker pool, creating it on first use
+
+    Workers are spawned rather than forked: the caller usually has threads running
+    (preprocessing, batch or OCR hedging pools) and forking those is unsafe.
+
+    Args:
+        workers: Pool size if the pool doesn't exist yet (default OCR_FRAME_FARM_WORKERS)
+        quiet: Discard what workers print (the pipeline's step messages)
+    """
+    global _frame_farm, _frame_farm_workers
+    with _frame_farm_lock:
+        if _frame_farm is None:
+            _frame_farm_workers = workers or _frame_farm_workers
+            _frame_farm = ProcessPoolExecutor(max_workers=_frame_farm_workers,
+                                              mp_context=multiprocessing.get_context("spawn"),
+                                              initializer=_warm_worker, initargs=(quiet,))
+        return _frame_farm
+
+
+def _reset_frame_farm(broken: ProcessPoolExecutor):
+    global _frame_farm
+    with _frame_farm_lock:
+        if _frame_farm is broken:
+            _frame_farm = None
+    broken.shutdown(wait=False)
+
+
+def preprocess_shared_frame(index: int, descriptor: FrameDescriptor, is_single_image: bool,
+                            enhance_readability: bool, debug_mode: bool
+                            ) -> Tuple[Dict[str, Any], Optional[FrameDescriptor]]:
+    """
+    Worker task: preprocess a frame held in shared memory
+
+    Returns:
+        Tuple of (preprocess_image's result without 'image', descriptor of the
+        processed crop in a new shared block or None). A None processedImage means
+        processing failed and the caller should keep the original image.
+    """
+    from shared_code.image_processor import preprocess_image
+
+    block = shared_memory.SharedMemory(name=descriptor.name)
+    try:
+        frame = frame_view(block, descriptor)
+        outcome = preprocess_image(index, None, is_single_image, enhance_readability, debug_mode, frame=frame)
+        crop = outcome.pop("image")
+        crop_descriptor = None
+        if crop is not None:
+            crop_block, crop_descriptor = share_frame(crop)
+            crop_block.close()
+        # The crop may be a view of the frame; both must go before the block closes
+        del frame, crop
+        return outcome, crop_descriptor
+    finally:
+        block.close()
+
+
+def iter_farmed_preprocessing(base64_images: List[str], is_single_image: bool, enhance_readability: bool,
+                              debug_mode: bool, max_pixels: int = 0) -> Iterator[Dict[str, Any]]:
+    """
+    Preprocess images on the frame farm, yielding preprocess_image results in input order
+
+    Args:
+        base64_images: Base64-encoded images
+        is_single_image: Apply conservative cropping if the monitor isn't found
+        enhance_readability: Apply contrast and sharpness enhancement
+        debug_mode: Print per-image details
+        max_pixels: Decode larger images at reduced scale (0 = full size)
+    """
+    from shared_code.image_processor import decode_base64_image, preprocess_image
+
+    farm = get_frame_farm()
+    queued = iter(enumerate(base64_images))
+    # (index, base64 image, shared block or None, future, finished outcome, or None to run in-process)
+    pending = deque()
+
+    def submit_next() -> bool:
+        for index, img_base64 in queued:
+            frame = decode_base64_image(img_base64, max_pixels)
+            if frame is None:
+                print(f"Warning: Could not decode image {index+1}")
+                pending.append((index, img_base64, None, {
+                    'monitorDetected': False, 'message': f"Image {index+1} could not be decoded",
+                    'processedImage': None, 'image': None}))
+                continue
+            block, descriptor = share_frame(frame)
+            del frame
+            try:
+                future = farm.submit(preprocess_shared_frame, index, descriptor, is_single_image,
+                                     enhance_readability, debug_mode)
+            except BrokenProcessPool:
+                block.close()
+                block.unlink()
+                pending.append((index, img_base64, None, None))
+                continue
+            pending.append((index, img_base64, block, future))
+            return True
+        return False
+
+    try:
+        while len(pending) < _frame_farm_workers and submit_next():
+            pass
+
+        while pending:
+            index, img_base64, block, work = pending.popleft()
+            if block is None:
+                yield work if work is not None else preprocess_image(
+                    index, img_base64, is_single_image, enhance_readability, debug_mode, max_pixels)
+                continue
+
+            try:
+                outcome, crop_descriptor = work.result()
+            except BrokenProcessPool as e:
+                logging.warning(f"Frame farm failed on image {index+1} ({e}), preprocessing in-process")
+                _reset_frame_farm(farm)
+                outcome = preprocess_image(index, img_base64, is_single_image, enhance_readability,
+                                           debug_mode, max_pixels)
+                crop_descriptor = None
+            finally:
+                block.close()
+                block.unlink()
+
+            if outcome['processedImage'] is None:
+                outcome['processedImage'] = img_base64
+            outcome['image'] = take_frame(crop_descriptor) if crop_descriptor else outcome.get('image')
+            submit_next()
+            yield outcome
+    finally:
+        # Release the frames of images never consumed
+        for _, _, block, work in pending:
+            if block is None:
+                continue
+            work.cancel()
+            try:
+                _, crop_descriptor = work.result()
+                if crop_descriptor:
+                    take_frame(crop_descriptor)
+            except Exception:
+                pass
+            block.close()
+            block.unlink()
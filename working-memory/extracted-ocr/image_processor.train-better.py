@@ -12,24 +12,48 @@ This module processes images of rowing machine monitors to:
 # Replace the try/except import block with:
 import cv2
 import numpy as np
-from PIL import Image, ImageEnhance
-from azure.ai.documentintelligence import DocumentIntelligenceClient
-from azure.core.credentials import AzureKeyCredential
+# PIL, the Azure SDK, requests, argparse and frame_farm (multiprocessing) are
+# imported where they're used: they aren't needed on every path, and loading
+# them here lengthens cold starts
 
 import base64
 import io
 import os
 import traceback
 import logging
-from typing import List, Dict, Any, Tuple, Optional
+from typing import List, Dict, Any, Iterator, Tuple, Optional
 import json
 import sys
-import argparse
-import requests
+import threading
 import time
+from collections import deque
+from contextvars import copy_context
+from concurrent.futures import ThreadPoolExecutor
+import random
 
-def decode_base64_image(base64_string):
-    """Decode a base64 string to image"""
+from shared_code.memory_tracker import (
+    decode_reduction_factor, image_dimensions, max_decode_pixels, memory_tracker_for
+)
+from shared_code.pipeline_timings import (
+    StageTimings, count, log_timings, timed, timed_call, timings_context, timings_enabled
+)
+
+# OpenCV decode flags for each reduction factor memory_tracker may choose
+_REDUCED_DECODE_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8
+}
+
+@timed_call('decode')
+def decode_base64_image(base64_string, max_pixels: int = 0):
+    """
+    Decode a base64 string to image
+    
+    Images larger than max_pixels (if given) are decoded at 1/2, 1/4 or 1/8 scale
+    so an oversized photo never exists at full resolution in memory.
+    """
     try:
         # Add validation for the base64 string
         if not base64_string or not isinstance(base64_string, str):
@@ -53,7 +77,17 @@ def decode_base64_image(base64_string):
             logging.error("Empty array after decoding base64 string")
             return None
             
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        decode_flags = cv2.IMREAD_COLOR
+        if max_pixels:
+            dimensions = image_dimensions(image_data)
+            if dimensions:
+                factor = decode_reduction_factor(dimensions[0], dimensions[1], max_pixels)
+                if factor > 1:
+                    logging.info(f"Decoding {dimensions[0]}x{dimensions[1]} image at 1/{factor} scale "
+                                 f"to stay within the memory budget")
+                    decode_flags = _REDUCED_DECODE_FLAGS[factor]
+        
+        image = cv2.imdecode(nparr, decode_flags)
         
         # Check if image was successfully decoded
         if image is None:
@@ -68,6 +102,7 @@ def decode_base64_image(base64_string):
         import traceback
         logging.error(traceback.format_exc())
         return None
+@timed_call('encode')
 def encode_base64_image(image: np.ndarray) -> str:
     """
     Convert a CV2 image to a base64 string
@@ -83,23 +118,27 @@ def encode_base64_image(image: np.ndarray) -> str:
     
     return img_base64
 
+@timed_call('enhance')
 def enhance_image_readability(image: np.ndarray) -> np.ndarray:
     """
     Enhance the readability of text in the image
     """
+    from PIL import Image, ImageEnhance
+    
     # Convert to PIL Image for easier enhancement
     pil_img = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
     
-    # Enhance contrast
-    enhancer = ImageEnhance.Contrast(pil_img)
-    enhanced = enhancer.enhance(1.5)
+    # Enhance contrast; each step's input is released as soon as it's consumed
+    enhanced = ImageEnhance.Contrast(pil_img).enhance(1.5)
+    del pil_img
     
     # Enhance sharpness
-    enhancer = ImageEnhance.Sharpness(enhanced)
-    enhanced = enhancer.enhance(1.5)
+    enhanced = ImageEnhance.Sharpness(enhanced).enhance(1.5)
     
-    # Convert back to OpenCV format
-    enhanced_cv = cv2.cvtColor(np.array(enhanced), cv2.COLOR_RGB2BGR)
+    # Convert back to OpenCV format, swapping channels in place
+    enhanced_cv = np.array(enhanced)
+    del enhanced
+    cv2.cvtColor(enhanced_cv, cv2.COLOR_RGB2BGR, dst=enhanced_cv)
     
     return enhanced_cv
 
@@ -129,6 +168,77 @@ def preprocess_for_table_detection(image: np.ndarray) -> np.ndarray:
         return image
 
 
+# How much of the Document Intelligence response to keep. Only documents[].fields
+# is read downstream; pages, words, lines, polygons and spans are dropped unless
+# the full response is requested.
+OCR_PROJECTION_FULL = "full"
+OCR_PROJECTION_FIELDS = "fields"
+OCR_PROJECTION_FIELDS_WITH_CONFIDENCE = "fieldsWithConfidence"
+DEFAULT_OCR_PROJECTION = os.environ.get("DEFAULT_OCR_PROJECTION", OCR_PROJECTION_FIELDS)
+
+# Field keys that never carry values we read
+_DROPPED_FIELD_KEYS = {"boundingRegions", "spans", "polygon", "boundingBox"}
+
+
+def project_field(field: Dict[str, Any], keep_confidence: bool) -> Dict[str, Any]:
+    """Project a document field (recursively through arrays and objects) down to its values"""
+    projected = {}
+    for key, value in field.items():
+        if key in _DROPPED_FIELD_KEYS:
+            continue
+        if key == "confidence" and not keep_confidence:
+            continue
+        if key == "valueString" and field.get("content") == value:
+            # Readers prefer content, so an identical valueString is redundant
+            continue
+        if key == "valueArray":
+            projected[key] = [project_field(item, keep_confidence) for item in value if isinstance(item, dict)]
+        elif key == "valueObject":
+            projected[key] = {name: project_field(col, keep_confidence)
+                              for name, col in value.items() if isinstance(col, dict)}
+        else:
+            projected[key] = value
+    return projected
+
+
+def project_analyze_response(response: Dict[str, Any], projection: str = DEFAULT_OCR_PROJECTION) -> Dict[str, Any]:
+    """
+    Reduce a Document Intelligence analyze response to the parts used downstream
+    
+    Args:
+        response: Response body containing "analyzeResult"
+        projection: "full" (unchanged), "fields" (documents[].fields values only) or
+                    "fieldsWithConfidence" (also keeps document and field confidence)
+        
+    Returns:
+        Projected response with the same analyzeResult.documents[].fields layout
+    """
+    if projection == OCR_PROJECTION_FULL or not isinstance(response, dict):
+        return response
+    
+    keep_confidence = projection == OCR_PROJECTION_FIELDS_WITH_CONFIDENCE
+    analyze_result = response.get("analyzeResult") or {}
+    
+    documents = []
+    for doc in analyze_result.get("documents") or []:
+        projected_doc = {"docType": doc.get("docType")}
+        if keep_confidence and "confidence" in doc:
+            projected_doc["confidence"] = doc["confidence"]
+        projected_doc["fields"] = {
+            name: project_field(field, keep_confidence)
+            for name, field in (doc.get("fields") or {}).items()
+            if isinstance(field, dict)
+        }
+        documents.append(projected_doc)
+    
+    projected = {key: response[key] for key in ("status", "createdDateTime", "lastUpdatedDateTime") if key in response}
+    projected["analyzeResult"] = {
+        key: analyze_result[key] for key in ("apiVersion", "modelId") if key in analyze_result
+    }
+    projected["analyzeResult"]["documents"] = documents
+    return projected
+
+
 def analyze_image_with_azure_model(base64_image: str, options: Dict[str, Any]) -> Dict:
     """
     Analyze an image using Azure Document Intelligence
@@ -150,6 +260,10 @@ def analyze_image_with_azure_model(base64_image: str, options: Dict[str, Any]) -
                 "error": error_msg
             }
             
+        # The SDK is only used on this path; the default path is analyze_image_with_direct_rest
+        from azure.ai.documentintelligence import DocumentIntelligenceClient
+        from azure.core.credentials import AzureKeyCredential
+        
         # Create Azure Document Intelligence client
         document_intelligence_client = DocumentIntelligenceClient(
             endpoint=endpoint,
@@ -188,8 +302,10 @@ def analyze_image_with_azure_model(base64_image: str, options: Dict[str, Any]) -
         # Convert result to a serializable dictionary - UPDATED APPROACH
         result_dict = {}
         
-        # Handle pages data
-        if hasattr(result, "pages"):
+        projection = options.get("ocrProjection", DEFAULT_OCR_PROJECTION)
+        
+        # Handle pages data (only kept for the full projection)
+        if projection == OCR_PROJECTION_FULL and hasattr(result, "pages"):
             result_dict["pages"] = []
             for page in result.pages:
                 page_dict = {
@@ -226,10 +342,9 @@ def analyze_image_with_azure_model(base64_image: str, options: Dict[str, Any]) -
                         field_type = field.type if hasattr(field, "type") else "unknown"
                         field_confidence = field.confidence if hasattr(field, "confidence") else 0.0
                         
-                        field_dict = {
-                            "type": field_type,
-                            "confidence": field_confidence
-                        }
+                        field_dict = {"type": field_type}
+                        if projection != OCR_PROJECTION_FIELDS:
+                            field_dict["confidence"] = field_confidence
                         
                         # Extract content safely
                         field_value = extract_field_value(field)
@@ -273,6 +388,98 @@ def analyze_image_with_azure_model(base64_image: str, options: Dict[str, Any]) -
         }
 
 
+# Status codes from Document Intelligence that are worth retrying: throttling and transient server errors
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+DEFAULT_OCR_MAX_RETRIES = int(os.environ.get("OCR_MAX_RETRIES", "3"))
+DEFAULT_OCR_BACKOFF_SECONDS = float(os.environ.get("OCR_BACKOFF_SECONDS", "1.0"))
+MAX_OCR_BACKOFF_SECONDS = 30.0
+
+# Connections kept open to the Document Intelligence endpoint, shared by all requests
+OCR_HTTP_POOL_SIZE = int(os.environ.get("OCR_HTTP_POOL_SIZE", "16"))
+
+_ocr_session = None
+_ocr_session_lock = threading.Lock()
+
+
+def get_ocr_session():
+    """
+    Return the shared requests.Session used for OCR calls
+    
+    Reusing one session keeps TLS connections to the endpoint alive between
+    requests (and between the submit and poll calls of one request), so only the
+    first call on an instance pays for the handshake.
+    """
+    global _ocr_session
+    if _ocr_session is None:
+        with _ocr_session_lock:
+            if _ocr_session is None:
+                import requests
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=OCR_HTTP_POOL_SIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _ocr_session = session
+    return _ocr_session
+
+
+def get_retry_delay(response, attempt: int, base_delay: float) -> float:
+    """
+    Work out how long to wait before retrying a throttled or failed OCR request.
+    
+    Honors the Retry-After header when the service sends one, otherwise uses
+    exponential backoff with full jitter so concurrent workers don't retry in lockstep.
+    """
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), MAX_OCR_BACKOFF_SECONDS)
+        except (TypeError, ValueError):
+            pass
+    
+    return random.uniform(0, min(base_delay * (2 ** attempt), MAX_OCR_BACKOFF_SECONDS))
+
+
+def send_ocr_request(method: str, url: str, options: Dict[str, Any], rate_limited: bool = False, **kwargs):
+    """
+    Send an HTTP request to Document Intelligence, retrying 429/5xx responses with backoff
+    
+    Args:
+        method: HTTP method ("POST" to submit, "GET" to poll)
+        url: Request URL
+        options: Processing options. Recognized keys:
+            - rateLimiter: object with an acquire() method (e.g. ocr_dispatcher.TokenBucket),
+              consulted before every rate-limited attempt
+            - maxRetries: number of retries for retryable status codes
+            - backoffSeconds: base delay for exponential backoff
+        rate_limited: Whether this request counts against the TPS quota
+        **kwargs: Passed through to requests.Session.request
+        
+    Returns:
+        The last requests.Response received
+    """
+    session = get_ocr_session()
+    rate_limiter = options.get("rateLimiter")
+    max_retries = options.get("maxRetries", DEFAULT_OCR_MAX_RETRIES)
+    base_delay = options.get("backoffSeconds", DEFAULT_OCR_BACKOFF_SECONDS)
+    
+    attempt = 0
+    while True:
+        if rate_limited and rate_limiter is not None:
+            rate_limiter.acquire()
+        
+        response = session.request(method, url, **kwargs)
+        
+        if response.status_code not in RETRYABLE_STATUS_CODES or attempt >= max_retries:
+            return response
+        
+        delay = get_retry_delay(response, attempt, base_delay)
+        count('ocr.retries')
+        logging.warning(f"OCR {method} returned {response.status_code}, retrying in {delay:.1f}s "
+                        f"(attempt {attempt + 1}/{max_retries})")
+        time.sleep(delay)
+        attempt += 1
+
+
 def analyze_image_with_direct_rest(base64_image: str, options: Dict[str, Any]) -> Dict:
     """
     Analyze an image using direct REST API calls to Azure Document Intelligence
@@ -296,6 +503,7 @@ def analyze_image_with_direct_rest(base64_image: str, options: Dict[str, Any]) -
         
         # Decode base64 to bytes
         image_bytes = base64.b64decode(base64_image)
+        count('ocr.bytesUploaded', len(image_bytes))
         
         # CORRECTED URL - Match the working URL from OcrService.ts
         analyze_url = f"{endpoint}/documentintelligence/documentModels/{model_id}:analyze?api-version={api_version}"
@@ -311,19 +519,25 @@ def analyze_image_with_direct_rest(base64_image: str, options: Dict[str, Any]) -
         }
         
         # First API call - Submit document for analysis
-        import requests
-        response = requests.post(
-            analyze_url,
-            headers=headers,
-            data=image_bytes,
-            params={"includeFieldElements": "true"}
-        )
+        # Submissions count against the resource's TPS quota, so they go through
+        # the optional rate limiter and are retried on 429/5xx
+        with timed('ocr.submit'):
+            response = send_ocr_request(
+                "POST",
+                analyze_url,
+                options,
+                rate_limited=True,
+                headers=headers,
+                data=image_bytes,
+                params={"includeFieldElements": "true"}
+            )
         
         
         if response.status_code != 202:  # 202 Accepted is expected
             return {
                 "success": False,
-                "error": f"Failed to start analysis: {response.status_code} {response.text}"
+                "error": f"Failed to start analysis: {response.status_code} {response.text}",
+                "statusCode": response.status_code
             }
         
         # Get operation location for polling
@@ -338,35 +552,51 @@ def analyze_image_with_direct_rest(base64_image: str, options: Dict[str, Any]) -
         
         # Poll for completion
         headers = {"Ocp-Apim-Subscription-Key": key}
-        max_retries = 20
-        wait_seconds = 3
-        
-        for i in range(max_retries):
-            #logging.info(f"Polling attempt {i+1}/{max_retries}")
-            time.sleep(wait_seconds)
-            
-            poll_response = requests.get(operation_location, headers=headers)
-            poll_result = poll_response.json()
-            
-            status = poll_result.get("status")
-            if status == "succeeded":
-                logging.info("Analysis completed successfully")
-                return {
-                    "success": True,
-                    "results": poll_result
-                }
-            elif status == "failed":
-                error_message = poll_result.get("error", {}).get("message", "Unknown error")
-                return {
-                    "success": False,
-                    "error": f"Analysis failed: {error_message}"
-                }
+        max_retries = options.get("maxPollAttempts", 20)
+        wait_seconds = options.get("pollIntervalSeconds", 3)
+        # Set by a hedged request when the other attempt has already won
+        cancel_event = options.get("cancelEvent")
+        
+        with timed('ocr.polling'):
+            for i in range(max_retries):
+                #logging.info(f"Polling attempt {i+1}/{max_retries}")
+                if cancel_event is not None:
+                    if cancel_event.wait(wait_seconds):
+                        return {"success": False, "error": "Analysis cancelled", "cancelled": True}
+                else:
+                    time.sleep(wait_seconds)
+                
+                count('ocr.pollAttempts')
+                poll_response = send_ocr_request("GET", operation_location, options, headers=headers)
+                if poll_response.status_code != 200:
+                    return {
+                        "success": False,
+                        "error": f"Failed to poll analysis: {poll_response.status_code} {poll_response.text}",
+                        "statusCode": poll_response.status_code
+                    }
+                poll_result = poll_response.json()
+                
+                status = poll_result.get("status")
+                if status == "succeeded":
+                    logging.info("Analysis completed successfully")
+                    # Project as soon as the response arrives so the full payload can be freed
+                    return {
+                        "success": True,
+                        "results": project_analyze_response(poll_result, options.get("ocrProjection", DEFAULT_OCR_PROJECTION))
+                    }
+                elif status == "failed":
+                    error_message = poll_result.get("error", {}).get("message", "Unknown error")
+                    return {
+                        "success": False,
+                        "error": f"Analysis failed: {error_message}"
+                    }
+                    
+                #logging.info(f"Status: {status}, waiting {wait_seconds} seconds...")
                 
-            #logging.info(f"Status: {status}, waiting {wait_seconds} seconds...")
-            
         return {
             "success": False,
-            "error": f"Analysis timed out after {max_retries} polling attempts"
+            "error": f"Analysis timed out after {max_retries} polling attempts",
+            "timedOut": True
         }
         
     except Exception as e:
@@ -381,6 +611,75 @@ def analyze_image_with_direct_rest(base64_image: str, options: Dict[str, Any]) -
         }
 
 
+def local_ocr_enabled(options: Dict[str, Any]) -> bool:
+    """True if the on-device digit recognizer should be tried for this request"""
+    from shared_code import pm_digit_recognizer
+    return bool(options.get('localOcr', pm_digit_recognizer.LOCAL_OCR_ENABLED))
+
+
+def read_partial_result(image: np.ndarray, image_number: int, options: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Read one processed image with the local digit recognizer for an early partial result
+    
+    Returns:
+        A 'partial' event with the parsed data, or None if the image couldn't be read
+        confidently. Errors are logged and never interrupt processing.
+    """
+    from shared_code import pm_digit_recognizer
+    
+    try:
+        local_result = pm_digit_recognizer.recognize_monitor_screen(image)
+        min_confidence = options.get('localOcrMinConfidence', pm_digit_recognizer.LOCAL_OCR_MIN_CONFIDENCE)
+        if not local_result.get('success') or local_result['confidence'] < min_confidence:
+            return None
+        
+        parsed = parse_ocr_results(local_result)
+        if not parsed.get('success'):
+            return None
+        
+        data = format_parsed_tables(parsed.get('data', {}), options.get('tableFormat', DEFAULT_TABLE_FORMAT))
+        report_progress(options, 'partial', image=image_number, parsedData=data)
+        return {
+            'event': 'partial',
+            'image': image_number,
+            'source': 'local',
+            'confidence': local_result['confidence'],
+            'parsedData': data
+        }
+    except Exception as e:
+        logging.warning(f"Partial result for image {image_number} failed: {e}")
+        return None
+
+
+def run_ocr(base64_image: str, options: Dict[str, Any]) -> Dict:
+    """
+    Run OCR on a processed image using the configured analysis path
+    
+    Requests go straight to analyze_image_with_direct_rest unless hedging or the
+    circuit breaker is enabled, in which case they go through ocr_resilience.
+    When local OCR is enabled, the on-device digit recognizer is tried first and
+    the cloud model is only called for screens it can't read confidently.
+    """
+    from shared_code.ocr_resilience import resilience_enabled, analyze_with_resilience
+    from shared_code import pm_digit_recognizer
+    
+    if local_ocr_enabled(options):
+        screen = decode_base64_image(base64_image)
+        if screen is not None:
+            with timed('ocr.local'):
+                local_result = pm_digit_recognizer.recognize_monitor_screen(screen)
+            min_confidence = options.get('localOcrMinConfidence', pm_digit_recognizer.LOCAL_OCR_MIN_CONFIDENCE)
+            if local_result.get('success') and local_result['confidence'] >= min_confidence:
+                logging.info(f"Local OCR read screen with confidence {local_result['confidence']:.2f}")
+                return local_result
+            logging.info(f"Local OCR confidence {local_result.get('confidence', 0):.2f} too low, using cloud model")
+    
+    if resilience_enabled(options):
+        return analyze_with_resilience(base64_image, options)
+    
+    return analyze_image_with_direct_rest(base64_image, options)
+
+
 def perform_ocr(base64_image: str) -> Dict:
     """
     Perform OCR analysis using Azure Document Intelligence
@@ -437,9 +736,9 @@ def extract_array_values(ocr_results: Dict, field_name: str) -> List[Dict]:
     Extract array values from OCR results, handling both simple arrays and nested objects.
     
     This function:
-    1. Navigates the correct OCR results structure
+    1. Reads the field from the shared OcrResultView index
     2. Extracts values from arrays with proper structure handling
-    3. Replaces \u00a5 with 'r' character in all text values
+    3. Replaces \u00a5 with 'r' character in all text values (without modifying ocr_results)
     4. Returns structured data from arrays
     
     Args:
@@ -452,46 +751,20 @@ def extract_array_values(ocr_results: Dict, field_name: str) -> List[Dict]:
     values = []
     
     try:
-        # Navigate to the correct structure in OCR results
-        if "results" in ocr_results and "analyzeResult" in ocr_results["results"]:
-            analyze_result = ocr_results["results"]["analyzeResult"]
-            
-            if "documents" in analyze_result:
-                for doc in analyze_result["documents"]:
-                    if "fields" in doc and field_name in doc["fields"]:
-                        field_data = doc["fields"][field_name]
-                        
-                        # Handle array values
-                        if "valueArray" in field_data:
-                            for item in field_data["valueArray"]:
-                                # Case 1: Item has direct content
-                                if "content" in item:
-                                    # Replace \u00a5 with 'r'
-                                    cleaned_content = item["content"].replace('\u00a5', 'r')
-                                    values.append(cleaned_content)
-                                
-                                # Case 2: Item has nested valueObject (for tables)
-                                elif "valueObject" in item:
-                                    row_data = {}
-                                    for col_name, col_data in item["valueObject"].items():
-                                        if isinstance(col_data, dict):
-                                            if "content" in col_data:
-                                                # Replace \u00a5 with 'r'
-                                                col_data["content"] = col_data["content"].replace('\u00a5', 'r')
-                                                row_data[col_name] = col_data["content"]
-                                            elif "valueString" in col_data:
-                                                # Replace \u00a5 with 'r'
-                                                col_data["valueString"] = col_data["valueString"].replace('\u00a5', 'r')
-                                                row_data[col_name] = col_data["valueString"]
-                                    
-                                    if row_data:  # Only add non-empty rows
-                                        values.append(row_data)
-                        
-                        # Handle single value (non-array)
-                        elif "content" in field_data:
-                            # Replace \u00a5 with 'r'
-                            cleaned_content = field_data["content"].replace('\u00a5', 'r')
-                            values.append(cleaned_content)
+        view = OcrResultView.of(ocr_results)
+        
+        if field_name in view.arrays:
+            for content, columns in view.arrays[field_name].items:
+                # Case 1: Item has direct content
+                if content is not None:
+                    values.append(content)
+                # Case 2: Item has nested valueObject (for tables) - only non-empty rows
+                elif columns:
+                    values.append(dict(columns))
+        
+        # Handle single value (non-array)
+        elif field_name in view.scalars:
+            values.append(view.scalars[field_name])
     except Exception as e:
         logging.error(f"Error extracting array values for {field_name}: {e}")
                 
@@ -528,36 +801,187 @@ def extract_fields_with_data(ocr_results: Dict) -> Dict:
     fields_with_data = {}
     
     try:
-        if "results" in ocr_results and "analyzeResult" in ocr_results["results"]:
-            analyze_result = ocr_results["results"]["analyzeResult"]
-            
-            if "documents" in analyze_result and analyze_result["documents"]:
-                for doc in analyze_result["documents"]:
-                    if "fields" in doc:
-                        for field_name, field_data in doc["fields"].items():
-                            # Check if field_data is a dictionary before using get()
-                            if isinstance(field_data, dict):
-                                if field_data.get("type") == "string":
-                                    if "content" in field_data:
-                                        # Replace \u00a5 with 'r'
-                                        value = field_data["content"].replace('\u00a5', 'r')
-                                        fields_with_data[field_name] = value
-                                elif field_data.get("type") == "array":
-                                    if "valueArray" in field_data:
-                                        fields_with_data[field_name] = field_data
-                            # If field_data is a string, add it directly
-                            elif isinstance(field_data, str):
-                                # Replace \u00a5 with 'r'
-                                value = field_data.replace('\u00a5', 'r')
-                                fields_with_data[field_name] = value
+        view = OcrResultView.of(ocr_results)
+        
+        for field_name, field_type in view.field_types.items():
+            if field_type == "string" and field_name in view.scalars:
+                fields_with_data[field_name] = view.scalars[field_name]
+            elif field_type == "array" and field_name in view.arrays:
+                fields_with_data[field_name] = dict(view.raw_fields[field_name])
         
         return fields_with_data
     except Exception as e:
         logging.error(f"Error extracting fields with data: {e}")
         return {}
 
+from shared_code.ocr_view import OcrResultView
+from shared_code.table_format import DEFAULT_TABLE_FORMAT, format_parsed_tables
 from shared_code.workout_parser import parse_ocr_results
 
+def report_progress(options: Dict[str, Any], stage: str, **details):
+    """
+    Report pipeline progress to the optional progressCallback in options
+    
+    The callback receives the stage name and a dictionary of stage details.
+    Callback errors are logged and never interrupt processing.
+    """
+    callback = options.get('progressCallback')
+    if callback is None:
+        return
+    
+    try:
+        callback(stage, details)
+    except Exception as e:
+        logging.warning(f"Progress callback failed for stage {stage}: {e}")
+
+
+# Threads preprocessing the images of a submission; OpenCV and NumPy release the GIL
+PREPROCESS_WORKERS = int(os.environ.get("OCR_PREPROCESS_WORKERS", "0")) or min(4, os.cpu_count() or 1)
+
+# "threads" (the pool above) or "processes" (frame_farm's worker processes)
+PREPROCESS_MODE = os.environ.get("OCR_PREPROCESS_MODE", "threads").lower()
+
+_preprocess_executor = None
+_preprocess_executor_lock = threading.Lock()
+
+
+def get_preprocess_executor() -> ThreadPoolExecutor:
+    """Return the shared, bounded thread pool used for per-image preprocessing"""
+    global _preprocess_executor
+    if _preprocess_executor is None:
+        with _preprocess_executor_lock:
+            if _preprocess_executor is None:
+                _preprocess_executor = ThreadPoolExecutor(max_workers=PREPROCESS_WORKERS,
+                                                          thread_name_prefix="ocr-preprocess")
+    return _preprocess_executor
+
+
+def preprocess_mode(options: Dict[str, Any]) -> str:
+    """Return "processes" or "threads" from options['preprocessMode'] or OCR_PREPROCESS_MODE"""
+    return str(options.get('preprocessMode', PREPROCESS_MODE)).lower()
+
+
+def preprocess_image(index: int, img_base64: str, is_single_image: bool,
+                     enhance_readability: bool, debug_mode: bool, max_pixels: int = 0,
+                     frame: Optional[np.ndarray] = None) -> Dict[str, Any]:
+    """
+    Decode, detect, crop, enhance and re-encode one submitted image
+    
+    Args:
+        index: Zero-based position of the image in the submission
+        img_base64: Base64-encoded image
+        is_single_image: Apply conservative cropping if the monitor isn't found
+        enhance_readability: Apply contrast and sharpness enhancement
+        debug_mode: Print per-image details
+        max_pixels: Decode larger images at reduced scale (0 = full size)
+        frame: Already decoded image to process instead of decoding img_base64
+    
+    Returns:
+        Dictionary with:
+        - monitorDetected: whether the monitor screen was found
+        - message: detection message for this image
+        - processedImage: base64 result (the original image if processing failed,
+          None if it couldn't be decoded)
+        - image: the processed image array, or None
+    """
+    try:
+        # Decode base64 image
+        cv_image = frame if frame is not None else decode_base64_image(img_base64, max_pixels)
+        frame = None
+        if cv_image is None:
+            print(f"Warning: Could not decode image {index+1}")
+            return {'monitorDetected': False, 'message': f"Image {index+1} could not be decoded",
+                    'processedImage': None, 'image': None}
+        
+        # Detect and crop to monitor screen - get success status and message
+        cropped_img, monitor_detected, message = detect_and_crop_monitor_screen(cv_image)
+        detection_message = message
+        
+        if not monitor_detected:
+            print(f"Warning: {message}")
+            
+            # For single images with failed detection, apply conservative cropping
+            if is_single_image:
+                print("Single image - applying conservative cropping")
+                h, w = cv_image.shape[:2]
+                # Crop 10% from each edge
+                crop_margin = 0.1
+                x_start = int(w * crop_margin)
+                y_start = int(h * crop_margin)
+                x_end = int(w * (1 - crop_margin))
+                y_end = int(h * (1 - crop_margin))
+                cropped_img = cv_image[y_start:y_end, x_start:x_end]
+                detection_message = "Monitor detection failed, applied conservative cropping"
+        
+        # The full frame is freed once nothing views it (enhancement makes a copy)
+        del cv_image
+        
+        # Enhance image readability if requested
+        if enhance_readability:
+            cropped_img = enhance_image_readability(cropped_img)
+        
+        # Convert back to base64
+        processed_base64 = encode_base64_image(cropped_img)
+        
+        if debug_mode:
+            print(f"Image {index+1} processing: {message}")
+        
+        return {'monitorDetected': monitor_detected, 'message': detection_message,
+                'processedImage': processed_base64, 'image': cropped_img}
+    
+    except Exception as e:
+        print(f"Error processing image {index+1}: {e}")
+        # If processing fails, add original image
+        return {'monitorDetected': False, 'message': f"Error processing image {index+1}: {str(e)}",
+                'processedImage': img_base64, 'image': None}
+
+
+def iter_preprocessed_images(base64_images: List[str], is_single_image: bool, enhance_readability: bool,
+                             debug_mode: bool, options: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """
+    Preprocess a submission's images, yielding preprocess_image results in input order
+    
+    Multi-image submissions are spread over the shared preprocessing pool unless
+    options['parallelPreprocessing'] is False, so the wall-clock time approaches
+    that of the slowest image.
+    
+    With options['preprocessMode'] (or OCR_PREPROCESS_MODE) set to "processes",
+    images are preprocessed on the frame_farm worker processes instead.
+    
+    The memory budget is split between the images decoded at the same time, and
+    each result is released as soon as it has been yielded.
+    """
+    if preprocess_mode(options) == 'processes':
+        from shared_code.frame_farm import frame_farm_workers, iter_farmed_preprocessing
+        
+        max_pixels = max_decode_pixels(min(frame_farm_workers(), len(base64_images)))
+        yield from iter_farmed_preprocessing(base64_images, is_single_image, enhance_readability,
+                                             debug_mode, max_pixels)
+        return
+    
+    if is_single_image or not options.get('parallelPreprocessing', True) or PREPROCESS_WORKERS <= 1:
+        max_pixels = max_decode_pixels(1)
+        for i, img_base64 in enumerate(base64_images):
+            yield preprocess_image(i, img_base64, is_single_image, enhance_readability, debug_mode, max_pixels)
+        return
+    
+    max_pixels = max_decode_pixels(min(PREPROCESS_WORKERS, len(base64_images)))
+    executor = get_preprocess_executor()
+    pending = deque(
+        # Each image runs in a copy of this context so its stages are timed
+        executor.submit(copy_context().run, preprocess_image, i, img_base64, is_single_image,
+                        enhance_readability, debug_mode, max_pixels)
+        for i, img_base64 in enumerate(base64_images)
+    )
+    try:
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        # Stop queued work if the consumer gives up early
+        for future in pending:
+            future.cancel()
+
+
 def process_erg_images(base64_images: List[str], options: Dict[str, Any] = None) -> Dict[str, Any]:
     """
     Process erg monitor images with optional OCR analysis
@@ -571,10 +995,76 @@ def process_erg_images(base64_images: List[str], options: Dict[str, Any] = None)
     Single images are processed more leniently - they will be enhanced and 
     conservatively cropped even if monitor detection fails.
     Multi-image submissions require successful monitor detection.
+    
+    This runs iter_process_erg_images to completion and returns its final result.
     """
+    result = None
+    for event in iter_process_erg_images(base64_images, options):
+        if event['event'] == 'result':
+            result = event['result']
+    return result
+
+
+def iter_process_erg_images(base64_images: List[str], options: Dict[str, Any] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Process erg monitor images, yielding events as each image and stage completes
+    
+    Events are dictionaries with an 'event' key:
+    - detection:     an image was decoded, cropped and enhanced
+                     (image, totalImages, monitorDetected, message, processedImage)
+    - partial:       the local digit recognizer read an image's crop before the
+                     whole submission finished (image, source, confidence, parsedData)
+    - stitched:      the processed images were stitched (totalImages, success)
+    - ocr_started:   the OCR request for the final image was sent
+    - ocr_complete:  OCR finished (success, source)
+    - result:        the final result, exactly what process_erg_images returns;
+                     always the last event
+    
+    Partial results are produced when local OCR is enabled ('localOcr' option or
+    LOCAL_OCR_ENABLED) and can be turned off with 'partialResults': False.
+    Stage progress is also reported to options['progressCallback'].
+    
+    With 'memoryProfile' (or OCR_MEMORY_TRACKING), the result includes a 'memory'
+    key with per-stage peak memory (see memory_tracker.MemoryTracker). With
+    'timings' (or OCR_TIMINGS_ENABLED), it includes a 'timings' key with per-stage
+    durations and counters (see pipeline_timings.StageTimings), plus the instance's
+    hedging and circuit breaker metrics when either is enabled.
+    """
+    from shared_code.ocr_resilience import get_resilience_metrics, resilience_enabled
+    
     if options is None:
         options = {}
     
+    memory = memory_tracker_for(options)
+    timings = StageTimings() if timings_enabled(options) else None
+    # Each step of the stages runs in a context with the collector bound
+    context = timings_context(timings) if timings is not None else copy_context()
+    stages = _iter_erg_image_stages(base64_images, options, memory)
+    try:
+        while True:
+            event = context.run(next, stages, None)
+            if event is None:
+                break
+            if event['event'] == 'result' and isinstance(event.get('result'), dict):
+                if memory.enabled:
+                    report = memory.report()
+                    logging.info(f"Memory by stage: {report}")
+                    event['result']['memory'] = report
+                if timings is not None:
+                    report = timings.report()
+                    if resilience_enabled(options):
+                        report['ocrResilience'] = get_resilience_metrics()
+                    log_timings(report, images=len(base64_images),
+                                success=event['result'].get('success'))
+                    event['result']['timings'] = report
+            yield event
+    finally:
+        context.run(stages.close)
+        memory.close()
+
+
+def _iter_erg_image_stages(base64_images: List[str], options: Dict[str, Any], memory) -> Iterator[Dict[str, Any]]:
+    # The stages of iter_process_erg_images, each timed and wrapped in a memory tracker stage
     debug_mode = options.get('debug', False)
     perform_ocr = options.get('ocr', True)
     enhance_readability = options.get('enhanceReadability', True)
@@ -583,6 +1073,10 @@ def process_erg_images(base64_images: List[str], options: Dict[str, Any] = None)
     # Track if we're processing a single image for more lenient handling
     is_single_image = len(base64_images) == 1
     
+    # A single image's partial result would just repeat the final one
+    partial_results = (options.get('partialResults', True) and not is_single_image
+                       and local_ocr_enabled(options))
+    
     try:
         # Step 1: Preprocess images
         print(f"Step 1: Processing {len(base64_images)} image(s)")
@@ -593,57 +1087,32 @@ def process_erg_images(base64_images: List[str], options: Dict[str, Any] = None)
         all_monitors_detected = True
         detection_messages = []
         
-        for i, img_base64 in enumerate(base64_images):
-            try:
-                # Decode base64 image
-                cv_image = decode_base64_image(img_base64)
-                if cv_image is None:
-                    print(f"Warning: Could not decode image {i+1}")
-                    detection_results.append(False)
-                    detection_messages.append(f"Image {i+1} could not be decoded")
+        with memory.stage('preprocessing'), timed('preprocessing'):
+            # Images are preprocessed in parallel; results are consumed in submission
+            # order so events, messages and processed images keep the input order
+            for i, outcome in enumerate(iter_preprocessed_images(base64_images, is_single_image,
+                                                                 enhance_readability, debug_mode, options)):
+                report_progress(options, 'preprocessing', image=i + 1, totalImages=len(base64_images))
+                detection_results.append(outcome['monitorDetected'])
+                detection_messages.append(outcome['message'])
+                if not outcome['monitorDetected']:
                     all_monitors_detected = False
-                    continue
-                
-                # Detect and crop to monitor screen - get success status and message
-                cropped_img, monitor_detected, message = detect_and_crop_monitor_screen(cv_image)
-                detection_results.append(monitor_detected)
-                detection_messages.append(message)
+                if outcome['processedImage'] is not None:
+                    processed_images.append(outcome['processedImage'])
                 
-                if not monitor_detected:
-                    print(f"Warning: {message}")
-                    all_monitors_detected = False
-                    
-                    # For single images with failed detection, apply conservative cropping
-                    if is_single_image:
-                        print("Single image - applying conservative cropping")
-                        h, w = cv_image.shape[:2]
-                        # Crop 10% from each edge
-                        crop_margin = 0.1
-                        x_start = int(w * crop_margin)
-                        y_start = int(h * crop_margin)
-                        x_end = int(w * (1 - crop_margin))
-                        y_end = int(h * (1 - crop_margin))
-                        cropped_img = cv_image[y_start:y_end, x_start:x_end]
-                        detection_messages[i] = "Monitor detection failed, applied conservative cropping"
+                yield {'event': 'detection', 'image': i + 1, 'totalImages': len(base64_images),
+                       'monitorDetected': outcome['monitorDetected'], 'message': outcome['message'],
+                       'processedImage': outcome['processedImage']}
                 
-                # Enhance image readability if requested
-                if enhance_readability:
-                    cropped_img = enhance_image_readability(cropped_img)
-                    
-                # Convert back to base64
-                processed_base64 = encode_base64_image(cropped_img)
-                processed_images.append(processed_base64)
-                
-                if debug_mode:
-                    print(f"Image {i+1} processing: {message}")
-                    
-            except Exception as e:
-                print(f"Error processing image {i+1}: {e}")
-                detection_results.append(False)
-                detection_messages.append(f"Error processing image {i+1}: {str(e)}")
-                all_monitors_detected = False
-                # If processing fails, add original image
-                processed_images.append(img_base64)
+                # Read the crop locally so clients can show rows before the submission finishes
+                if partial_results and outcome['image'] is not None:
+                    with timed('partialRead'):
+                        partial_event = read_partial_result(outcome['image'], i + 1, options)
+                    if partial_event:
+                        yield partial_event
+            
+            # Release the last crop before stitching
+            outcome = None
         
         # Create processing result with monitor detection status
         processing_result = {
@@ -671,31 +1140,38 @@ def process_erg_images(base64_images: List[str], options: Dict[str, Any] = None)
                 if not options.get('requireMonitorDetection', True):
                     print("Continuing processing multi-image despite monitor detection failure")
                 else:
-                    return processing_result
+                    yield {'event': 'result', 'result': processing_result}
+                    return
         
         # Step 2: Stitch images if requested and if multiple images
         stitched_image = None
         if stitch_images and len(processed_images) > 1:
             print(f"Stitching {len(processed_images)} images")
+            report_progress(options, 'stitching', totalImages=len(processed_images))
             try:
-                # Convert processed base64 images to CV2 format for stitching
-                cv_images = [decode_base64_image(img) for img in processed_images]
-                
-                # Stitch images vertically
-                stitched = stitch_images_vertically(cv_images)
-                
-                # Convert stitched image back to base64
-                stitched_image = encode_base64_image(stitched)
-                processing_result['stitchedImage'] = stitched_image
+                with memory.stage('stitching'), timed('stitching'):
+                    # Convert processed base64 images to CV2 format for stitching
+                    cv_images = [decode_base64_image(img) for img in processed_images]
+                    
+                    # Stitch images vertically, then free the crops before encoding
+                    stitched = stitch_images_vertically(cv_images)
+                    del cv_images
+                    
+                    # Convert stitched image back to base64
+                    stitched_image = encode_base64_image(stitched)
+                    del stitched
+                    processing_result['stitchedImage'] = stitched_image
                 
                 if debug_mode:
                     print("Successfully stitched images")
             except Exception as e:
                 print(f"Error stitching images: {e}")
+            yield {'event': 'stitched', 'totalImages': len(processed_images), 'success': stitched_image is not None}
         
         # If no OCR requested, return processed images only
         if not perform_ocr:
-            return processing_result
+            yield {'event': 'result', 'result': processing_result}
+            return
             
         # Get the best image for OCR (stitched image if available, otherwise first processed image)
         ocr_image = processing_result.get('stitchedImage')
@@ -707,27 +1183,39 @@ def process_erg_images(base64_images: List[str], options: Dict[str, Any] = None)
             print(error)
             processing_result['success'] = False
             processing_result['error'] = error
-            return processing_result
+            yield {'event': 'result', 'result': processing_result}
+            return
         
         # Rest of the function remains the same...
         # Step 3: Run OCR on the processed image with the custom model
         print("Step 2: Running OCR with Azure Document Intelligence custom model")
+        report_progress(options, 'ocr')
+        yield {'event': 'ocr_started'}
         #ocr_result = analyze_image_with_azure_model(ocr_image, options)
-        ocr_result = analyze_image_with_direct_rest(ocr_image,options)
+        with memory.stage('ocr'), timed('ocr'):
+            ocr_result = run_ocr(ocr_image, options)
+        yield {'event': 'ocr_complete', 'success': bool(ocr_result.get('success')),
+               'source': ocr_result.get('source', 'cloud')}
         # If OCR failed, return what we have so far
         if not ocr_result.get('success', False):
             print("OCR analysis failed")
             processing_result['success'] = False
             processing_result['error'] = ocr_result.get('error', 'OCR analysis failed')
             processing_result['ocrResults'] = ocr_result
-            return processing_result
+            yield {'event': 'result', 'result': processing_result}
+            return
         
         # Step 4: Parse the OCR results
         print("Step 3: Parsing OCR results")
-        parsed_result = parse_ocr_results(ocr_result)
-        
-        # Check if OCR returned enough data - if not, might need a better image
-        data = parsed_result.get('data', {})
+        report_progress(options, 'parsing')
+        with memory.stage('parsing'), timed('parsing'):
+            parsed_result = parse_ocr_results(ocr_result)
+            
+            # Check if OCR returned enough data - if not, might need a better image
+            data = parsed_result.get('data', {})
+            
+            # Encode tables as requested (row dictionaries by default)
+            format_parsed_tables(data, options.get('tableFormat', DEFAULT_TABLE_FORMAT))
         if not data or (not data.get('splits') and not data.get('intervals')):
             processing_result['success'] = True  # Image processing succeeded
             processing_result['ocrSuccess'] = False  # But OCR didn't find useful data
@@ -735,7 +1223,8 @@ def process_erg_images(base64_images: List[str], options: Dict[str, Any] = None)
             processing_result['error'] = "Workout data couldn't be read from the image. Please take another photo with better lighting and a clearer view of the monitor screen."
             processing_result['ocrResults'] = ocr_result
             processing_result['parsedData'] = data
-            return processing_result
+            yield {'event': 'result', 'result': processing_result}
+            return
         
         # Report on parsed data
         if debug_mode:
@@ -767,7 +1256,7 @@ def process_erg_images(base64_images: List[str], options: Dict[str, Any] = None)
                 print(f"Available fields: {', '.join(raw_fields.keys())}")
         
         # Return all results
-        return {
+        yield {'event': 'result', 'result': {
             'success': True,
             'monitorDetected': all_monitors_detected,
             'detectionMessages': detection_messages,
@@ -776,7 +1265,7 @@ def process_erg_images(base64_images: List[str], options: Dict[str, Any] = None)
             'ocrResults': ocr_result,
             'parsedData': parsed_result.get('data'),
             'ocrSuccess': True
-        }
+        }}
         
     except Exception as e:
         error_message = f"Error processing erg images: {str(e)}"
@@ -784,14 +1273,15 @@ def process_erg_images(base64_images: List[str], options: Dict[str, Any] = None)
         print(error_message)
         print(traceback_str)
         
-        return {
+        yield {'event': 'result', 'result': {
             'success': False,
             'error': error_message,
             'traceback': traceback_str,
             'needsBetterImage': True
-        }
+        }}
     
 
+@timed_call('detection.contrast')
 def detect_monitor_by_contrast(image: np.ndarray) -> Optional[np.ndarray]:
     """
     Detect monitor screen using contrast-based segmentation
@@ -872,6 +1362,7 @@ def detect_monitor_by_contrast(image: np.ndarray) -> Optional[np.ndarray]:
         logging.error(f"Error in detect_monitor_by_contrast: {str(e)}")
         return None
 
+@timed_call('detection.gridAnalysis')
 def detect_monitor_by_grid_analysis(image: np.ndarray) -> Optional[np.ndarray]:
     """
     Detect monitor screen by analyzing a grid of cells for text-like content
@@ -970,6 +1461,7 @@ def detect_monitor_by_grid_analysis(image: np.ndarray) -> Optional[np.ndarray]:
         logging.error(f"Error in detect_monitor_by_grid_analysis: {str(e)}")
         return None
 
+@timed_call('detection.multiScale')
 def detect_monitor_multi_scale(image: np.ndarray) -> Optional[np.ndarray]:
     """
     Detect monitor screen using multi-scale edge detection
@@ -1082,83 +1574,86 @@ def detect_and_crop_monitor_screen(image: np.ndarray) -> Tuple[np.ndarray, bool,
     try:
         # Get image dimensions
         h, w = image.shape[:2]
-        original = image.copy()
         
         # TECHNIQUE 1: STANDARD EDGE + CONTOUR DETECTION
-        # Convert to grayscale for processing
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-        
-        # Use multiple edge detection methods for better results
-        edges = cv2.Canny(blurred, 50, 150)
-        thresh = cv2.adaptiveThreshold(blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
-                                      cv2.THRESH_BINARY_INV, 11, 2)
-        combined_edges = cv2.bitwise_or(edges, thresh)
-        
-        # Dilate to connect broken lines
-        kernel = np.ones((3, 3), np.uint8)
-        dilated_edges = cv2.dilate(combined_edges, kernel, iterations=1)
-        
-        # Find contours
-        contours, _ = cv2.findContours(dilated_edges, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
-        contours = sorted(contours, key=cv2.contourArea, reverse=True)
-        
-        # Variables to track detection quality
-        best_quad = None
-        best_area_ratio = 0
-        best_approx = None
-        best_score = 0
-        
-        # Look for quadrilateral contours that might be the monitor screen
-        for contour in contours[:20]:
-            # Approximate the contour
-            peri = cv2.arcLength(contour, True)
-            approx = cv2.approxPolyDP(contour, 0.02 * peri, True)
+        with timed('detection.contours'):
+            # Convert to grayscale for processing
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            blurred = cv2.GaussianBlur(gray, (5, 5), 0)
             
-            # Check for approximately rectangular shapes (allowing for perspective distortion)
-            if 3 <= len(approx) <= 6:
-                # Force it to have 4 corners if not already
-                if len(approx) != 4:
-                    x, y, w_rect, h_rect = cv2.boundingRect(approx)
-                    rect_area = w_rect * h_rect
-                    
-                    perfect_rect = np.array([
-                        [x, y],
-                        [x + w_rect, y],
-                        [x + w_rect, y + h_rect],
-                        [x, y + h_rect]
-                    ])
-                    
-                    contour_area = cv2.contourArea(contour)
-                    if contour_area > 0 and rect_area / contour_area < 1.5:
-                        approx = perfect_rect
-                else:
-                    # If already has 4 corners, ensure they're in the right order
-                    approx = order_points(approx.reshape(-1, 2))
-                
-                # Calculate detection confidence metrics
-                image_area = h * w
-                contour_area = cv2.contourArea(approx)
-                
-                if contour_area <= 0:
-                    continue
+            # Use multiple edge detection methods for better results
+            edges = cv2.Canny(blurred, 50, 150)
+            thresh = cv2.adaptiveThreshold(blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
+                                          cv2.THRESH_BINARY_INV, 11, 2)
+            combined_edges = cv2.bitwise_or(edges, thresh)
+            
+            # Dilate to connect broken lines
+            kernel = np.ones((3, 3), np.uint8)
+            dilated_edges = cv2.dilate(combined_edges, kernel, iterations=1)
+            
+            # Find contours
+            contours, _ = cv2.findContours(dilated_edges, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+            contours = sorted(contours, key=cv2.contourArea, reverse=True)
+            
+            # Variables to track detection quality
+            best_quad = None
+            best_area_ratio = 0
+            best_approx = None
+            best_score = 0
+            
+            # Look for quadrilateral contours that might be the monitor screen
+            for contour in contours[:20]:
+                # Approximate the contour
+                peri = cv2.arcLength(contour, True)
+                approx = cv2.approxPolyDP(contour, 0.02 * peri, True)
                 
-                # Check if size is reasonable for a monitor
-                area_ratio = contour_area / image_area
-                if 0.05 < area_ratio < 0.95:
-                    # Get rectangle confidence score
-                    rect_confidence = get_rectangle_confidence(approx.reshape(-1, 2))
+                # Check for approximately rectangular shapes (allowing for perspective distortion)
+                if 3 <= len(approx) <= 6:
+                    # Force it to have 4 corners if not already
+                    if len(approx) != 4:
+                        x, y, w_rect, h_rect = cv2.boundingRect(approx)
+                        rect_area = w_rect * h_rect
+                        
+                        perfect_rect = np.array([
+                            [x, y],
+                            [x + w_rect, y],
+                            [x + w_rect, y + h_rect],
+                            [x, y + h_rect]
+                        ])
+                        
+                        contour_area = cv2.contourArea(contour)
+                        if contour_area > 0 and rect_area / contour_area < 1.5:
+                            approx = perfect_rect
+                    else:
+                        # If already has 4 corners, ensure they're in the right order
+                        approx = order_points(approx.reshape(-1, 2))
                     
-                    # Calculate overall confidence score
-                    # - Higher area_ratio = larger portion of image (good)
-                    # - Higher rect_confidence = more rectangular shape (good)
-                    score = area_ratio * rect_confidence
+                    # Calculate detection confidence metrics
+                    image_area = h * w
+                    contour_area = cv2.contourArea(approx)
                     
-                    if score > best_score:
-                        best_score = score
-                        best_area_ratio = area_ratio
-                        best_quad = approx
-                        best_approx = approx.reshape(-1, 2)
+                    if contour_area <= 0:
+                        continue
+                    
+                    # Check if size is reasonable for a monitor
+                    area_ratio = contour_area / image_area
+                    if 0.05 < area_ratio < 0.95:
+                        # Get rectangle confidence score
+                        rect_confidence = get_rectangle_confidence(approx.reshape(-1, 2))
+                        
+                        # Calculate overall confidence score
+                        # - Higher area_ratio = larger portion of image (good)
+                        # - Higher rect_confidence = more rectangular shape (good)
+                        score = area_ratio * rect_confidence
+                        
+                        if score > best_score:
+                            best_score = score
+                            best_area_ratio = area_ratio
+                            best_quad = approx
+                            best_approx = approx.reshape(-1, 2)
+            
+        # Only the grayscale, blurred and edge images are needed from here on
+        del thresh, combined_edges, dilated_edges, contours
         
         # Set minimum confidence threshold for successful detection
         MIN_CONFIDENCE_THRESHOLD = 0.12  # Slightly lower threshold for better recall
@@ -1174,35 +1669,39 @@ def detect_and_crop_monitor_screen(image: np.ndarray) -> Tuple[np.ndarray, bool,
         
         # TECHNIQUE 2: HOUGH LINE DETECTION
         # Only proceed if first method failed
-        #logging.info("Standard contour detection failed, trying Hough line detection")
-        edges = cv2.Canny(blurred, 50, 150)
-        lines = cv2.HoughLinesP(edges, 1, np.pi/180, 100, minLineLength=100, maxLineGap=10)
-        
-        if lines is not None and len(lines) > 0:
-            # Create a mask of all lines
-            line_mask = np.zeros_like(gray)
-            for line in lines:
-                x1, y1, x2, y2 = line[0]
-                cv2.line(line_mask, (x1, y1), (x2, y2), 255, 2)
-                
-            line_contours, _ = cv2.findContours(line_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        with timed('detection.houghLines'):
+            #logging.info("Standard contour detection failed, trying Hough line detection")
+            # Reuses technique 1's Canny edges, computed with the same thresholds
+            lines = cv2.HoughLinesP(edges, 1, np.pi/180, 100, minLineLength=100, maxLineGap=10)
             
-            if line_contours:
-                largest_contour = max(line_contours, key=cv2.contourArea)
-                x, y, w_rect, h_rect = cv2.boundingRect(largest_contour)
-                
-                contour_area = w_rect * h_rect
-                if 0.1 * (h * w) < contour_area < 0.9 * (h * w):
-                    margin_x = int(0.1 * w_rect)
-                    margin_y = int(0.1 * h_rect)
+            if lines is not None and len(lines) > 0:
+                # Create a mask of all lines
+                line_mask = np.zeros_like(gray)
+                for line in lines:
+                    x1, y1, x2, y2 = line[0]
+                    cv2.line(line_mask, (x1, y1), (x2, y2), 255, 2)
                     
-                    x_start = max(0, x - margin_x)
-                    y_start = max(0, y - margin_y)
-                    x_end = min(w, x + w_rect + margin_x)
-                    y_end = min(h, y + h_rect + margin_y)
+                line_contours, _ = cv2.findContours(line_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+                
+                if line_contours:
+                    largest_contour = max(line_contours, key=cv2.contourArea)
+                    x, y, w_rect, h_rect = cv2.boundingRect(largest_contour)
                     
-                    #logging.info("Monitor outline detected using line detection")
-                    return image[y_start:y_end, x_start:x_end], True, "Monitor outline detected"
+                    contour_area = w_rect * h_rect
+                    if 0.1 * (h * w) < contour_area < 0.9 * (h * w):
+                        margin_x = int(0.1 * w_rect)
+                        margin_y = int(0.1 * h_rect)
+                        
+                        x_start = max(0, x - margin_x)
+                        y_start = max(0, y - margin_y)
+                        x_end = min(w, x + w_rect + margin_x)
+                        y_end = min(h, y + h_rect + margin_y)
+                        
+                        #logging.info("Monitor outline detected using line detection")
+                        return image[y_start:y_end, x_start:x_end], True, "Monitor outline detected"
+            
+        # The remaining techniques work from the color image; free the full-size masks first
+        del gray, blurred, edges, lines
         
         # TECHNIQUE 3: CONTRAST-BASED SEGMENTATION
         # Try to detect the monitor based on contrast differences
@@ -1238,6 +1737,7 @@ def detect_and_crop_monitor_screen(image: np.ndarray) -> Tuple[np.ndarray, bool,
         # Return original image with error message
         return image, False, f"Error detecting monitor: {str(e)}. Please try again with a clearer photo."
 
+@timed_call('detection.perspective')
 def process_detected_monitor(image: np.ndarray, corners) -> Optional[np.ndarray]:
     """
     Process a detected monitor by applying perspective correction and cropping
@@ -1398,6 +1898,7 @@ def get_rectangle_confidence(pts):
     return diagonal_similarity * 0.7 + aspect_confidence * 0.3
 
 
+@timed_call('stitch')
 def stitch_images_vertically(images: List[np.ndarray]) -> np.ndarray:
     """
     Stitch multiple images vertically to create a single image
@@ -1411,27 +1912,35 @@ def stitch_images_vertically(images: List[np.ndarray]) -> np.ndarray:
     
     # Resize all images to the same width (use the width of the first image)
     target_width = images[0].shape[1]
-    resized_images = []
     
-    for img in images:
-        # Skip empty images
-        if img is None or img.size == 0:
-            continue
-            
-        # Calculate new height while maintaining aspect ratio
-        aspect_ratio = img.shape[1] / img.shape[0]
-        new_height = int(target_width / aspect_ratio)
-        
-        # Resize image
-        resized = cv2.resize(img, (target_width, new_height))
-        resized_images.append(resized)
+    # Skip empty images, and calculate each new height maintaining aspect ratio
+    images = [img for img in images if img is not None and img.size > 0]
+    heights = [int(target_width / (img.shape[1] / img.shape[0])) for img in images]
+    
+    # Resize each image straight into its band of one preallocated output, instead
+    # of resizing into temporaries and copying them all again to concatenate
+    stitched = np.empty((sum(heights), target_width) + images[0].shape[2:], dtype=images[0].dtype)
+    top = 0
+    for img, height in zip(images, heights):
+        cv2.resize(img, (target_width, height), dst=stitched[top:top + height])
+        top += height
     
-    # Vertically concatenate the images
-    return cv2.vconcat(resized_images)
+    return stitched
 if __name__ == "__main__":
+    import argparse
+    
     parser = argparse.ArgumentParser(description='Process erg monitor images with optional OCR')
-    parser.add_argument('--input', required=True, help='Input JSON file path')
-    parser.add_argument('--output', required=True, help='Output JSON file path')
+    parser.add_argument('--input', help='Input JSON file path')
+    parser.add_argument('--output', required=True, help='Output JSON file path (JSONL in batch mode)')
+    parser.add_argument('--batch', nargs='+', metavar='INPUT',
+                        help='Batch mode: directories, glob patterns, JSONL manifests or image files to process')
+    parser.add_argument('--workers', type=int, help='Batch mode: parallel workers (default OCR_BATCH_WORKERS)')
+    parser.add_argument('--processes', type=int, metavar='N',
+                        help='Batch mode: preprocess images on N worker processes (see frame_farm)')
+    parser.add_argument('--archive', metavar='DIR',
+                        help='Batch mode: add processed images to a crop archive (see crop_archive)')
+    parser.add_argument('--restart', action='store_true', help='Batch mode: overwrite the output instead of resuming')
+    parser.add_argument('--include-images', action='store_true', help='Batch mode: keep processed images in the results')
     parser.add_argument('--no-ocr', action='store_true', help='Disable OCR processing (image processing only)')
     parser.add_argument('--endpoint', help='Azure Document Intelligence endpoint')
     parser.add_argument('--key', help='Azure Document Intelligence API key')
@@ -1439,6 +1948,47 @@ if __name__ == "__main__":
     parser.add_argument('--debug', action='store_true', help='Enable debug output')
     args = parser.parse_args()
     
+    if bool(args.input) == bool(args.batch):
+        parser.error('give exactly one of --input or --batch')
+    
+    if args.batch:
+        from shared_code.batch_process import BATCH_WORKERS, process_batch
+        
+        # Only warnings and the batch's own progress reach the console
+        handler = logging.StreamHandler()
+        handler.addFilter(lambda record: args.debug or record.levelno >= logging.WARNING
+                          or record.module in ('batch_support', 'batch_process'))
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s', handlers=[handler])
+        
+        batch_options = {'ocr': not args.no_ocr, 'debug': args.debug}
+        if args.endpoint:
+            batch_options['endpoint'] = args.endpoint
+        if args.key:
+            batch_options['key'] = args.key
+        if args.model_id:
+            batch_options['modelId'] = args.model_id
+        if args.processes:
+            from shared_code.frame_farm import get_frame_farm
+            batch_options['preprocessMode'] = 'processes'
+            get_frame_farm(args.processes, quiet=not args.debug)
+        
+        # The pipeline prints its step banners; keep them out of the summary unless debugging
+        stdout = sys.stdout
+        if not args.debug:
+            sys.stdout = open(os.devnull, 'w')
+        try:
+            summary = process_batch(args.batch, args.output, batch_options,
+                                    workers=args.workers or BATCH_WORKERS,
+                                    include_images=args.include_images, resume=not args.restart,
+                                    archive_dir=args.archive)
+        finally:
+            if sys.stdout is not stdout:
+                sys.stdout.close()
+                sys.stdout = stdout
+        
+        print(json.dumps(summary, indent=2))
+        sys.exit(1 if summary['failed'] else 0)
+    
     # Read input JSON
     with open(args.input, 'r') as f:
         input_data = json.load(f)
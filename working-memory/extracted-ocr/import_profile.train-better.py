@@ -0,0 +1,202 @@
+"""
+Import-Time Profile
+
+Measures what the function host pays to import the pipeline on a cold start:
+1. Each entry module is imported in a fresh interpreter under "python -X importtime",
+   several times, and the cumulative import time is summarized (see perf_stats)
+2. The slowest imports by self time, and the entry module's direct imports by
+   cumulative time, are listed from the median run
+3. Modules that are meant to load only on first use (DEFERRED_MODULES) are
+   flagged if an entry module imports them anyway
+4. Results can be saved as a baseline and later runs compared against it
+
+Usage:
+    python -m shared_code.import_profile
+    python -m shared_code.import_profile --write-baseline import_baseline.json
+    python -m shared_code.import_profile --baseline import_baseline.json
+"""
+
+import json
+import os
+import re
+import subprocess
+import sys
+from typing import Any, Dict, List, Optional, Sequence
+
+from shared_code.perf_stats import latency_summary, percentile
+
+# Modules loaded when the function host handles its first request
+ENTRY_MODULES = ("shared_code.pipeline_service", "shared_code.job_queue")
+
+# Dependencies only some paths need; none of them should load with the entry modules
+DEFERRED_MODULES = ("PIL", "azure.ai.documentintelligence", "azure.core", "requests", "argparse", "pyarrow",
+                    "multiprocessing", "multiprocessing.shared_memory", "concurrent.futures.process",
+                    "cProfile", "pstats", "tracemalloc")
+
+# Allowed growth of the median import time over the baseline before a run fails
+DEFAULT_MAX_REGRESSION = 0.2
+
+_IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)\s*$")
+
+
+def parse_importtime(stderr: str) -> List[Dict[str, Any]]:
+    """
+    Parse "-X importtime" output
+
+    Returns:
+        One entry per imported module with name, depth (0 for top-level imports),
+        selfUs and cumulativeUs, in output order
+    """
+    entries = []
+    for line in stderr.splitlines():
+        match = _IMPORTTIME_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            entries.append({
+                "name": name,
+                "depth": len(indent) // 2,
+                "selfUs": int(self_us),
+                "cumulativeUs": int(cumulative_us)
+            })
+    return entries
+
+
+def module_subtree(entries: List[Dict[str, Any]], module: str) -> List[Dict[str, Any]]:
+    """
+    Return the entries imported by module, ending with module itself
+
+    importtime prints a module after everything it imported, so its subtree is
+    the run of deeper entries just before it. Interpreter startup imports (site
+    and the like) are left out.
+    """
+    for index, entry in enumerate(entries):
+        if entry["name"] == module:
+            start = index
+            while start > 0 and entries[start - 1]["depth"] > entry["depth"]:
+                start -= 1
+            return entries[start:index + 1]
+    return []
+
+
+def run_importtime(module: str, python: str = sys.executable, env: Optional[Dict[str, str]] = None) -> List[Dict[str, Any]]:
+    """Import module in a fresh interpreter under -X importtime and return the parsed entries"""
+    completed = subprocess.run(
+        [python, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env=env
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed: {completed.stderr.strip().splitlines()[-1:]}")
+    return parse_importtime(completed.stderr)
+
+
+def _ms(microseconds: int) -> float:
+    return round(microseconds / 1000.0, 2)
+
+
+def profile_module(module: str, runs: int = 5, top: int = 15, python: str = sys.executable) -> Dict[str, Any]:
+    """
+    Profile the cold import of one module
+
+    The first run also warms the filesystem and bytecode caches; it is discarded.
+
+    Returns:
+        Dictionary with module, importMs (latency summary of the cumulative
+        import time across runs), slowestSelf, directImports and deferredLoaded
+    """
+    env = dict(os.environ)
+    run_importtime(module, python, env)
+
+    measured = []
+    for _ in range(max(runs, 1)):
+        entries = run_importtime(module, python, env)
+        total = next((e["cumulativeUs"] for e in entries if e["name"] == module), 0)
+        measured.append((total, entries))
+
+    totals = [total for total, _ in measured]
+    median_total = percentile(totals, 50)
+    _, entries = min(measured, key=lambda m: abs(m[0] - median_total))
+
+    entries = module_subtree(entries, module)
+    direct = [e for e in entries if e["depth"] == entries[-1]["depth"] + 1] if entries else []
+    loaded = {e["name"] for e in entries}
+
+    return {
+        "module": module,
+        "importMs": latency_summary([total / 1e6 for total in totals]),
+        "slowestSelf": [
+            {"name": e["name"], "selfMs": _ms(e["selfUs"])}
+            for e in sorted(entries, key=lambda e: e["selfUs"], reverse=True)[:top]
+        ],
+        "directImports": [
+            {"name": e["name"], "cumulativeMs": _ms(e["cumulativeUs"])}
+            for e in sorted(direct, key=lambda e: e["cumulativeUs"], reverse=True)[:top]
+        ],
+        "deferredLoaded": sorted(name for name in DEFERRED_MODULES if name in loaded)
+    }
+
+
+def compare_with_baseline(report: Dict[str, Any], baseline: Dict[str, Any],
+                          max_regression: float = DEFAULT_MAX_REGRESSION) -> List[str]:
+    """
+    Compare median import times with a baseline report
+
+    Returns:
+        Messages for modules whose median import time grew by more than max_regression
+    """
+    regressions = []
+    previous = {entry["module"]: entry for entry in baseline.get("modules", [])}
+    for entry in report["modules"]:
+        before = previous.get(entry["module"])
+        if not before:
+            continue
+        old_ms = before["importMs"].get("p50Ms")
+        new_ms = entry["importMs"].get("p50Ms")
+        if old_ms and new_ms and new_ms > old_ms * (1 + max_regression):
+            regressions.append(f"{entry['module']}: median import {new_ms:.1f}ms vs baseline {old_ms:.1f}ms")
+    return regressions
+
+
+def profile_imports(modules: Sequence[str] = ENTRY_MODULES, runs: int = 5, top: int = 15) -> Dict[str, Any]:
+    """Profile every entry module; returns {"python": version, "modules": [...]}"""
+    return {
+        "python": sys.version.split()[0],
+        "modules": [profile_module(module, runs, top) for module in modules]
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Profile cold import time of the pipeline entry modules")
+    parser.add_argument("modules", nargs="*", default=list(ENTRY_MODULES), help="Modules to import")
+    parser.add_argument("--runs", type=int, default=5, help="Measured imports per module")
+    parser.add_argument("--top", type=int, default=15, help="Imports listed per module")
+    parser.add_argument("--baseline", help="Fail if median import time regressed against this report")
+    parser.add_argument("--max-regression", type=float, default=DEFAULT_MAX_REGRESSION,
+                        help="Allowed fractional growth over the baseline")
+    parser.add_argument("--write-baseline", help="Save this report as a baseline")
+    args = parser.parse_args(argv)
+
+    report = profile_imports(args.modules, args.runs, args.top)
+    problems = [
+        f"{entry['module']} loads deferred modules: {', '.join(entry['deferredLoaded'])}"
+        for entry in report["modules"] if entry["deferredLoaded"]
+    ]
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            problems.extend(compare_with_baseline(report, json.load(f), args.max_regression))
+    report["problems"] = problems
+
+    if args.write_baseline:
+        with open(args.write_baseline, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+
+    print(json.dumps(report, indent=2))
+    for problem in problems:
+        print(problem, file=sys.stderr)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+"""
+Typed Interval Rows
+
+Table rows arrive from OCR as column -> text dictionaries. Table classification,
+overlap merging and deduplication all need the same numbers out of those strings,
+so each row is parsed once into an IntervalRow:
+1. Every non-empty cell is parsed to a number where it has one, in a single
+   vectorized pass over the table (see column_parser)
+2. Canonical columns (seconds, meters, split, spm) are resolved through the schema
+3. Rest markers, the interval number and a duplicate key are computed up front
+
+The original row is kept on the record so results are returned unchanged.
+"""
+
+import math
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from shared_code.column_parser import parse_time, parse_time_column
+from shared_code.workout_schema import (
+    INTERVAL_NUMBER_KEYS, INTERVAL_ORDER_FALLBACK_KEYS, is_rest_value, resolve_columns
+)
+
+def parse_cell(value: Any) -> Tuple[str, Optional[float]]:
+    """
+    Normalize a table cell and parse its numeric value
+
+    Times (m:ss.t and h:mm:ss.t, with an optional rest "r" prefix) become seconds;
+    other readings become plain numbers (see column_parser).
+
+    Returns:
+        Tuple of (normalized lower-case text, number or None)
+    """
+    seconds = parse_time(value)
+    return str(value).strip().lower(), None if math.isnan(seconds) else seconds
+
+
+def _first_number(cells: Dict[str, Tuple[str, Optional[float]]], keys: Tuple[str, ...]) -> Optional[float]:
+    for key in keys:
+        cell = cells.get(key)
+        if cell is not None and cell[1] is not None:
+            return cell[1]
+    return None
+
+
+def get_interval_number_from_row(row: Dict) -> int:
+    """Extract interval number from a row, with fallbacks to other numeric fields"""
+    if not isinstance(row, dict):
+        return 0
+
+    # Explicit interval number columns first
+    for key in INTERVAL_NUMBER_KEYS:
+        if key in row and row[key]:
+            try:
+                return int(str(row[key]).strip())
+            except (ValueError, TypeError):
+                pass
+
+    # Fall back to the digits of time or distance values
+    for key in INTERVAL_ORDER_FALLBACK_KEYS:
+        if key in row and row[key]:
+            digits = ''.join(c for c in str(row[key]) if c.isdigit())
+            if digits:
+                return int(digits)
+
+    return 0
+
+
+class IntervalRow:
+    """
+    A table row parsed once for classification, merging and deduplication
+
+    Attributes:
+        raw: The original row (column -> text dictionary, or text for simple rows)
+        cells: Column -> (normalized text, number or None) for non-empty cells
+        seconds: Time column in seconds
+        meters: Distance column in meters
+        split: Split column in seconds
+        spm: Stroke rate
+        interval_number: Interval number, or a sortable stand-in derived from time/distance
+        is_rest: True if any cell carries a rest marker
+        key: Hashable form of the row (without its "number" column) for exact duplicates
+    """
+
+    __slots__ = ("raw", "cells", "seconds", "meters", "split", "spm", "interval_number", "is_rest", "key")
+
+    def __init__(self, raw: Any, cells: Dict[str, Tuple[str, Optional[float]]]):
+        self.raw = raw
+        self.cells = cells
+        if isinstance(raw, dict):
+            columns = resolve_columns(tuple(raw))
+            self.seconds = _first_number(self.cells, columns.get("time", ()))
+            self.meters = _first_number(self.cells, columns.get("distance", ()))
+            self.split = _first_number(self.cells, columns.get("split", ()))
+            self.spm = _first_number(self.cells, columns.get("spm", ()))
+            self.interval_number = get_interval_number_from_row(raw)
+            self.is_rest = any(is_rest_value(v) for v in raw.values())
+            self.key = tuple(sorted((k, str(v)) for k, v in raw.items() if k != "number"))
+        else:
+            self.seconds = self.meters = self.split = self.spm = None
+            self.interval_number = 0
+            self.is_rest = is_rest_value(raw)
+            self.key = None
+
+    @property
+    def is_object(self) -> bool:
+        return self.key is not None
+
+    @property
+    def data_columns(self) -> int:
+        """Number of non-empty cells"""
+        return len(self.cells)
+
+    def distance_only(self) -> bool:
+        """True if the distance column is the row's only non-empty cell"""
+        if not self.is_object or len(self.cells) != 1:
+            return False
+        return next(iter(self.cells)) in resolve_columns(tuple(self.raw)).get("distance", ())
+
+
+def parse_interval_rows(rows: Iterable[Any]) -> List[IntervalRow]:
+    """
+    Parse table rows into IntervalRow records
+
+    All non-empty cells of the table are parsed together in one vectorized pass.
+    """
+    rows = list(rows)
+    refs = []
+    values = []
+    for index, row in enumerate(rows):
+        if isinstance(row, dict):
+            for key, value in row.items():
+                if value is not None and str(value).strip():
+                    refs.append((index, key))
+                    values.append(value)
+        else:
+            refs.append((index, ""))
+            values.append(row)
+
+    numbers, valid = parse_time_column(values)
+    cells = [{} for _ in rows]
+    for (index, key), value, number, ok in zip(refs, values, numbers.tolist(), valid.tolist()):
+        cells[index][key] = (str(value).strip().lower(), number if ok else None)
+
+    return [IntervalRow(row, row_cells) for row, row_cells in zip(rows, cells)]
+
+
+def as_interval_rows(rows: List[Any]) -> List[IntervalRow]:
+    """Return rows as IntervalRow records, parsing only if they aren't already"""
+    if rows and isinstance(rows[0], IntervalRow):
+        return rows
+    return parse_interval_rows(rows or [])
+
+
+def raw_rows(rows: List[IntervalRow]) -> List[Any]:
+    """Return the original rows of parsed records"""
+    return [row.raw for row in rows]
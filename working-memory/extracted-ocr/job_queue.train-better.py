@@ -0,0 +1,370 @@
+"""
+Background Job Queue
+
+Durable, sqlite-backed queue for asynchronous erg image processing:
+1. Submissions are stored as queued jobs and acknowledged immediately
+2. A pool of worker threads claims jobs and runs the image pipeline
+3. Workers record per-stage progress, partial results and the final result
+4. Clients poll job status until the job succeeds or fails
+5. With OCR_CROP_ARCHIVE_DIR set, each finished job's processed images are added
+   to the crop archive under the job id (see crop_archive)
+
+Jobs survive process restarts: anything left "running" by a dead worker is
+requeued when the service starts.
+
+Configuration:
+    OCR_JOB_DB_PATH             sqlite database path (default: <tempdir>/erg_ocr_jobs.sqlite3)
+    OCR_JOB_WORKERS             Number of worker threads (default 2)
+    OCR_JOB_MAX_ATTEMPTS        Attempts before a crashed job is marked failed (default 3)
+    OCR_JOB_RETENTION_SECONDS   How long finished jobs are kept (default 86400)
+    OCR_JOB_STALE_SECONDS       Idle time after which a running job counts as interrupted (default 600)
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from shared_code.crop_archive import get_crop_archive
+from shared_code.pipeline_service import run_pipeline
+
+DEFAULT_JOB_DB_PATH = os.environ.get(
+    "OCR_JOB_DB_PATH", os.path.join(tempfile.gettempdir(), "erg_ocr_jobs.sqlite3")
+)
+DEFAULT_JOB_WORKERS = int(os.environ.get("OCR_JOB_WORKERS", "2"))
+MAX_JOB_ATTEMPTS = int(os.environ.get("OCR_JOB_MAX_ATTEMPTS", "3"))
+JOB_RETENTION_SECONDS = float(os.environ.get("OCR_JOB_RETENTION_SECONDS", "86400"))
+JOB_STALE_SECONDS = float(os.environ.get("OCR_JOB_STALE_SECONDS", "600"))
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_SUCCEEDED = "succeeded"
+STATUS_FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    payload TEXT NOT NULL,
+    progress TEXT,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs (status, created_at);
+"""
+
+
+class JobStore:
+    """sqlite-backed job storage safe to share between threads and processes"""
+
+    def __init__(self, db_path: str = DEFAULT_JOB_DB_PATH):
+        self.db_path = db_path
+        conn = self._connect()
+        try:
+            conn.executescript(_SCHEMA)
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        # A short-lived connection per operation keeps this thread-safe without a shared lock
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def enqueue(self, images: List[str], options: Dict[str, Any]) -> str:
+        """Store a new job and return its id"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        payload = json.dumps({"images": images, "options": options})
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT INTO jobs (id, status, created_at, updated_at, payload) VALUES (?, ?, ?, ?, ?)",
+                (job_id, STATUS_QUEUED, now, now, payload)
+            )
+        finally:
+            conn.close()
+        return job_id
+
+    def claim(self, limit: int = 1) -> List[Dict[str, Any]]:
+        """
+        Atomically move up to `limit` of the oldest queued jobs to running
+
+        Returns:
+            List of claimed jobs with their id, attempts and decoded payload
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                "SELECT id, attempts, payload FROM jobs WHERE status = ? ORDER BY created_at LIMIT ?",
+                (STATUS_QUEUED, limit)
+            ).fetchall()
+            now = time.time()
+            for row in rows:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                    (STATUS_RUNNING, now, row["id"])
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+        return [
+            {"id": row["id"], "attempts": row["attempts"] + 1, "payload": json.loads(row["payload"])}
+            for row in rows
+        ]
+
+    def _update(self, job_id: str, **columns):
+        columns["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in columns)
+        conn = self._connect()
+        try:
+            conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*columns.values(), job_id))
+        finally:
+            conn.close()
+
+    def update_progress(self, job_id: str, progress: Dict[str, Any]):
+        self._update(job_id, progress=json.dumps(progress))
+
+    def complete(self, job_id: str, result: Dict[str, Any]):
+        # The images are no longer needed once the job has finished
+        self._update(job_id, status=STATUS_SUCCEEDED, result=json.dumps(result), payload="{}")
+
+    def fail(self, job_id: str, error: str, result: Optional[Dict[str, Any]] = None):
+        self._update(
+            job_id,
+            status=STATUS_FAILED,
+            error=error,
+            result=json.dumps(result) if result is not None else None,
+            payload="{}"
+        )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return the public view of a job, or None if it doesn't exist"""
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT id, status, created_at, updated_at, attempts, progress, result, error FROM jobs WHERE id = ?",
+                (job_id,)
+            ).fetchone()
+        finally:
+            conn.close()
+
+        if row is None:
+            return None
+
+        job = {
+            "jobId": row["id"],
+            "status": row["status"],
+            "createdAt": row["created_at"],
+            "updatedAt": row["updated_at"],
+            "attempts": row["attempts"],
+            "progress": json.loads(row["progress"]) if row["progress"] else None
+        }
+        if row["result"]:
+            job["result"] = json.loads(row["result"])
+        if row["error"]:
+            job["error"] = row["error"]
+        return job
+
+    def recover_interrupted(self, stale_after_seconds: float = JOB_STALE_SECONDS) -> int:
+        """
+        Requeue jobs left running by a worker that died, failing those out of attempts
+
+        Only jobs with no progress for stale_after_seconds are touched, so jobs still
+        running in another worker process are left alone.
+
+        Returns:
+            Number of jobs requeued
+        """
+        now = time.time()
+        stale_before = now - stale_after_seconds
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, payload = '{}', updated_at = ? "
+                "WHERE status = ? AND updated_at < ? AND attempts >= ?",
+                (STATUS_FAILED, "Job was interrupted too many times", now, STATUS_RUNNING, stale_before, MAX_JOB_ATTEMPTS)
+            )
+            requeued = conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE status = ? AND updated_at < ?",
+                (STATUS_QUEUED, now, STATUS_RUNNING, stale_before)
+            ).rowcount
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return requeued
+
+    def purge_finished(self, max_age_seconds: float = JOB_RETENTION_SECONDS) -> int:
+        """Delete finished jobs older than max_age_seconds"""
+        conn = self._connect()
+        try:
+            return conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+                (STATUS_SUCCEEDED, STATUS_FAILED, time.time() - max_age_seconds)
+            ).rowcount
+        finally:
+            conn.close()
+
+
+class JobService:
+    """
+    Job submission API backed by a JobStore and a pool of worker threads
+
+    Workers sleep until a job is submitted in this process, and also poll
+    periodically so jobs enqueued by other processes are picked up. A worker
+    that hits a store error (e.g. "database is locked") logs it and backs off
+    instead of exiting.
+    """
+
+    POLL_INTERVAL_SECONDS = 2.0
+    ERROR_BACKOFF_SECONDS = 1.0
+    MAX_ERROR_BACKOFF_SECONDS = 30.0
+
+    def __init__(self, store: JobStore, num_workers: int = DEFAULT_JOB_WORKERS):
+        self.store = store
+        self.num_workers = num_workers
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._workers: List[threading.Thread] = []
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        """Recover interrupted jobs and start the worker threads (idempotent)"""
+        with self._start_lock:
+            if self._workers:
+                return
+
+            requeued = self.store.recover_interrupted()
+            if requeued:
+                logging.info(f"Requeued {requeued} interrupted jobs")
+
+            for n in range(self.num_workers):
+                worker = threading.Thread(target=self._worker_loop, name=f"ocr-job-worker-{n}", daemon=True)
+                worker.start()
+                self._workers.append(worker)
+
+    def stop(self, timeout: float = None):
+        self._stopping.set()
+        self._wakeup.set()
+        for worker in self._workers:
+            worker.join(timeout)
+
+    def submit(self, images: List[str], options: Dict[str, Any]) -> str:
+        """Queue a submission and return its job id"""
+        self.start()
+        job_id = self.store.enqueue(images, options)
+        self._wakeup.set()
+        return job_id
+
+    def get_status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.store.get(job_id)
+
+    def _worker_loop(self):
+        last_purge = last_recovery = time.monotonic()
+        failures = 0
+        while not self._stopping.is_set():
+            try:
+                # One job per claim: a claimed job counts as running from the claim on,
+                # so jobs held behind a slow one could go stale and be run twice
+                jobs = self.store.claim(1)
+                if not jobs:
+                    self._wakeup.wait(self.POLL_INTERVAL_SECONDS)
+                    self._wakeup.clear()
+                    if time.monotonic() - last_purge > 3600:
+                        self.store.purge_finished()
+                        last_purge = time.monotonic()
+                    if time.monotonic() - last_recovery > JOB_STALE_SECONDS:
+                        requeued = self.store.recover_interrupted()
+                        if requeued:
+                            logging.info(f"Requeued {requeued} interrupted jobs")
+                        last_recovery = time.monotonic()
+                else:
+                    self._process_job(jobs[0])
+                failures = 0
+            except Exception as e:
+                # A job whose result couldn't be stored stays running; it is
+                # requeued by the periodic recover_interrupted once it goes stale
+                failures += 1
+                delay = min(self.ERROR_BACKOFF_SECONDS * 2 ** (failures - 1), self.MAX_ERROR_BACKOFF_SECONDS)
+                logging.error(f"Job worker error: {e}; retrying in {delay:.1f}s")
+                self._stopping.wait(delay)
+
+    def _record_progress(self, job_id: str, progress: Dict[str, Any]):
+        # Progress is best effort; a failed write mustn't fail the job
+        try:
+            self.store.update_progress(job_id, progress)
+        except sqlite3.Error as e:
+            logging.warning(f"Could not record progress of job {job_id}: {e}")
+
+    def _process_job(self, job: Dict[str, Any]):
+        job_id = job["id"]
+        payload = job["payload"]
+        options = dict(payload.get("options", {}))
+
+        # Partial results stay in the progress record so later stages don't hide them
+        partial_results: Dict[str, Any] = {}
+
+        def on_progress(stage: str, details: Dict[str, Any]):
+            if stage == "partial":
+                partial_results[str(details.get("image"))] = details.get("parsedData")
+                details = {"image": details.get("image")}
+            progress = {"stage": stage, **details}
+            if partial_results:
+                progress["partialResults"] = partial_results
+            self._record_progress(job_id, progress)
+
+        options["progressCallback"] = on_progress
+        logging.info(f"Worker processing job {job_id} (attempt {job['attempts']})")
+
+        try:
+            status_code, result = run_pipeline(payload.get("images", []), options)
+        except Exception as e:
+            # run_pipeline handles pipeline errors; this guards against store failures
+            logging.error(f"Job {job_id} crashed: {e}")
+            self.store.fail(job_id, f"Job crashed: {str(e)}")
+            return
+
+        archive = get_crop_archive()
+        if archive is not None and isinstance(result, dict):
+            try:
+                # A copy: coalesced jobs share one result dictionary
+                result = {**result, "archivedImages": archive.append_result(job_id, result)}
+            except OSError as e:
+                logging.warning(f"Could not archive the images of job {job_id}: {e}")
+
+        if status_code == 200:
+            self._record_progress(job_id, {"stage": "complete"})
+            self.store.complete(job_id, result)
+        else:
+            self.store.fail(job_id, result.get("error", "Processing failed"), result)
+
+
+_job_service = None
+_job_service_lock = threading.Lock()
+
+
+def get_job_service() -> JobService:
+    """Return the process-wide job service, creating it on first use"""
+    global _job_service
+    with _job_service_lock:
+        if _job_service is None:
+            _job_service = JobService(JobStore())
+        return _job_service
@@ -0,0 +1,268 @@
+"""
+Pipeline Memory Budget and Tracking
+
+Bounds and measures the memory one request uses in the image pipeline:
+1. A per-request budget (OCR_MEMORY_BUDGET_MB) caps the pixels an image is decoded
+   at. Oversized photos are decoded at 1/2, 1/4 or 1/8 scale, which JPEG supports
+   natively without building the full-size frame first
+2. Image dimensions are read from the JPEG or PNG header, so the scale is chosen
+   before anything is decoded
+3. MemoryTracker records, for each pipeline stage, the tracemalloc peak of Python
+   and NumPy allocations and the process RSS (sampled on a background thread, so
+   native buffers from OpenCV and PIL are counted too)
+4. Tracking is opt-in per request ('memoryProfile' option) or for every request
+   (OCR_MEMORY_TRACKING); when off, a no-op tracker is used
+
+tracemalloc and RSS are process-wide: with parallel preprocessing or concurrent
+requests on the instance, a stage's figures include whatever ran alongside it.
+
+Configuration:
+    OCR_MEMORY_BUDGET_MB      Memory a request may use for decoded images (default 1024, 0 = unlimited)
+    OCR_MEMORY_TRACKING       Track memory for every request (default false)
+    OCR_MEMORY_SAMPLE_MS      RSS sampling interval while tracking (default 10, 0 = stage boundaries only)
+"""
+
+import logging
+import os
+import struct
+import threading
+from contextlib import contextmanager, nullcontext
+from typing import Any, Dict, Optional, Tuple
+
+MEMORY_BUDGET_MB = int(os.environ.get("OCR_MEMORY_BUDGET_MB", "1024"))
+MEMORY_TRACKING = os.environ.get("OCR_MEMORY_TRACKING", "false").lower() == "true"
+RSS_SAMPLE_SECONDS = float(os.environ.get("OCR_MEMORY_SAMPLE_MS", "10")) / 1000.0
+
+# Peak bytes held per decoded pixel while one image is preprocessed: the BGR frame (3),
+# the grayscale, blurred, edge, threshold and dilated masks (1 each), and room for
+# the warped screen and its enhanced copies
+BYTES_PER_DECODED_PIXEL = 12
+
+# Scale factors OpenCV can decode at directly
+DECODE_REDUCTION_FACTORS = (1, 2, 4, 8)
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# JPEG start-of-frame markers (SOF0-SOF15 except DHT, JPG and DAC)
+_JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def max_decode_pixels(concurrent_images: int = 1, budget_mb: Optional[int] = None) -> int:
+    """
+    Return how many pixels one image may be decoded at under the request budget
+
+    Args:
+        concurrent_images: Images of the request preprocessed at the same time
+        budget_mb: Budget in MiB; defaults to OCR_MEMORY_BUDGET_MB, 0 means unlimited
+
+    Returns:
+        Pixel limit per image, or 0 for no limit
+    """
+    budget_mb = MEMORY_BUDGET_MB if budget_mb is None else budget_mb
+    if budget_mb <= 0:
+        return 0
+    return (budget_mb << 20) // (BYTES_PER_DECODED_PIXEL * max(concurrent_images, 1))
+
+
+def image_dimensions(data: bytes) -> Optional[Tuple[int, int]]:
+    """
+    Read an encoded image's size from its header without decoding it
+
+    Returns:
+        Tuple of (width, height) for JPEG and PNG data, None for anything else
+    """
+    if data[:8] == _PNG_SIGNATURE and len(data) >= 24:
+        width, height = struct.unpack(">II", data[16:24])
+        return width, height
+
+    if data[:2] != b"\xff\xd8":
+        return None
+
+    # Walk the JPEG segments up to the start-of-frame header
+    offset = 2
+    while offset + 9 <= len(data):
+        if data[offset] != 0xFF:
+            return None
+        marker = data[offset + 1]
+        if marker == 0xFF:
+            offset += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            offset += 2
+            continue
+        if marker in _JPEG_SOF_MARKERS:
+            height, width = struct.unpack(">HH", data[offset + 5:offset + 9])
+            return width, height
+        offset += 2 + struct.unpack(">H", data[offset + 2:offset + 4])[0]
+    return None
+
+
+def decode_reduction_factor(width: int, height: int, max_pixels: int) -> int:
+    """Return the smallest of DECODE_REDUCTION_FACTORS bringing width x height within max_pixels"""
+    if max_pixels <= 0:
+        return 1
+    for factor in DECODE_REDUCTION_FACTORS:
+        if (width // factor) * (height // factor) <= max_pixels:
+            return factor
+    return DECODE_REDUCTION_FACTORS[-1]
+
+
+def current_rss_bytes() -> Optional[int]:
+    """Return this process's resident set size, or None where /proc isn't available"""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _kib(value: int) -> float:
+    return round(value / 1024.0, 1)
+
+
+def _mib(value: int) -> float:
+    return round(value / (1024.0 * 1024.0), 1)
+
+
+# tracemalloc is process-wide; it runs while any tracker or profiling capture
+# holds it and is only stopped if one of them started it. It is imported on first
+# use, so requests without memory tracking never load it.
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+_tracing_started_here = False
+
+
+def acquire_tracemalloc():
+    """Start tracemalloc if nothing is tracing yet; pair every call with release_tracemalloc()"""
+    global _tracing_users, _tracing_started_here
+    import tracemalloc
+
+    with _tracing_lock:
+        if _tracing_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracing_started_here = True
+        _tracing_users += 1
+
+
+def release_tracemalloc():
+    """Stop tracemalloc once its last user releases it, unless something else had started it"""
+    global _tracing_users, _tracing_started_here
+    import tracemalloc
+
+    with _tracing_lock:
+        _tracing_users -= 1
+        if _tracing_users == 0 and _tracing_started_here:
+            tracemalloc.stop()
+            _tracing_started_here = False
+
+
+class MemoryTracker:
+    """
+    Records the memory use of one request, stage by stage
+
+    Wrap each pipeline stage in stage(name) and call close() when the request
+    ends. Each stage records:
+    - peakKiB: highest traced allocation above what was traced when the stage began
+    - retainedKiB: traced memory still held when the stage ended
+    - rssMiB: process RSS when the stage ended
+    - peakRssMiB: highest RSS sampled during the stage
+    """
+
+    enabled = True
+
+    def __init__(self, sample_seconds: float = RSS_SAMPLE_SECONDS):
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self._peak_rss = 0
+        self._closed = False
+        self._stop = threading.Event()
+        self._sampler = None
+        acquire_tracemalloc()
+
+        if sample_seconds > 0 and current_rss_bytes() is not None:
+            self._sampler = threading.Thread(target=self._sample_rss, args=(sample_seconds,),
+                                             name="ocr-memory-sampler", daemon=True)
+            self._sampler.start()
+
+    def _sample_rss(self, interval: float):
+        while not self._stop.wait(interval):
+            rss = current_rss_bytes() or 0
+            if rss > self._peak_rss:
+                self._peak_rss = rss
+
+    @contextmanager
+    def stage(self, name: str):
+        import tracemalloc
+
+        start_traced, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        self._peak_rss = current_rss_bytes() or 0
+        try:
+            yield
+        finally:
+            traced, peak = tracemalloc.get_traced_memory()
+            record = {
+                "peakKiB": _kib(max(peak - start_traced, 0)),
+                "retainedKiB": _kib(traced - start_traced)
+            }
+            rss = current_rss_bytes()
+            if rss is not None:
+                record["rssMiB"] = _mib(rss)
+                record["peakRssMiB"] = _mib(max(self._peak_rss, rss))
+            self.stages[name] = record
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Summarize the recorded stages
+
+        Returns:
+            Dictionary with budgetMiB, stages (stage name -> record), and the
+            largest peakKiB and peakRssMiB over all stages
+        """
+        report = {"budgetMiB": MEMORY_BUDGET_MB, "stages": dict(self.stages)}
+        if self.stages:
+            report["peakKiB"] = max(stage["peakKiB"] for stage in self.stages.values())
+            rss_peaks = [stage["peakRssMiB"] for stage in self.stages.values() if "peakRssMiB" in stage]
+            if rss_peaks:
+                report["peakRssMiB"] = max(rss_peaks)
+        return report
+
+    def close(self):
+        """Stop sampling and release tracemalloc; safe to call more than once"""
+        if self._closed:
+            return
+        self._closed = True
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        release_tracemalloc()
+
+
+class NullMemoryTracker:
+    """Stand-in used when memory tracking is off; every call is a no-op"""
+
+    enabled = False
+    _stage = nullcontext()
+
+    def stage(self, name: str):
+        return self._stage
+
+    def report(self) -> Optional[Dict[str, Any]]:
+        return None
+
+    def close(self):
+        pass
+
+
+NULL_MEMORY_TRACKER = NullMemoryTracker()
+
+
+def memory_tracker_for(options: Dict[str, Any]):
+    """Return a MemoryTracker if options or OCR_MEMORY_TRACKING ask for one, otherwise the no-op tracker"""
+    if options.get("memoryProfile", MEMORY_TRACKING):
+        try:
+            return MemoryTracker()
+        except Exception as e:
+            logging.warning(f"Memory tracking unavailable: {e}")
+    return NULL_MEMORY_TRACKER
@@ -0,0 +1,186 @@
+"""
+Rate-Limited OCR Dispatcher
+
+This module runs large batches of OCR work (bulk backfills of historical photos)
+without tripping Document Intelligence throttling:
+1. A token bucket paces analyze submissions to the resource's TPS quota
+2. A bounded thread pool keeps a fixed number of jobs in flight
+3. Throttled (429) and transient (5xx) responses are retried with backoff
+4. Results are yielded as soon as each job completes
+
+A job is either a single base64 image string (OCR only) or a submission dict
+in the same shape the HTTP endpoint accepts: {"images": [...], "options": {...}}.
+"""
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+from shared_code.image_processor import analyze_image_with_direct_rest, process_erg_images
+
+# Document Intelligence S0 allows 15 analyze requests per second by default
+DEFAULT_OCR_TPS = float(os.environ.get("AZURE_DOC_INTELLIGENCE_TPS", "15"))
+DEFAULT_MAX_CONCURRENCY = int(os.environ.get("OCR_DISPATCH_CONCURRENCY", "8"))
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket rate limiter
+
+    Tokens refill continuously at `rate` per second up to `capacity`. Each call to
+    acquire() takes one token, blocking until one is available.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("Token bucket rate must be positive")
+
+        self.rate = rate
+        # Default burst of one second's worth of requests
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        elapsed = now - self._last_refill
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+        self._last_refill = now
+
+    def try_acquire(self) -> bool:
+        """Take a token if one is available without waiting"""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """
+        Take a token, waiting for the bucket to refill if needed
+
+        Args:
+            timeout: Maximum seconds to wait, or None to wait indefinitely
+
+        Returns:
+            True if a token was acquired, False if the timeout expired
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait_seconds = (1 - self._tokens) / self.rate
+
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait_seconds = min(wait_seconds, remaining)
+
+            time.sleep(wait_seconds)
+
+
+def _run_job(job: Any, options: Dict[str, Any]) -> Dict:
+    """Run a single dispatcher job and return its result dictionary"""
+    if isinstance(job, str):
+        return analyze_image_with_direct_rest(job, options)
+
+    if isinstance(job, dict) and "images" in job:
+        job_options = dict(options)
+        job_options.update(job.get("options", {}))
+        # Runtime-only keys always come from the dispatcher
+        job_options["rateLimiter"] = options["rateLimiter"]
+        return process_erg_images(job["images"], job_options)
+
+    return {
+        "success": False,
+        "error": "Job must be a base64 image string or a dict with an 'images' array"
+    }
+
+
+def dispatch_ocr_batch(jobs: Iterable[Any],
+                       options: Dict[str, Any] = None,
+                       tps: float = None,
+                       max_concurrency: int = None) -> Iterator[Dict[str, Any]]:
+    """
+    Run OCR over a batch of jobs with bounded concurrency and TPS rate limiting
+
+    Jobs are pulled lazily from the iterable, so arbitrarily large batches (or
+    generators reading from disk) can be dispatched without holding them all in memory.
+
+    Args:
+        jobs: Iterable of base64 image strings or {"images": [...], "options": {...}} dicts
+        options: Processing options shared by every job (credentials, modelId, maxRetries, ...)
+        tps: Analyze submissions per second allowed by the resource's quota
+        max_concurrency: Maximum number of jobs in flight at once
+
+    Yields:
+        Dictionaries in completion order:
+        {"index": <position in jobs>, "jobId": <job id if provided>, "result": <job result>,
+         "elapsedSeconds": <job wall time>}
+    """
+    options = dict(options or {})
+    tps = tps or options.get("tps") or DEFAULT_OCR_TPS
+    max_concurrency = max_concurrency or options.get("maxConcurrency") or DEFAULT_MAX_CONCURRENCY
+
+    if "rateLimiter" not in options:
+        options["rateLimiter"] = TokenBucket(tps)
+
+    logging.info(f"Dispatching OCR batch at {tps} TPS with concurrency {max_concurrency}")
+
+    def timed_job(job):
+        started = time.monotonic()
+        try:
+            result = _run_job(job, options)
+        except Exception as e:
+            logging.error(f"OCR dispatch job failed: {e}")
+            result = {"success": False, "error": f"OCR dispatch job failed: {str(e)}"}
+        return result, time.monotonic() - started
+
+    job_iter = enumerate(jobs)
+    in_flight = {}
+    completed = 0
+    batch_started = time.monotonic()
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        def submit_next() -> bool:
+            try:
+                index, job = next(job_iter)
+            except StopIteration:
+                return False
+            job_id = job.get("id") if isinstance(job, dict) else None
+            in_flight[executor.submit(timed_job, job)] = (index, job_id)
+            return True
+
+        # Fill the pool, then top it up as jobs finish
+        for _ in range(max_concurrency):
+            if not submit_next():
+                break
+
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, job_id = in_flight.pop(future)
+                result, elapsed = future.result()
+                completed += 1
+                yield {
+                    "index": index,
+                    "jobId": job_id,
+                    "result": result,
+                    "elapsedSeconds": elapsed
+                }
+                submit_next()
+
+    total_seconds = time.monotonic() - batch_started
+    if completed:
+        logging.info(f"OCR batch complete: {completed} jobs in {total_seconds:.1f}s "
+                     f"({completed / total_seconds:.2f} jobs/s)")
@@ -0,0 +1,357 @@
+"""
+OCR Resilience: Request Hedging and Circuit Breaking
+
+Document Intelligence occasionally stalls on a single operation for tens of seconds.
+This module bounds tail latency for OCR calls:
+1. Hedging - if an analyze call runs longer than the observed p95 latency, a second
+   analyze is fired and whichever succeeds first is used
+2. Circuit breaking - after repeated endpoint failures, calls fail fast (or are read
+   by the local digit recognizer instead) until the endpoint has had time to recover
+3. Metrics - counters and latency percentiles for both, via get_resilience_metrics();
+   they are reported in a result's timings and by the ASGI app's /ready
+
+Hedging doubles the billed OCR calls of a slow request, so only the environment
+can turn it on; a request can opt out with 'hedgeRequests': False.
+
+Configuration:
+    OCR_HEDGING_ENABLED               Enable hedged requests (default false)
+    OCR_HEDGE_PERCENTILE              Latency percentile that triggers a hedge (default 95)
+    OCR_HEDGE_MIN_DELAY_SECONDS       Lower bound on the hedge delay (default 3)
+    OCR_HEDGE_MAX_DELAY_SECONDS       Upper bound on the hedge delay (default 30)
+    OCR_CIRCUIT_BREAKER_ENABLED       Enable the circuit breaker (default false)
+    OCR_BREAKER_FAILURE_THRESHOLD     Consecutive failures that open the breaker (default 5)
+    OCR_BREAKER_RESET_SECONDS         Seconds the breaker stays open before a trial call (default 30)
+    OCR_FALLBACK                      "none" to fail fast, "local" to try the local digit
+                                      recognizer while the breaker is open (default none)
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextvars import copy_context
+from typing import Any, Dict, List, Optional
+
+from shared_code.image_processor import (
+    RETRYABLE_STATUS_CODES,
+    analyze_image_with_direct_rest,
+    decode_base64_image,
+    local_ocr_enabled,
+)
+
+HEDGING_ENABLED = os.environ.get("OCR_HEDGING_ENABLED", "false").lower() == "true"
+HEDGE_PERCENTILE = float(os.environ.get("OCR_HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_DELAY_SECONDS = float(os.environ.get("OCR_HEDGE_MIN_DELAY_SECONDS", "3"))
+HEDGE_MAX_DELAY_SECONDS = float(os.environ.get("OCR_HEDGE_MAX_DELAY_SECONDS", "30"))
+BREAKER_ENABLED = os.environ.get("OCR_CIRCUIT_BREAKER_ENABLED", "false").lower() == "true"
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get("OCR_BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_SECONDS = float(os.environ.get("OCR_BREAKER_RESET_SECONDS", "30"))
+OCR_FALLBACK = os.environ.get("OCR_FALLBACK", "none").lower()
+
+# Need a minimum number of observations before trusting the percentile
+MIN_LATENCY_SAMPLES = 20
+
+
+class LatencyTracker:
+    """Rolling window of successful OCR latencies used to pick the hedge delay"""
+
+    def __init__(self, window_size: int = 200):
+        self._samples = deque(maxlen=window_size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        """Return the given percentile of recorded latencies, or None without enough data"""
+        with self._lock:
+            samples = sorted(self._samples)
+
+        if len(samples) < MIN_LATENCY_SAMPLES:
+            return None
+
+        index = min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))
+        return samples[index]
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "samples": len(self._samples),
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99)
+        }
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker
+
+    States:
+    - closed: calls flow normally, failures are counted
+    - open: calls are rejected until reset_seconds have passed
+    - half_open: a single trial call is allowed; success closes the breaker, failure reopens it
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state(time.monotonic())
+
+    def _current_state(self, now: float) -> str:
+        if self._state == self.OPEN and now - self._opened_at >= self.reset_seconds:
+            self._state = self.HALF_OPEN
+            self._trial_in_flight = False
+        return self._state
+
+    def allow_request(self) -> bool:
+        """Return True if a call may proceed"""
+        with self._lock:
+            state = self._current_state(time.monotonic())
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self._state != self.CLOSED:
+                logging.info("OCR circuit breaker closed after successful trial call")
+            self._state = self.CLOSED
+            self._consecutive_failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive_failures += 1
+            if self._state == self.HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logging.warning(f"OCR circuit breaker opened after {self._consecutive_failures} consecutive failures")
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+
+class ResilienceMetrics:
+    """Thread-safe counters for hedging and circuit breaker activity"""
+
+    COUNTERS = [
+        "requests",
+        "succeeded",
+        "failed",
+        "hedgesFired",
+        "hedgeWins",
+        "breakerRejections",
+        "fallbacks"
+    ]
+
+    def __init__(self):
+        self._counts = {name: 0 for name in self.COUNTERS}
+        self._lock = threading.Lock()
+
+    def increment(self, name: str, amount: int = 1):
+        with self._lock:
+            self._counts[name] = self._counts.get(name, 0) + amount
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counts)
+
+
+# Process-wide state shared by every request on this instance
+latency_tracker = LatencyTracker()
+circuit_breaker = CircuitBreaker(BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_SECONDS)
+metrics = ResilienceMetrics()
+_hedge_executor = ThreadPoolExecutor(max_workers=int(os.environ.get("OCR_HEDGE_WORKERS", "8")))
+
+
+def get_resilience_metrics() -> Dict[str, Any]:
+    """Return a snapshot of hedging and circuit breaker metrics"""
+    snapshot = metrics.snapshot()
+    snapshot["breakerState"] = circuit_breaker.state
+    snapshot["latency"] = latency_tracker.snapshot()
+    return snapshot
+
+
+def hedging_requested(options: Dict[str, Any]) -> bool:
+    """Whether this instance hedges (OCR_HEDGING_ENABLED) and the request hasn't opted out"""
+    return bool(HEDGING_ENABLED and options.get("hedgeRequests", True))
+
+
+def resilience_enabled(options: Dict[str, Any]) -> bool:
+    """Check whether hedging or circuit breaking applies to this request"""
+    return hedging_requested(options) or BREAKER_ENABLED
+
+
+def is_endpoint_failure(result: Dict) -> bool:
+    """
+    Decide whether a failed OCR result reflects an unhealthy endpoint
+
+    Throttling, server errors, timeouts and exceptions count against the breaker;
+    client errors such as a bad model id or missing credentials do not.
+    """
+    if result.get("success") or result.get("cancelled"):
+        return False
+    if result.get("timedOut") or "traceback" in result:
+        return True
+    return result.get("statusCode") in RETRYABLE_STATUS_CODES
+
+
+def get_hedge_delay() -> float:
+    """Hedge after the observed latency percentile, clamped to the configured bounds"""
+    observed = latency_tracker.percentile(HEDGE_PERCENTILE)
+    if observed is None:
+        return HEDGE_MAX_DELAY_SECONDS
+    return min(max(observed, HEDGE_MIN_DELAY_SECONDS), HEDGE_MAX_DELAY_SECONDS)
+
+
+def _read_locally(base64_image: str, options: Dict[str, Any]) -> Optional[Dict]:
+    # The local digit recognizer's result, or None if it can't read the screen confidently
+    from shared_code import pm_digit_recognizer
+
+    # run_ocr has already tried, and rejected, the local reading
+    if local_ocr_enabled(options):
+        return None
+    try:
+        screen = decode_base64_image(base64_image)
+        if screen is None:
+            return None
+        result = pm_digit_recognizer.recognize_monitor_screen(screen)
+    except Exception as e:
+        logging.warning(f"Local OCR fallback failed: {e}")
+        return None
+    min_confidence = options.get("localOcrMinConfidence", pm_digit_recognizer.LOCAL_OCR_MIN_CONFIDENCE)
+    if not result.get("success") or result["confidence"] < min_confidence:
+        return None
+    return result
+
+
+def _fallback_or_fail(base64_image: str, options: Dict[str, Any], reason: str) -> Dict:
+    # Never call the endpoint the breaker is protecting
+    if OCR_FALLBACK == "local":
+        result = _read_locally(base64_image, options)
+        if result is not None:
+            metrics.increment("fallbacks")
+            logging.warning(f"{reason}; read the screen with the local digit recognizer")
+            result["fallback"] = "local"
+            return result
+
+    return {
+        "success": False,
+        "error": f"{reason}. OCR is temporarily unavailable, please try again shortly.",
+        "circuitOpen": True
+    }
+
+
+def _analyze_hedged(base64_image: str, options: Dict[str, Any]) -> Dict:
+    """Run an analyze call, firing one hedge if it outlives the hedge delay"""
+    hedge_delay = get_hedge_delay()
+    cancel_events: List[threading.Event] = []
+
+    def start_attempt():
+        cancel_event = threading.Event()
+        cancel_events.append(cancel_event)
+        attempt_options = dict(options)
+        attempt_options["cancelEvent"] = cancel_event
+        # Run in a copy of the caller's context so the attempt's stages are timed
+        return _hedge_executor.submit(copy_context().run, analyze_image_with_direct_rest,
+                                      base64_image, attempt_options)
+
+    primary = start_attempt()
+    pending = {primary}
+    done, _ = wait(pending, timeout=hedge_delay)
+
+    hedge = None
+    if not done:
+        logging.info(f"OCR call exceeded hedge delay of {hedge_delay:.1f}s, firing hedged request")
+        metrics.increment("hedgesFired")
+        hedge = start_attempt()
+        pending.add(hedge)
+
+    result = None
+    winner = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                attempt_result = future.result()
+            except Exception as e:
+                attempt_result = {"success": False, "error": f"Hedged OCR attempt failed: {str(e)}"}
+            if attempt_result.get("success"):
+                result, winner = attempt_result, future
+                break
+            # Keep the first failure in case both attempts fail
+            if result is None:
+                result = attempt_result
+        if winner is not None:
+            break
+
+    # Stop polling for whichever attempt lost
+    for cancel_event in cancel_events:
+        cancel_event.set()
+
+    if winner is not None and winner is hedge:
+        metrics.increment("hedgeWins")
+
+    result["hedged"] = hedge is not None
+    return result
+
+
+def analyze_with_resilience(base64_image: str, options: Dict[str, Any]) -> Dict:
+    """
+    Analyze an image with hedging and circuit breaking applied as configured
+
+    Args:
+        base64_image: Base64-encoded image string
+        options: Processing options; "hedgeRequests": False opts out of hedging
+
+    Returns:
+        OCR result dictionary in the same shape as analyze_image_with_direct_rest,
+        plus "hedged", "circuitOpen" or "fallback" keys where applicable
+    """
+    metrics.increment("requests")
+
+    if BREAKER_ENABLED and not circuit_breaker.allow_request():
+        metrics.increment("breakerRejections")
+        return _fallback_or_fail(base64_image, options, "OCR circuit breaker is open")
+
+    started = time.monotonic()
+    if hedging_requested(options):
+        result = _analyze_hedged(base64_image, options)
+    else:
+        result = analyze_image_with_direct_rest(base64_image, options)
+    elapsed = time.monotonic() - started
+
+    if result.get("success"):
+        metrics.increment("succeeded")
+        latency_tracker.record(elapsed)
+        if BREAKER_ENABLED:
+            circuit_breaker.record_success()
+    else:
+        metrics.increment("failed")
+        if BREAKER_ENABLED:
+            if is_endpoint_failure(result):
+                circuit_breaker.record_failure()
+            else:
+                # The endpoint answered, the request itself was bad
+                circuit_breaker.record_success()
+
+    result["ocrLatencySeconds"] = elapsed
+    return result
@@ -0,0 +1,165 @@
+"""
+Indexed OCR Result View
+
+Builds a single read-only index over an OCR result's analyzeResult.documents[].fields.
+Every extractor (workout_parser.extract_document_fields / extract_tables and
+image_processor.extract_array_values / extract_fields_with_data) reads from the
+same view, so a result is walked once and the source dictionaries are never
+modified while cleaning values.
+"""
+
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Tuple, Union
+
+
+def clean_field_value(value: str) -> str:
+    """
+    Clean field values by fixing character encoding issues:
+    - Replace \u00a5 (¥) with 'r'
+    - Remove any non-printable characters
+    - Trim whitespace
+    """
+    if not value:
+        return ""
+
+    # Replace ¥ character with 'r'
+    cleaned = value.replace('\u00a5', 'r')
+
+    # Trim whitespace
+    cleaned = cleaned.strip()
+
+    return cleaned
+
+
+def _cell_text(cell: Dict[str, Any]) -> Union[str, None]:
+    """Return the cleaned text of a field or table cell, preferring content over valueString"""
+    if "content" in cell:
+        return clean_field_value(cell["content"])
+    if "valueString" in cell:
+        return clean_field_value(cell["valueString"])
+    return None
+
+
+class OcrArray:
+    """
+    Read-only array field
+
+    Attributes:
+        field_type: Declared field type
+        rows: Table rows - a read-only column -> text mapping for object items,
+              or the item text for simple content items
+        items: One (content text, column mapping) pair per item, either of which
+               may be None, for readers that prefer item content over objects
+    """
+
+    __slots__ = ("field_type", "rows", "items")
+
+    def __init__(self, field_type: str, rows: Tuple[Any, ...], items: Tuple[Tuple[Any, Any], ...]):
+        self.field_type = field_type
+        self.rows = rows
+        self.items = items
+
+
+class OcrResultView:
+    """
+    Immutable index over the document fields of an OCR result
+
+    Attributes:
+        fields: Field name -> cleaned text for every field with content or valueString
+        arrays: Field name -> OcrArray for every field with a valueArray
+        scalars: Field name -> cleaned text for non-array fields with content
+        raw_fields: Field name -> original field dictionary (read-only proxy)
+        field_types: Field name -> declared field type
+    """
+
+    __slots__ = ("fields", "arrays", "scalars", "raw_fields", "field_types")
+
+    def __init__(self, documents):
+        fields = {}
+        arrays = {}
+        scalars = {}
+        raw_fields = {}
+        field_types = {}
+
+        for doc in documents or []:
+            doc_fields = doc.get("fields") if isinstance(doc, dict) else None
+            if not doc_fields:
+                continue
+
+            for name, field in doc_fields.items():
+                if isinstance(field, str):
+                    # Some callers hand in flattened fields
+                    fields[name] = clean_field_value(field)
+                    scalars[name] = fields[name]
+                    field_types[name] = "string"
+                    continue
+                if not isinstance(field, dict):
+                    continue
+
+                raw_fields[name] = MappingProxyType(field)
+                field_type = field.get("type", "unknown")
+                field_types[name] = field_type
+
+                text = _cell_text(field)
+                if text is not None:
+                    fields[name] = text
+
+                if "valueArray" in field:
+                    arrays[name] = self._index_array(field_type, field["valueArray"])
+                elif "content" in field:
+                    scalars[name] = clean_field_value(field["content"])
+
+        self.fields = MappingProxyType(fields)
+        self.arrays = MappingProxyType(arrays)
+        self.scalars = MappingProxyType(scalars)
+        self.raw_fields = MappingProxyType(raw_fields)
+        self.field_types = MappingProxyType(field_types)
+
+    @staticmethod
+    def _index_array(field_type: str, values) -> OcrArray:
+        rows = []
+        items = []
+        for item in values or []:
+            if not isinstance(item, dict):
+                continue
+
+            content = clean_field_value(item["content"]) if "content" in item else None
+            columns = None
+            if "valueObject" in item:
+                row = {}
+                for col_name, col_data in item["valueObject"].items():
+                    if isinstance(col_data, dict):
+                        text = _cell_text(col_data)
+                        if text is not None:
+                            row[col_name] = text
+                columns = MappingProxyType(row)
+
+            items.append((content, columns))
+            if columns is not None:
+                rows.append(columns)
+            elif content is not None:
+                rows.append(content)
+
+        return OcrArray(field_type, tuple(rows), tuple(items))
+
+    @classmethod
+    def from_ocr_results(cls, ocr_results: Mapping[str, Any]) -> "OcrResultView":
+        """Build a view from an OCR result of the form {"results": {"analyzeResult": {...}}}"""
+        results = ocr_results.get("results") or {}
+        analyze_result = results.get("analyzeResult") or {}
+        return cls(analyze_result.get("documents"))
+
+    @classmethod
+    def of(cls, ocr_results: Union["OcrResultView", Mapping[str, Any]]) -> "OcrResultView":
+        """Return ocr_results if it is already a view, otherwise build one"""
+        if isinstance(ocr_results, cls):
+            return ocr_results
+        return cls.from_ocr_results(ocr_results or {})
+
+    def tables(self) -> Dict[str, list]:
+        """Return table fields (type "array") as plain, mutable lists of rows"""
+        return {
+            name: [dict(row) if isinstance(row, Mapping) else row for row in array.rows]
+            for name, array in self.arrays.items()
+            if array.field_type == "array"
+        }
@@ -0,0 +1,558 @@
+"""
+Workout Parser Benchmark
+
+Measures the workout parser on realistic OCR payloads and checks its output
+against golden results, so parser changes can be judged on numbers:
+1. Workouts are loaded from the db/ fixtures (Concept2 logbook exports)
+2. Each workout is turned into the analyzeResult payload the erg monitor model
+   would return for it, as one image and as overlapping multi-image variants
+3. parse_ocr_results, deduplicate_interval_tables, determine_interval_table_type
+   and merge_overlapping_rows are timed per case, with latency percentiles,
+   calls per second and allocation peaks (see perf_stats)
+4. Each case's parsed output is compared with the golden results file
+5. The column parser's reading of unit-suffixed and rest-prefixed cells is
+   compared with the baseline scalar parser's
+6. deduplicate_interval_tables is checked on hand-built tables: overlapping
+   images merge with or without NumIntervals, and near-identical consecutive
+   intervals in one image are kept
+
+The fixtures' raw_data is often cut off after its first 10KB, before the
+workout's interval/split detail. Rows for those records are rebuilt from the
+stroke samples that did survive.
+
+Usage:
+    python -m shared_code.parser_benchmark --db-dir db
+    python -m shared_code.parser_benchmark --db-dir db --update-golden
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+from shared_code.column_parser import parse_time_column
+from shared_code.interval_rows import parse_interval_rows
+from shared_code.ocr_view import OcrResultView
+from shared_code.perf_stats import benchmark
+from shared_code.table_merge import merge_overlapping_rows
+from shared_code.workout_parser import (
+    deduplicate_interval_tables, determine_interval_table_type, extract_document_fields,
+    extract_tables, parse_ocr_results
+)
+
+# Fixture files the benchmark corpus is built from
+BENCHMARK_FIXTURES = ("3x12min.json", "descendingvariable.json", "speedPyramid.json", "mutiple_workout_records.json")
+
+DEFAULT_DB_DIR = os.environ.get("OCR_BENCHMARK_DB_DIR", "db")
+DEFAULT_GOLDEN_PATH = os.environ.get(
+    "OCR_BENCHMARK_GOLDEN",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "parser_benchmark_golden.json")
+)
+
+# Images per case; multi-image cases repeat the header and the last rows of the previous image
+IMAGE_VARIANTS = (1, 2, 3)
+IMAGE_OVERLAP_ROWS = 2
+
+# The first record of each fixture also gets a long table, split over this many images
+LONG_TABLE_ROWS = 60
+LONG_TABLE_IMAGES = 4
+
+# Stroke samples per table row when rows are rebuilt from strokes
+STROKES_PER_ROW = 20
+
+# Default rest between intervals when the fixture doesn't record one (seconds)
+DEFAULT_REST_SECONDS = 60
+
+_STROKE_RE = re.compile(r'\{"d": (\d+), "p": \d+, "t": (\d+), "hr": \d+, "spm": (\d+)\}')
+
+TABLE_HEADER = {"time": "time", "meter": "meter", "split": "/500m", "spm": "s/m"}
+
+# Cells with unit suffixes and marker prefixes that the baseline scalar parser
+# (workout_parser.extract_time_value before the vectorized column parser) read
+# correctly; the column parser must read them the same way
+SCALAR_CHECK_CELLS = (
+    "500", "500m", "500 m", "500 Sec", "500Sec", "500 sec", "2,000m", "2,000 m", "5000 Meters",
+    "24", "24 spm", "18 s/m", "30 SPM", "r120", "1:45.0", "1:45.3", "30:00.0", "7:30"
+)
+
+
+def format_time(seconds: float, tenths: bool = True) -> str:
+    """Format seconds the way the monitor shows them (m:ss.t, h:mm:ss.t)"""
+    tenth_units = int(round(seconds * 10))
+    whole, tenth = divmod(tenth_units, 10)
+    hours, rest = divmod(whole, 3600)
+    minutes, secs = divmod(rest, 60)
+    text = f"{hours}:{minutes:02d}:{secs:02d}" if hours else f"{minutes}:{secs:02d}"
+    return f"{text}.{tenth}" if tenths else text
+
+
+def load_workouts(db_dir: str = DEFAULT_DB_DIR) -> List[Tuple[str, Dict[str, Any]]]:
+    """
+    Load workout records from the benchmark fixtures
+
+    Returns:
+        List of (case name, workout record) pairs
+    """
+    workouts = []
+    for filename in BENCHMARK_FIXTURES:
+        with open(os.path.join(db_dir, filename), "r") as f:
+            records = json.load(f)
+        stem = os.path.splitext(filename)[0]
+        for position, record in enumerate(records):
+            workouts.append((f"{stem}[{record.get('idx', position)}]", record))
+    return workouts
+
+
+def _is_interval(record: Dict[str, Any]) -> bool:
+    return "Interval" in (record.get("workout_name") or "")
+
+
+def _rows_from_workout(workout: Dict[str, Any]) -> List[Dict[str, Any]]:
+    rows = []
+    for item in workout.get("intervals") or workout.get("splits") or []:
+        rest = item.get("rest_time")
+        rows.append({
+            "seconds": item.get("time", 0) / 10.0,
+            "meters": item.get("distance", 0),
+            "spm": item.get("stroke_rate", 0),
+            "rest": rest / 10.0 if rest else None
+        })
+    return rows
+
+
+def _rows_from_strokes(raw_data: str, interval: bool) -> List[Dict[str, Any]]:
+    # Stroke samples carry cumulative tenths of a second and decimetres, and restart
+    # at zero with each interval
+    segments = []
+    previous_t = None
+    for d, t, spm in _STROKE_RE.findall(raw_data):
+        d, t, spm = int(d), int(t), int(spm)
+        if previous_t is None or t < previous_t:
+            segments.append([])
+        segments[-1].append((d, t, spm))
+        previous_t = t
+
+    rows = []
+    for segment in segments:
+        start_d, start_t = 0, 0
+        for offset in range(0, len(segment), STROKES_PER_ROW):
+            chunk = segment[offset:offset + STROKES_PER_ROW]
+            end_d, end_t = chunk[-1][0], chunk[-1][1]
+            rates = [spm for _, _, spm in chunk if spm]
+            rows.append({
+                "seconds": (end_t - start_t) / 10.0,
+                "meters": int(round((end_d - start_d) / 10.0)),
+                "spm": int(round(sum(rates) / len(rates))) if rates else 0,
+                "rest": DEFAULT_REST_SECONDS if interval else None
+            })
+            start_d, start_t = end_d, end_t
+    return [row for row in rows if row["seconds"] > 0 and row["meters"] > 0]
+
+
+def workout_rows(record: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Return a workout's table rows as {seconds, meters, spm, rest} dictionaries
+
+    Uses the recorded intervals/splits when raw_data is complete, otherwise the
+    stroke samples.
+    """
+    raw_data = record.get("raw_data") or ""
+    if isinstance(raw_data, dict):
+        return _rows_from_workout(raw_data.get("workout") or {})
+    try:
+        rows = _rows_from_workout(json.loads(raw_data).get("workout") or {})
+    except ValueError:
+        rows = []
+    return rows or _rows_from_strokes(raw_data, _is_interval(record))
+
+
+def _table_row(seconds: float, meters: float, spm: int) -> Dict[str, str]:
+    split = seconds * 500.0 / meters if meters else 0
+    return {"time": format_time(seconds), "meter": str(int(meters)), "split": format_time(split), "spm": str(spm)}
+
+
+def table_rows(record: Dict[str, Any], rows: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    """Render workout rows as the monitor table: header, totals row, then each row (and its rest)"""
+    total_seconds = sum(row["seconds"] for row in rows)
+    total_meters = sum(row["meters"] for row in rows)
+    rates = [row["spm"] for row in rows if row["spm"]]
+    table = [dict(TABLE_HEADER), _table_row(total_seconds, total_meters, int(round(sum(rates) / len(rates))) if rates else 0)]
+    for row in rows:
+        table.append(_table_row(row["seconds"], row["meters"], row["spm"]))
+        if row.get("rest"):
+            table.append({"time": f"r{format_time(row['rest'], tenths=False)}"})
+    return table
+
+
+def lengthen_rows(rows: List[Dict[str, Any]], count: int) -> List[Dict[str, Any]]:
+    """Repeat rows up to count, shifting each repeat so no two rows read the same"""
+    if not rows:
+        return rows
+    longer = []
+    for i in range(count):
+        row = dict(rows[i % len(rows)])
+        repeat = i // len(rows)
+        row["seconds"] += 0.3 * repeat
+        row["meters"] += 2 * repeat
+        longer.append(row)
+    return longer
+
+
+def split_into_images(table: List[Dict[str, str]], images: int,
+                      overlap: int = IMAGE_OVERLAP_ROWS) -> List[Dict[str, str]]:
+    """
+    Simulate a table photographed in several overlapping images and stitched
+
+    Each image after the first repeats the header and the last overlap rows of
+    the previous image.
+    """
+    if images <= 1 or len(table) <= 2:
+        return list(table)
+    header, data = table[0], table[1:]
+    size = -(-len(data) // images)
+    stitched = [header]
+    for start in range(0, len(data), size):
+        if start:
+            stitched.append(dict(header))
+            stitched.extend(dict(row) for row in data[max(start - overlap, 0):start])
+        stitched.extend(data[start:start + size])
+    return stitched
+
+
+def _string_field(text: str) -> Dict[str, Any]:
+    return {"type": "string", "content": text}
+
+
+def _table_field(rows: List[Dict[str, str]]) -> Dict[str, Any]:
+    return {
+        "type": "array",
+        "valueArray": [
+            {"type": "object", "valueObject": {key: _string_field(value) for key, value in row.items()}}
+            for row in rows
+        ]
+    }
+
+
+def _workout_title(record: Dict[str, Any], rows: List[Dict[str, Any]]) -> str:
+    name = record.get("workout_name") or ""
+    if name == "FixedTimeInterval" and rows:
+        rest = rows[0].get("rest") or DEFAULT_REST_SECONDS
+        return f"{len(rows)}x{format_time(rows[0]['seconds'], tenths=False)}/{format_time(rest, tenths=False)}r"
+    if name == "FixedDistanceInterval" and rows:
+        return f"{len(rows)}x{rows[0]['meters']}m"
+    if _is_interval(record):
+        return "Variable Interval"
+    if name == "FixedDistanceSplits":
+        return f"{int(record.get('distance_meters') or 0)}m"
+    return format_time(float(record.get("duration_seconds") or 0), tenths=False)
+
+
+def synthesize_ocr_result(record: Dict[str, Any], rows: List[Dict[str, Any]], images: int = 1) -> Dict[str, Any]:
+    """
+    Build the OCR result the erg monitor model would return for a workout
+
+    Returns:
+        {"success": True, "results": {"analyzeResult": {"documents": [...]}}}
+    """
+    interval = _is_interval(record)
+    table = split_into_images(table_rows(record, rows), images)
+    total_seconds = sum(row["seconds"] for row in rows)
+    total_meters = sum(row["meters"] for row in rows)
+
+    fields = {
+        "WorkoutTitle": _string_field(_workout_title(record, rows)),
+        "TotalTime": _string_field(format_time(total_seconds)),
+        "TotalDistance": _string_field(f"{int(total_meters)}m"),
+        "AverageSplit": _string_field(format_time(total_seconds * 500.0 / total_meters if total_meters else 0)),
+        "AverageStrokeRate": _string_field(str(record.get("average_stroke_rate") or 0)),
+    }
+    if interval:
+        table_field = "IntervalTable" if record.get("workout_name") != "VariableInterval" else "VariableIntervalTable"
+        fields["NumIntervals"] = _string_field(str(len(rows)))
+    else:
+        table_field = "StandardTable"
+    fields[table_field] = _table_field(table)
+
+    return {"success": True, "results": {"analyzeResult": {"documents": [{"docType": "erg", "fields": fields}]}}}
+
+
+def build_cases(db_dir: str = DEFAULT_DB_DIR) -> List[Dict[str, Any]]:
+    """
+    Build the benchmark corpus
+
+    Returns:
+        List of cases with name, images, interval flag and the OCR result payload
+    """
+    cases = []
+    seen_fixtures = set()
+    for name, record in load_workouts(db_dir):
+        rows = workout_rows(record)
+        if not rows:
+            logging.warning(f"No rows could be built for {name}, skipping")
+            continue
+        for images in IMAGE_VARIANTS:
+            cases.append({
+                "name": f"{name}/{images}img",
+                "images": images,
+                "interval": _is_interval(record),
+                "payload": synthesize_ocr_result(record, rows, images)
+            })
+        fixture = name.split("[")[0]
+        if fixture not in seen_fixtures:
+            seen_fixtures.add(fixture)
+            cases.append({
+                "name": f"{name}/long-{LONG_TABLE_IMAGES}img",
+                "images": LONG_TABLE_IMAGES,
+                "interval": _is_interval(record),
+                "payload": synthesize_ocr_result(record, lengthen_rows(rows, LONG_TABLE_ROWS), LONG_TABLE_IMAGES)
+            })
+    return cases
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, Mapping):
+        return dict(value)
+    return str(value)
+
+
+def output_summary(parsed: Dict[str, Any]) -> Dict[str, Any]:
+    """Summarize a parse result for golden comparison: workout type, table sizes and a digest"""
+    data = parsed.get("data") or {}
+    canonical = json.dumps(parsed, sort_keys=True, default=_json_default)
+    return {
+        "success": parsed.get("success"),
+        "workoutType": data.get("workoutType"),
+        "tableRows": {name: len(rows) for name, rows in sorted((data.get("tables") or {}).items())},
+        "digest": hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+    }
+
+
+def check_golden(cases: List[Dict[str, Any]], golden: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Compare each case's parse output with the golden results
+
+    Returns:
+        List of mismatches with case name, expected and actual summaries
+    """
+    mismatches = []
+    for case in cases:
+        actual = output_summary(parse_ocr_results(case["payload"]))
+        expected = golden.get(case["name"])
+        if expected != actual:
+            mismatches.append({"case": case["name"], "expected": expected, "actual": actual})
+    return mismatches
+
+
+def baseline_scalar_value(cell: Any) -> Optional[float]:
+    """Read a cell the way the baseline extract_time_value did: m:ss, else its digits and dots"""
+    value_str = str(cell)
+    if ":" in value_str:
+        try:
+            parts = value_str.split(":")
+            if len(parts) == 2:
+                return float(parts[0]) * 60 + float(parts[1])
+        except (ValueError, TypeError):
+            pass
+    clean_value = ''.join(c for c in value_str if c.isdigit() or c == '.')
+    return float(clean_value) if clean_value else None
+
+
+def check_scalar_parsing(cells: Sequence[str] = SCALAR_CHECK_CELLS) -> List[Dict[str, Any]]:
+    """
+    Compare the column parser with the baseline scalar parser on cells both should read
+
+    Returns:
+        List of mismatches with the cell, the baseline value and the parsed value
+    """
+    values, valid = parse_time_column(list(cells))
+    mismatches = []
+    for cell, value, ok in zip(cells, values.tolist(), valid.tolist()):
+        expected = baseline_scalar_value(cell)
+        parsed = value if ok else None
+        if expected is None or parsed is None or abs(expected - parsed) > 1e-6:
+            mismatches.append({"cell": cell, "baseline": expected, "parsed": parsed})
+    return mismatches
+
+
+def merge_check_cases() -> List[Dict[str, Any]]:
+    """
+    Tables whose deduplicated rows are known exactly
+
+    Returns:
+        Cases with name, fields, rows (the OCR table) and expected (the table
+        deduplicate_interval_tables must produce)
+    """
+    header = dict(TABLE_HEADER)
+    intervals = [_table_row(100.0 + 2 * i, 500, 24 + i) for i in range(6)]
+    two_images = [header] + intervals[0:4] + [dict(header)] + intervals[2:6]
+
+    # 4x500m in one image; the second interval differs from the first only in its stroke rate
+    repeats = [_table_row(105.0, 500, 28), _table_row(105.0, 500, 29),
+               _table_row(106.0, 500, 28), _table_row(107.0, 500, 27)]
+    one_image = [header] + repeats
+
+    return [
+        {"name": "two-images-no-count", "fields": {}, "rows": two_images, "expected": [header] + intervals},
+        {"name": "two-images-count", "fields": {"NumIntervals": "6"}, "rows": two_images,
+         "expected": [header] + intervals},
+        {"name": "one-image-4x500m-no-count", "fields": {}, "rows": one_image, "expected": one_image},
+        {"name": "one-image-4x500m-count", "fields": {"NumIntervals": "4"}, "rows": one_image,
+         "expected": one_image},
+    ]
+
+
+def check_overlap_merging(cases: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+    """
+    Run deduplicate_interval_tables on the merge check cases
+
+    Returns:
+        List of mismatches with the case name and the expected and actual tables
+    """
+    mismatches = []
+    for case in cases if cases is not None else merge_check_cases():
+        data = {"workoutType": "interval", "fields": dict(case["fields"]),
+                "tables": {"StandardTable": [dict(row) for row in case["rows"]]}}
+        actual = deduplicate_interval_tables(data)["tables"]["StandardTable"]
+        if actual != case["expected"]:
+            mismatches.append({"case": case["name"], "expected": case["expected"], "actual": actual})
+    return mismatches
+
+
+def golden_results(cases: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Return the golden summaries for the current parser output"""
+    return {case["name"]: output_summary(parse_ocr_results(case["payload"])) for case in cases}
+
+
+def _pre_dedupe_data(payload: Dict[str, Any]) -> Dict[str, Any]:
+    view = OcrResultView.of(payload)
+    return {"workoutType": "interval", "fields": extract_document_fields(view), "tables": extract_tables(view)}
+
+
+def _fresh_copy(data: Dict[str, Any]) -> Dict[str, Any]:
+    # deduplicate_interval_tables replaces table lists in place
+    return {**data, "tables": {name: list(rows) for name, rows in data["tables"].items()}}
+
+
+def _case_table(payload: Dict[str, Any]) -> Optional[List[Any]]:
+    tables = extract_tables(payload)
+    return next((rows for rows in tables.values() if rows), None)
+
+
+def run_benchmarks(cases: List[Dict[str, Any]], iterations: int = 20) -> Dict[str, Any]:
+    """
+    Time the parser functions on every case
+
+    Returns:
+        Function name -> {"all": stats, "<n>img": stats per image variant}, where
+        stats are perf_stats.benchmark results over the cases' combined samples
+    """
+    by_function: Dict[str, Dict[str, List[Dict[str, Any]]]] = {}
+
+    def record(function: str, case: Dict[str, Any], stats: Dict[str, Any]):
+        variant = "long" if "/long-" in case["name"] else f"{case['images']}img"
+        by_function.setdefault(function, {}).setdefault(variant, []).append(stats)
+
+    for case in cases:
+        payload = case["payload"]
+        record("parse_ocr_results", case, benchmark(parse_ocr_results, lambda: (payload,), iterations))
+
+        rows = _case_table(payload)
+        if rows:
+            parsed_rows = parse_interval_rows(rows)
+            record("determine_interval_table_type", case,
+                   benchmark(determine_interval_table_type, lambda: (rows,), iterations))
+            record("merge_overlapping_rows", case,
+                   benchmark(merge_overlapping_rows, lambda: (parsed_rows,), iterations))
+
+        if case["interval"]:
+            data = _pre_dedupe_data(payload)
+            record("deduplicate_interval_tables", case,
+                   benchmark(deduplicate_interval_tables, lambda: (_fresh_copy(data),), iterations))
+
+    return {function: _combine(variants) for function, variants in by_function.items()}
+
+
+def _combine(variants: Dict[str, List[Dict[str, Any]]]) -> Dict[str, Any]:
+    combined = {}
+    everything = []
+    for variant, results in sorted(variants.items()):
+        combined[variant] = _merge_stats(results)
+        everything.extend(results)
+    combined["all"] = _merge_stats(everything)
+    return combined
+
+
+def _merge_stats(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    # Per-case percentiles can't be merged exactly; report the median case's
+    # percentiles and the worst case's tail and allocation peak
+    ordered = sorted(results, key=lambda r: r["latency"].get("p50Ms", 0))
+    median = ordered[len(ordered) // 2]
+    rates = [r["callsPerSecond"] for r in results if r["callsPerSecond"]]
+    return {
+        "cases": len(results),
+        "callsPerSecond": round(len(rates) / sum(1.0 / rate for rate in rates), 1) if rates else None,
+        "medianCaseLatency": median["latency"],
+        "worstP99Ms": max(r["latency"].get("p99Ms", 0) for r in results),
+        "worstPeakKiB": max(r["allocations"]["peakKiB"] for r in results),
+        "maxRetainedKiB": max(r["allocations"]["retainedKiB"] for r in results)
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the workout parser on the db/ fixtures")
+    parser.add_argument("--db-dir", default=DEFAULT_DB_DIR, help="Directory holding the fixture JSON files")
+    parser.add_argument("--golden", default=DEFAULT_GOLDEN_PATH, help="Golden results JSON file")
+    parser.add_argument("--iterations", type=int, default=20, help="Timed calls per function and case")
+    parser.add_argument("--update-golden", action="store_true", help="Rewrite the golden results from the current parser")
+    parser.add_argument("--check-only", action="store_true", help="Only compare outputs with the golden results")
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    # The parser logs every classification decision at INFO
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    cases = build_cases(args.db_dir)
+
+    if args.update_golden:
+        with open(args.golden, "w") as f:
+            json.dump(golden_results(cases), f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Wrote golden results for {len(cases)} cases to {args.golden}")
+        return 0
+
+    if os.path.exists(args.golden):
+        with open(args.golden, "r") as f:
+            mismatches = check_golden(cases, json.load(f))
+    else:
+        mismatches = [{"case": None, "error": f"Golden results file {args.golden} not found"}]
+
+    scalar_mismatches = check_scalar_parsing()
+    merge_mismatches = check_overlap_merging()
+    report = {"cases": len(cases), "goldenMismatches": mismatches, "scalarMismatches": scalar_mismatches,
+              "mergeMismatches": merge_mismatches}
+    if not args.check_only:
+        report["functions"] = run_benchmarks(cases, args.iterations)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if mismatches:
+        print(f"{len(mismatches)} of {len(cases)} cases differ from the golden results", file=sys.stderr)
+    if scalar_mismatches:
+        print(f"{len(scalar_mismatches)} cells parse differently from the baseline scalar parser", file=sys.stderr)
+    if merge_mismatches:
+        print(f"{len(merge_mismatches)} merge check tables deduplicated wrongly", file=sys.stderr)
+    return 1 if mismatches or scalar_mismatches or merge_mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+"""
+Performance Statistics
+
+Small helpers for measuring pipeline code the same way everywhere:
+1. Latency percentiles from a list of samples
+2. Timed calls, with per-call argument setup kept out of the measurement
+3. Allocation peaks per call, measured in a separate pass under tracemalloc
+   so tracing overhead never shows up in the latency numbers
+"""
+
+import math
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+# Percentiles reported by latency_summary
+REPORTED_PERCENTILES = (50, 90, 99)
+
+
+def percentile(values: Sequence[float], pct: float) -> float:
+    """
+    Return the pct-th percentile of values, interpolating between samples
+
+    Args:
+        values: Samples in any order
+        pct: Percentile between 0 and 100
+
+    Returns:
+        The percentile, or NaN for no samples
+    """
+    if not values:
+        return math.nan
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100.0
+    low = int(math.floor(rank))
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def latency_summary(samples: Sequence[float]) -> Dict[str, Any]:
+    """
+    Summarize latency samples given in seconds
+
+    Returns:
+        Dictionary with count, meanMs, p50Ms, p90Ms, p99Ms and maxMs
+    """
+    summary = {"count": len(samples)}
+    if not samples:
+        return summary
+    summary["meanMs"] = round(1000.0 * sum(samples) / len(samples), 4)
+    for pct in REPORTED_PERCENTILES:
+        summary[f"p{pct}Ms"] = round(1000.0 * percentile(samples, pct), 4)
+    summary["maxMs"] = round(1000.0 * max(samples), 4)
+    return summary
+
+
+def time_calls(fn: Callable, make_args: Callable[[], Tuple], iterations: int, warmup: int = 1) -> List[float]:
+    """
+    Time repeated calls of fn
+
+    Args:
+        fn: Function under test
+        make_args: Returns a fresh argument tuple for each call; not timed
+        iterations: Number of timed calls
+        warmup: Untimed calls made first
+
+    Returns:
+        Per-call durations in seconds
+    """
+    for _ in range(warmup):
+        fn(*make_args())
+
+    samples = []
+    for _ in range(iterations):
+        args = make_args()
+        start = time.perf_counter()
+        fn(*args)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def measure_allocations(fn: Callable, make_args: Callable[[], Tuple], iterations: int = 5) -> Dict[str, float]:
+    """
+    Measure memory allocated by fn under tracemalloc
+
+    Returns:
+        Dictionary with peakKiB (largest traced peak of a single call) and
+        retainedKiB (memory still held after the last call, per call)
+    """
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+    try:
+        peak = 0
+        baseline = tracemalloc.get_traced_memory()[0]
+        for _ in range(iterations):
+            args = make_args()
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            fn(*args)
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - before)
+        retained = tracemalloc.get_traced_memory()[0] - baseline
+    finally:
+        if not was_tracing:
+            tracemalloc.stop()
+
+    return {
+        "peakKiB": round(peak / 1024.0, 2),
+        "retainedKiB": round(max(retained, 0) / 1024.0 / max(iterations, 1), 2)
+    }
+
+
+def benchmark(fn: Callable, make_args: Callable[[], Tuple], iterations: int,
+              warmup: int = 1, allocation_iterations: int = 5) -> Dict[str, Any]:
+    """
+    Time fn and measure its allocations
+
+    Returns:
+        Dictionary with callsPerSecond, latency (see latency_summary) and
+        allocations (see measure_allocations)
+    """
+    samples = time_calls(fn, make_args, iterations, warmup)
+    total = sum(samples)
+    return {
+        "callsPerSecond": round(len(samples) / total, 1) if total > 0 else None,
+        "latency": latency_summary(samples),
+        "allocations": measure_allocations(fn, make_args, allocation_iterations)
+    }
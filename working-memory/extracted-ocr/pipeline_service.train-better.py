@@ -0,0 +1,187 @@
+"""
+Pipeline Service
+
+Host-independent request handling for the erg image pipeline. Both the synchronous
+HTTP endpoint and the background job workers use these helpers so the request
+contract (defaults, validation, status codes) is defined in one place.
+"""
+
+import json
+import logging
+import os
+import traceback
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from shared_code.image_processor import DEFAULT_OCR_PROJECTION, iter_process_erg_images, process_erg_images
+from shared_code.single_flight import SingleFlight, submission_key
+
+# Load configuration from environment with defaults
+DEFAULT_MODEL_ID = os.environ.get("ERG_MONITOR_MODEL_ID", "erg-monitor-reader-v4")
+DEFAULT_API_VERSION = os.environ.get("AZURE_DOC_INTELLIGENCE_API_VERSION", "2024-11-30")
+DEFAULT_ENHANCE_READABILITY = os.environ.get("DEFAULT_ENHANCE_READABILITY", "true").lower() == "true"
+DEFAULT_STITCH_IMAGES = os.environ.get("DEFAULT_STITCH_IMAGES", "true").lower() == "true"
+COALESCE_DUPLICATE_REQUESTS = os.environ.get("COALESCE_DUPLICATE_REQUESTS", "true").lower() == "true"
+
+# Media type of newline-delimited JSON event streams
+NDJSON_MIMETYPE = "application/x-ndjson"
+
+# Identical submissions in flight on this instance share one pipeline run
+_pipeline_flight = SingleFlight()
+
+
+def build_pipeline_options(client_options: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Build processing options from the client's request options and environment defaults
+
+    Only recognized keys are copied, so clients can't inject runtime-only options
+    such as rate limiters or callbacks.
+    """
+    options = {
+        "modelId": client_options.get("modelId", DEFAULT_MODEL_ID),
+        "apiVersion": client_options.get("apiVersion", DEFAULT_API_VERSION),
+        "enhanceReadability": client_options.get("enhanceReadability", DEFAULT_ENHANCE_READABILITY),
+        "stitchImages": client_options.get("stitchImages", DEFAULT_STITCH_IMAGES),
+        "performOcr": client_options.get("performOcr", True),
+        "ocrProjection": client_options.get("ocrProjection", DEFAULT_OCR_PROJECTION)
+    }
+
+    # Hedging only happens where OCR_HEDGING_ENABLED allows it; clients can only opt out
+    if "hedgeRequests" in client_options:
+        options["hedgeRequests"] = bool(client_options["hedgeRequests"])
+
+    # Local digit recognition defaults to LOCAL_OCR_ENABLED unless the client asks otherwise
+    if "localOcr" in client_options:
+        options["localOcr"] = bool(client_options["localOcr"])
+
+    # Per-image partial results are produced whenever local OCR runs, unless turned off
+    if "partialResults" in client_options:
+        options["partialResults"] = bool(client_options["partialResults"])
+
+    # Per-stage memory figures default to OCR_MEMORY_TRACKING unless the client asks otherwise
+    if "memoryProfile" in client_options:
+        options["memoryProfile"] = bool(client_options["memoryProfile"])
+
+    # Per-stage timings default to OCR_TIMINGS_ENABLED unless the client asks otherwise
+    if "timings" in client_options:
+        options["timings"] = bool(client_options["timings"])
+
+    # Profiling capture only happens where OCR_PROFILING_ENABLED allows it
+    if "profile" in client_options:
+        options["profile"] = bool(client_options["profile"])
+
+    # Row dictionaries unless the client opts into columnar or Arrow tables
+    if "tableFormat" in client_options:
+        options["tableFormat"] = str(client_options["tableFormat"])
+
+    options["ocr"] = options["performOcr"]  # process_erg_images reads the 'ocr' flag
+    return options
+
+
+def validate_request_body(req_body: Any) -> Optional[str]:
+    """Return an error message if the request body is invalid, otherwise None"""
+    if not req_body or not isinstance(req_body, dict) or 'images' not in req_body:
+        return "Request must include 'images' array"
+
+    images = req_body.get('images', [])
+    if not isinstance(images, list) or len(images) == 0:
+        return "The 'images' field must be a non-empty array of base64 strings"
+
+    if 'options' in req_body and not isinstance(req_body['options'], dict):
+        return "The 'options' field must be a JSON object"
+
+    return None
+
+
+def unhandled_exception_body(e: Exception) -> Dict[str, Any]:
+    """Log an unexpected exception and return the 500 response body for it"""
+    trace = traceback.format_exc()
+    error_msg = f"Unhandled exception: {str(e)}"
+    logging.error(error_msg)
+    logging.error(f"Trace: {trace}")
+    return {"success": False, "error": error_msg, "trace": trace}
+
+
+def _profiling_requested(options: Dict[str, Any]) -> bool:
+    # profiling_capture loads cProfile, pstats and tracemalloc; only import it for
+    # requests that ask for a profile
+    if not options.get("profile"):
+        return False
+    from shared_code.profiling_capture import profiling_requested
+    return profiling_requested(options)
+
+
+def run_pipeline(images: List[str], options: Dict[str, Any],
+                 coalesce: bool = COALESCE_DUPLICATE_REQUESTS) -> Tuple[int, Dict[str, Any]]:
+    """
+    Run the image pipeline and map the outcome to an HTTP status code
+
+    With coalesce enabled, a submission identical to one already in flight waits
+    for that run and returns its result instead of processing the images again.
+    Requests with the 'profile' option (where profiling is enabled) are never
+    coalesced: they run under profiling_capture and get their own capture.
+
+    Returns:
+        Tuple of (status_code, result dictionary)
+    """
+    try:
+        logging.info(f"Processing {len(images)} images with OCR={options.get('ocr', True)}")
+        if _profiling_requested(options):
+            from shared_code.profiling_capture import capture_profile
+            result = capture_profile(process_erg_images, images, options)
+        elif coalesce:
+            key = submission_key(images, options)
+            result, _ = _pipeline_flight.do(key, lambda: process_erg_images(images, options))
+        else:
+            result = process_erg_images(images, options)
+
+        return _checked_result(result)
+
+    except Exception as e:
+        return 500, unhandled_exception_body(e)
+
+
+def _checked_result(result: Any) -> Tuple[int, Dict[str, Any]]:
+    # Check for processing errors - improved error handling
+    if not isinstance(result, dict):
+        error_msg = "Processing returned invalid result type"
+        logging.error(error_msg)
+        return 500, {"success": False, "error": error_msg}
+
+    # If success is explicitly False, return error
+    if result.get('success') is False:
+        logging.error(f"Processing error: {result.get('error', 'Unknown error')}")
+        return 500, result
+
+    logging.info('Processing completed successfully')
+    return 200, result
+
+
+def iter_pipeline_events(images: List[str], options: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """
+    Run the image pipeline, yielding its per-image and per-stage events as they happen
+
+    Events are those of image_processor.iter_process_erg_images. The final event is
+    {"event": "result", "statusCode": ..., "result": ...} with the same status code
+    and result run_pipeline would return. Streamed runs are not coalesced, since
+    each caller needs its own events.
+    """
+    try:
+        logging.info(f"Streaming {len(images)} images with OCR={options.get('ocr', True)}")
+        for event in iter_process_erg_images(images, options):
+            if event.get('event') == 'result':
+                status_code, result = _checked_result(event.get('result'))
+                yield {"event": "result", "statusCode": status_code, "result": result}
+                return
+            yield event
+
+        yield {"event": "result", "statusCode": 500,
+               "result": {"success": False, "error": "Processing ended without a result"}}
+
+    except Exception as e:
+        yield {"event": "result", "statusCode": 500, "result": unhandled_exception_body(e)}
+
+
+def ndjson_lines(events: Iterator[Dict[str, Any]]) -> Iterator[str]:
+    """Serialize events as newline-delimited JSON, one event per line"""
+    for event in events:
+        yield json.dumps(event) + "\n"
@@ -0,0 +1,403 @@
+"""
+Local PM Monitor Digit Recognizer
+
+Concept2 monitors draw results in a small fixed font laid out as a fixed table
+(time | meters | /500m | s/m), so most screens can be read without a cloud call:
+1. Binarize the rectified crop from process_detected_monitor and find text lines
+2. Segment each line into glyphs and classify them against rendered templates
+3. Group glyphs into tokens and match each line against the results-table layout
+4. Emit the same analyzeResult shape that workout_parser.parse_ocr_results consumes,
+   with per-field confidence: the summary (first) row becomes the total fields and
+   the rows below it the StandardTable
+
+Only digits are classified, so the title line ("4x500m", "2000m") is not read and
+no title or workout type field is produced; parse_ocr_results classifies local
+results from their table alone, and a single piece reads as single_distance.
+
+The classifier is a nearest-centroid model over normalized glyph bitmaps. Centroids
+are built from digits we render ourselves (several fonts, weights and a seven-segment
+style), or loaded from PM_GLYPH_TEMPLATES_PATH when trained on real monitor crops.
+Screens that don't read confidently should fall back to the cloud model.
+"""
+
+import logging
+import os
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+GLYPH_CLASSES = "0123456789"
+GLYPH_HEIGHT = 20
+GLYPH_WIDTH = 14
+
+LOCAL_OCR_ENABLED = os.environ.get("LOCAL_OCR_ENABLED", "false").lower() == "true"
+LOCAL_OCR_MIN_CONFIDENCE = float(os.environ.get("LOCAL_OCR_MIN_CONFIDENCE", "0.85"))
+GLYPH_TEMPLATES_PATH = os.environ.get("PM_GLYPH_TEMPLATES_PATH")
+
+# Column layout of the monitor's results table, left to right
+TABLE_COLUMNS = [
+    ("Time", re.compile(r"^\d{1,2}:\d{2}(:\d{2})?(\.\d)?$")),
+    ("Meter", re.compile(r"^\d{2,6}$")),
+    ("Split", re.compile(r"^\d{1,2}:\d{2}\.\d$")),
+    ("SPM", re.compile(r"^\d{2}$")),
+]
+
+# Summary (first) row of the results table maps to the model's scalar fields
+SUMMARY_FIELDS = {
+    "Time": "TotalTime",
+    "Meter": "TotalDistance",
+    "Split": "AverageSplit",
+    "SPM": "AverageStrokeRate",
+}
+
+_SEVEN_SEGMENT_DIGITS = {
+    # Segments: top, top-right, bottom-right, bottom, bottom-left, top-left, middle
+    "0": "1111110", "1": "0110000", "2": "1101101", "3": "1111001", "4": "0110011",
+    "5": "1011011", "6": "1011111", "7": "1110000", "8": "1111111", "9": "1111011",
+}
+
+
+def normalize_glyph(mask: np.ndarray) -> np.ndarray:
+    """
+    Fit a binary glyph into a fixed-size, fixed-aspect box
+
+    The glyph is centred in a box with the template aspect ratio before resizing,
+    so narrow glyphs such as '1' keep their shape instead of being stretched.
+    """
+    h, w = mask.shape[:2]
+    target_aspect = GLYPH_WIDTH / GLYPH_HEIGHT
+    box_h = max(h, int(np.ceil(w / target_aspect)))
+    box_w = max(w, int(np.ceil(box_h * target_aspect)))
+
+    box = np.zeros((box_h, box_w), dtype=np.uint8)
+    y0 = (box_h - h) // 2
+    x0 = (box_w - w) // 2
+    box[y0:y0 + h, x0:x0 + w] = mask
+
+    resized = cv2.resize(box, (GLYPH_WIDTH, GLYPH_HEIGHT), interpolation=cv2.INTER_AREA)
+    vector = resized.astype(np.float32).ravel()
+    vector -= vector.mean()
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+def _crop_to_ink(mask: np.ndarray) -> Optional[np.ndarray]:
+    ys, xs = np.nonzero(mask)
+    if len(xs) == 0:
+        return None
+    return mask[ys.min():ys.max() + 1, xs.min():xs.max() + 1]
+
+
+def _render_font_glyph(char: str, font: int, thickness: int) -> Optional[np.ndarray]:
+    canvas = np.zeros((80, 60), dtype=np.uint8)
+    cv2.putText(canvas, char, (8, 62), font, 1.8, 255, thickness, cv2.LINE_AA)
+    _, canvas = cv2.threshold(canvas, 127, 255, cv2.THRESH_BINARY)
+    return _crop_to_ink(canvas)
+
+
+def _render_seven_segment_glyph(char: str, thickness: int) -> Optional[np.ndarray]:
+    canvas = np.zeros((80, 50), dtype=np.uint8)
+    left, right, top, mid, bottom = 8, 40, 6, 38, 70
+    segments = [
+        ((left, top), (right, top)),
+        ((right, top), (right, mid)),
+        ((right, mid), (right, bottom)),
+        ((left, bottom), (right, bottom)),
+        ((left, mid), (left, bottom)),
+        ((left, top), (left, mid)),
+        ((left, mid), (right, mid)),
+    ]
+    for lit, (start, end) in zip(_SEVEN_SEGMENT_DIGITS[char], segments):
+        if lit == "1":
+            cv2.line(canvas, start, end, 255, thickness)
+    return _crop_to_ink(canvas)
+
+
+def render_training_samples() -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Render labeled digit samples in the styles monitor fonts resemble
+
+    Returns:
+        Tuple of (normalized glyph vectors, class indices)
+    """
+    fonts = [cv2.FONT_HERSHEY_SIMPLEX, cv2.FONT_HERSHEY_DUPLEX, cv2.FONT_HERSHEY_PLAIN]
+    vectors = []
+    labels = []
+
+    for label, char in enumerate(GLYPH_CLASSES):
+        for font in fonts:
+            for thickness in (2, 3, 4):
+                glyph = _render_font_glyph(char, font, thickness)
+                if glyph is not None:
+                    vectors.append(normalize_glyph(glyph))
+                    labels.append(label)
+        for thickness in (4, 6, 8):
+            glyph = _render_seven_segment_glyph(char, thickness)
+            if glyph is not None:
+                vectors.append(normalize_glyph(glyph))
+                labels.append(label)
+
+    return np.array(vectors, dtype=np.float32), np.array(labels, dtype=np.int32)
+
+
+def train_glyph_templates(vectors: np.ndarray, labels: np.ndarray, per_class: int = 4) -> Dict[str, np.ndarray]:
+    """
+    Build a small nearest-centroid model from labeled glyph vectors
+
+    Each class keeps up to `per_class` centroids (k-means within the class), which
+    covers stylistic variants like plain vs seven-segment digits.
+
+    Returns:
+        Dictionary with "centroids" (N x D) and "labels" (N) arrays
+    """
+    centroids = []
+    centroid_labels = []
+
+    for label in np.unique(labels):
+        samples = vectors[labels == label]
+        k = min(per_class, len(samples))
+        if k > 1:
+            criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 50, 1e-4)
+            _, _, centers = cv2.kmeans(samples, k, None, criteria, 5, cv2.KMEANS_PP_CENTERS)
+        else:
+            centers = samples
+
+        for center in centers:
+            center = center - center.mean()
+            norm = np.linalg.norm(center)
+            centroids.append(center / norm if norm > 0 else center)
+            centroid_labels.append(label)
+
+    return {
+        "centroids": np.array(centroids, dtype=np.float32),
+        "labels": np.array(centroid_labels, dtype=np.int32)
+    }
+
+
+def save_glyph_templates(templates: Dict[str, np.ndarray], path: str):
+    """Save trained templates so they can be loaded via PM_GLYPH_TEMPLATES_PATH"""
+    np.savez_compressed(path, centroids=templates["centroids"], labels=templates["labels"])
+
+
+@lru_cache(maxsize=1)
+def get_glyph_templates() -> Dict[str, np.ndarray]:
+    """Load trained templates if configured, otherwise train on rendered samples (cached)"""
+    if GLYPH_TEMPLATES_PATH and os.path.exists(GLYPH_TEMPLATES_PATH):
+        data = np.load(GLYPH_TEMPLATES_PATH)
+        return {"centroids": data["centroids"], "labels": data["labels"]}
+
+    vectors, labels = render_training_samples()
+    return train_glyph_templates(vectors, labels)
+
+
+def classify_glyph(mask: np.ndarray) -> Tuple[str, float]:
+    """
+    Classify a binary digit glyph
+
+    Returns:
+        Tuple of (character, confidence). Confidence combines the correlation with the
+        best centroid and its margin over the best centroid of any other class.
+    """
+    templates = get_glyph_templates()
+    scores = templates["centroids"] @ normalize_glyph(mask)
+
+    best = int(np.argmax(scores))
+    best_label = templates["labels"][best]
+    best_score = float(scores[best])
+    other_scores = scores[templates["labels"] != best_label]
+    runner_up = float(other_scores.max()) if len(other_scores) else -1.0
+
+    # Correlations above ~0.8 are solid matches; a margin under ~0.1 means two classes look alike
+    match_strength = min(1.0, max(0.0, (best_score - 0.4) / 0.4))
+    separation = min(1.0, max(0.0, best_score - runner_up) / 0.1)
+    return GLYPH_CLASSES[best_label], match_strength * separation
+
+
+def binarize_screen(image: np.ndarray) -> np.ndarray:
+    """Binarize a monitor crop so the characters are white on black"""
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+
+    # Characters cover much less of the screen than the background
+    if np.count_nonzero(binary) > binary.size / 2:
+        binary = cv2.bitwise_not(binary)
+    return binary
+
+
+def find_text_lines(binary: np.ndarray) -> List[Tuple[int, int]]:
+    """Find horizontal bands that contain text, using the row ink profile"""
+    h, w = binary.shape[:2]
+    profile = np.count_nonzero(binary, axis=1)
+    has_ink = profile > max(2, w * 0.005)
+
+    lines = []
+    start = None
+    for y, ink in enumerate(has_ink):
+        if ink and start is None:
+            start = y
+        elif not ink and start is not None:
+            lines.append((start, y))
+            start = None
+    if start is not None:
+        lines.append((start, h))
+
+    # Ignore specks and tall non-text regions such as borders
+    return [(y0, y1) for y0, y1 in lines if h * 0.02 <= y1 - y0 <= h * 0.25]
+
+
+def _line_glyphs(line: np.ndarray) -> List[Dict[str, Any]]:
+    """Segment a text line into glyph boxes, merging stacked parts like ':'"""
+    line_h = line.shape[0]
+    count, _, stats, _ = cv2.connectedComponentsWithStats(line, connectivity=8)
+
+    boxes = []
+    for i in range(1, count):
+        x, y, w, h, area = stats[i]
+        if area < 2:
+            continue
+        boxes.append([x, y, x + w, y + h])
+    boxes.sort(key=lambda b: b[0])
+
+    # Merge components that overlap horizontally (the two dots of ':')
+    merged = []
+    for box in boxes:
+        if merged and box[0] < merged[-1][2] - 1 and min(box[2], merged[-1][2]) - box[0] > 0.5 * (box[2] - box[0]):
+            last = merged[-1]
+            last[4] += 1
+            last[0:4] = [min(last[0], box[0]), min(last[1], box[1]), max(last[2], box[2]), max(last[3], box[3])]
+        else:
+            merged.append(box + [1])
+
+    glyphs = []
+    for x0, y0, x1, y1, parts in merged:
+        glyph_h = y1 - y0
+        glyph_w = x1 - x0
+        if glyph_h < line_h * 0.45:
+            # Small marks: a single one low in the line is a decimal point
+            if parts == 1 and y0 > line_h * 0.55 and glyph_w < line_h * 0.4:
+                glyphs.append({"char": ".", "confidence": 0.95, "x0": x0, "x1": x1})
+            continue
+        if parts == 2 and glyph_w < line_h * 0.4 and glyph_h < line_h * 0.9:
+            glyphs.append({"char": ":", "confidence": 0.95, "x0": x0, "x1": x1})
+            continue
+
+        char, confidence = classify_glyph(line[y0:y1, x0:x1])
+        glyphs.append({"char": char, "confidence": confidence, "x0": x0, "x1": x1})
+
+    return glyphs
+
+
+def _group_tokens(glyphs: List[Dict[str, Any]], line_h: int) -> List[Dict[str, Any]]:
+    """Group glyphs into whitespace-separated tokens"""
+    tokens = []
+    gap_threshold = line_h * 0.6
+    for glyph in glyphs:
+        if tokens and glyph["x0"] - tokens[-1]["x1"] <= gap_threshold:
+            token = tokens[-1]
+            token["text"] += glyph["char"]
+            token["confidence"] = min(token["confidence"], glyph["confidence"])
+            token["x1"] = glyph["x1"]
+        else:
+            tokens.append({
+                "text": glyph["char"],
+                "confidence": glyph["confidence"],
+                "x0": glyph["x0"],
+                "x1": glyph["x1"]
+            })
+    return tokens
+
+
+def read_table_rows(image: np.ndarray) -> List[Dict[str, Dict[str, Any]]]:
+    """
+    Read results-table rows from a monitor crop
+
+    Returns:
+        List of rows, each mapping column name to {"content", "confidence"}. Only lines
+        whose tokens match the time | meters | /500m | s/m layout are returned.
+    """
+    binary = binarize_screen(image)
+    rows = []
+
+    for y0, y1 in find_text_lines(binary):
+        line = binary[y0:y1]
+        tokens = _group_tokens(_line_glyphs(line), y1 - y0)
+        if len(tokens) != len(TABLE_COLUMNS):
+            continue
+
+        row = {}
+        for (column, pattern), token in zip(TABLE_COLUMNS, tokens):
+            if not pattern.match(token["text"]):
+                break
+            row[column] = {"content": token["text"], "confidence": round(token["confidence"], 3)}
+        else:
+            rows.append(row)
+
+    return rows
+
+
+def recognize_monitor_screen(image: np.ndarray) -> Dict[str, Any]:
+    """
+    Read a rectified monitor crop locally and build a Document Intelligence style result
+
+    Returns:
+        OCR result dictionary compatible with parse_ocr_results:
+        {"success": True, "source": "local", "confidence": <min field confidence>,
+         "results": {"analyzeResult": {"documents": [{"fields": {...}}]}}}
+        The first row fills the summary fields and any further rows the
+        StandardTable; there is no title field. success is False when no table
+        rows could be read.
+    """
+    try:
+        rows = read_table_rows(image)
+    except Exception as e:
+        logging.error(f"Local monitor recognition failed: {e}")
+        return {"success": False, "source": "local", "confidence": 0.0, "error": str(e)}
+
+    if not rows:
+        return {"success": False, "source": "local", "confidence": 0.0,
+                "error": "No results table rows recognized"}
+
+    summary, table_rows = rows[0], rows[1:]
+    fields = {}
+    for column, cell in summary.items():
+        fields[SUMMARY_FIELDS[column]] = {
+            "type": "string",
+            "content": cell["content"],
+            "confidence": cell["confidence"]
+        }
+
+    if table_rows:
+        fields["StandardTable"] = {
+            "type": "array",
+            "valueArray": [
+                {
+                    "type": "object",
+                    "valueObject": {
+                        column: {"type": "string", "content": cell["content"], "confidence": cell["confidence"]}
+                        for column, cell in row.items()
+                    }
+                }
+                for row in table_rows
+            ],
+            "confidence": min(cell["confidence"] for row in table_rows for cell in row.values())
+        }
+
+    confidence = min(field["confidence"] for field in fields.values())
+    return {
+        "success": True,
+        "source": "local",
+        "confidence": confidence,
+        "results": {
+            "analyzeResult": {
+                "modelId": "local-pm-digits",
+                "documents": [{
+                    "docType": "local-pm-digits",
+                    "confidence": confidence,
+                    "fields": fields
+                }]
+            }
+        }
+    }
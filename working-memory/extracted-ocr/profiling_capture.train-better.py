@@ -0,0 +1,232 @@
+"""
+Per-Request Profiling Capture
+
+Lets a pathological request be diagnosed from production traffic without a redeploy:
+1. A request with the 'profile' option runs the pipeline under cProfile and
+   tracemalloc, provided profiling is enabled on the instance (OCR_PROFILING_ENABLED)
+2. The capture is written to its own directory under OCR_PROFILE_DIR:
+   - profile.pstats   cProfile stats, for pstats, snakeviz and similar tools
+   - profile.txt      the top functions by cumulative time
+   - allocations.txt  the largest allocation sites, taken at the stage boundary
+                      with the most traced memory
+   - capture.json     manifest with the input image hashes, options, wall and CPU
+                      time, peak traced memory and the outcome
+3. The response carries a 'profileCapture' pointer ({captureId, path})
+
+cProfile only sees the calling thread, so profiled requests preprocess their
+images sequentially. One capture runs at a time per process; a request asking for
+a profile while another is being captured runs unprofiled. Submitted images are
+only hashed, unless OCR_PROFILE_KEEP_IMAGES is set.
+
+Configuration:
+    OCR_PROFILING_ENABLED       Honor the 'profile' request option (default false)
+    OCR_PROFILE_DIR             Directory captures are written to (default <tmp>/ocr-profiles)
+    OCR_PROFILE_KEEP_IMAGES     Also save the submitted images with the capture (default false)
+    OCR_PROFILE_TOP_ENTRIES     Functions and allocation sites listed (default 40)
+"""
+
+import base64
+import binascii
+import cProfile
+import hashlib
+import io
+import json
+import logging
+import os
+import pstats
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from shared_code.memory_tracker import acquire_tracemalloc, release_tracemalloc
+
+PROFILING_ENABLED = os.environ.get("OCR_PROFILING_ENABLED", "false").lower() == "true"
+PROFILE_DIR = os.environ.get("OCR_PROFILE_DIR") or os.path.join(tempfile.gettempdir(), "ocr-profiles")
+KEEP_IMAGES = os.environ.get("OCR_PROFILE_KEEP_IMAGES", "false").lower() == "true"
+TOP_ENTRIES = int(os.environ.get("OCR_PROFILE_TOP_ENTRIES", "40"))
+
+# Options never written to a capture manifest
+_SECRET_OPTIONS = {"key"}
+
+# Allocation sites that belong to the capture machinery, not the pipeline
+_ALLOCATION_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+_capture_lock = threading.Lock()
+
+
+def profiling_requested(options: Dict[str, Any]) -> bool:
+    """Whether a request asks for a profile and this instance allows it"""
+    return bool(PROFILING_ENABLED and options.get("profile"))
+
+
+def _image_bytes(image: str) -> bytes:
+    # The bytes decode_base64_image would decode, or the string itself if it isn't base64
+    if ',' in image:
+        image = image.split(',')[1]
+    try:
+        return base64.b64decode(image)
+    except (binascii.Error, ValueError):
+        return image.encode("utf-8")
+
+
+def _image_extension(data: bytes) -> str:
+    if data[:2] == b"\xff\xd8":
+        return ".jpg"
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return ".png"
+    return ".bin"
+
+
+def image_hashes(images: List[str]) -> List[str]:
+    """Return the SHA-256 hex digest of each image's decoded bytes"""
+    return [hashlib.sha256(_image_bytes(image)).hexdigest() for image in images]
+
+
+def _manifest_options(options: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        key: value for key, value in options.items()
+        if key not in _SECRET_OPTIONS and isinstance(value, (str, int, float, bool, type(None)))
+    }
+
+
+def _top_allocations(snapshot: Optional[tracemalloc.Snapshot]) -> List[tracemalloc.Statistic]:
+    if snapshot is None:
+        return []
+    return snapshot.filter_traces(_ALLOCATION_FILTERS).statistics("lineno")[:TOP_ENTRIES]
+
+
+def _write_capture(capture_dir: str, profiler: cProfile.Profile, peak: Dict[str, Any],
+                   manifest: Dict[str, Any], images: List[str]):
+    profiler.dump_stats(os.path.join(capture_dir, "profile.pstats"))
+
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(TOP_ENTRIES)
+    with open(os.path.join(capture_dir, "profile.txt"), "w") as f:
+        f.write(stream.getvalue())
+
+    allocations = _top_allocations(peak["snapshot"])
+    with open(os.path.join(capture_dir, "allocations.txt"), "w") as f:
+        f.write(f"Traced memory at stage '{peak['stage']}': {peak['traced'] / 1024.0:.1f} KiB\n\n")
+        for stat in allocations:
+            f.write(f"{stat}\n")
+    manifest["topAllocations"] = [
+        {"site": str(stat.traceback), "sizeKiB": round(stat.size / 1024.0, 1), "count": stat.count}
+        for stat in allocations[:10]
+    ]
+
+    if KEEP_IMAGES:
+        for index, image in enumerate(images):
+            data = _image_bytes(image)
+            with open(os.path.join(capture_dir, f"image-{index + 1}{_image_extension(data)}"), "wb") as f:
+                f.write(data)
+
+    with open(os.path.join(capture_dir, "capture.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+        f.write("\n")
+
+
+def capture_profile(run: Callable[[List[str], Dict[str, Any]], Dict[str, Any]],
+                    images: List[str], options: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Run the pipeline under cProfile and tracemalloc and save a capture
+
+    Args:
+        run: Called as run(images, options); returns the pipeline result dictionary
+        images: Base64-encoded images
+        options: Processing options
+
+    Returns:
+        run's result with 'profileCapture' ({captureId, path, wallSeconds, cpuSeconds})
+        added, or 'profileSkipped' with the reason if no capture was made
+    """
+    if not _capture_lock.acquire(blocking=False):
+        logging.warning("A profiling capture is already running, processing request unprofiled")
+        result = run(images, options)
+        if isinstance(result, dict):
+            result["profileSkipped"] = "Another profiling capture was in progress"
+        return result
+
+    try:
+        capture_id = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}-{uuid.uuid4().hex[:8]}"
+        capture_dir = os.path.join(PROFILE_DIR, capture_id)
+        peak = {"traced": -1, "stage": None, "snapshot": None}
+        user_callback = options.get("progressCallback")
+
+        def sample(stage: str):
+            traced, _ = tracemalloc.get_traced_memory()
+            if traced > peak["traced"]:
+                peak.update(traced=traced, stage=stage, snapshot=tracemalloc.take_snapshot())
+
+        def on_progress(stage: str, details: Dict[str, Any]):
+            sample(stage)
+            if user_callback is not None:
+                user_callback(stage, details)
+
+        profiled_options = dict(options, parallelPreprocessing=False, progressCallback=on_progress)
+        profiler = cProfile.Profile()
+        result = None
+        error = None
+
+        acquire_tracemalloc()
+        try:
+            tracemalloc.reset_peak()
+            wall_started = time.perf_counter()
+            cpu_started = time.process_time()
+            profiler.enable()
+            try:
+                result = run(images, profiled_options)
+            except Exception as e:
+                error = e
+            finally:
+                profiler.disable()
+            wall_seconds = time.perf_counter() - wall_started
+            cpu_seconds = time.process_time() - cpu_started
+            sample("end")
+            _, traced_peak = tracemalloc.get_traced_memory()
+        finally:
+            release_tracemalloc()
+
+        manifest = {
+            "captureId": capture_id,
+            "createdAt": datetime.now(timezone.utc).isoformat(),
+            "imageHashes": image_hashes(images),
+            "imagesSaved": KEEP_IMAGES,
+            "options": _manifest_options(options),
+            "wallSeconds": round(wall_seconds, 3),
+            "cpuSeconds": round(cpu_seconds, 3),
+            "peakTracedKiB": round(traced_peak / 1024.0, 1),
+            "success": bool(isinstance(result, dict) and result.get("success")),
+            "error": str(error) if error is not None else (result or {}).get("error")
+        }
+
+        try:
+            os.makedirs(capture_dir, exist_ok=True)
+            _write_capture(capture_dir, profiler, peak, manifest, images)
+            logging.info(f"Saved profiling capture {capture_id} to {capture_dir} "
+                         f"({wall_seconds:.2f}s wall, {cpu_seconds:.2f}s CPU)")
+            pointer = {"captureId": capture_id, "path": capture_dir,
+                       "wallSeconds": manifest["wallSeconds"], "cpuSeconds": manifest["cpuSeconds"]}
+        except OSError as e:
+            logging.warning(f"Could not save profiling capture {capture_id}: {e}")
+            pointer = None
+
+        if error is not None:
+            raise error
+
+        if isinstance(result, dict):
+            if pointer:
+                result["profileCapture"] = pointer
+            else:
+                result["profileSkipped"] = "The capture could not be saved"
+        return result
+    finally:
+        _capture_lock.release()
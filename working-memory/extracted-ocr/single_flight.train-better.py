@@ -0,0 +1,112 @@
+"""
+Single-Flight Request Coalescing
+
+When the mobile app retries after a client-side timeout, the same images arrive
+while the first request is still running. Instead of processing (and paying for)
+the same OCR twice, duplicate requests attach to the in-flight computation and
+all receive its result.
+
+Requests are keyed by a content hash of the images and the processing options.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Tuple
+
+# Option values of these types describe the request; anything else (callbacks,
+# rate limiters, cancel events) is runtime plumbing and is left out of the key
+_KEY_VALUE_TYPES = (str, int, float, bool, type(None), list, dict)
+
+
+def submission_key(images: List[str], options: Dict[str, Any]) -> str:
+    """
+    Build a content hash identifying a submission
+
+    Args:
+        images: Base64-encoded images
+        options: Processing options
+
+    Returns:
+        Hex digest that is equal for identical images and options
+    """
+    digest = hashlib.sha256()
+    for image in images:
+        digest.update(hashlib.sha256(image.encode("utf-8") if isinstance(image, str) else image).digest())
+
+    key_options = {k: v for k, v in options.items() if isinstance(v, _KEY_VALUE_TYPES)}
+    digest.update(json.dumps(key_options, sort_keys=True, default=str).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Run at most one computation per key at a time
+
+    The first caller for a key runs the function; callers arriving while it runs
+    wait for it and receive the same result (or exception). Once the computation
+    finishes the key is released, so later calls run fresh.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+        self._coalesced = 0
+
+    @property
+    def coalesced_count(self) -> int:
+        """Number of calls that were served by another caller's computation"""
+        with self._lock:
+            return self._coalesced
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Run fn for key, or wait for the in-flight run of the same key
+
+        Returns:
+            Tuple of (result, shared) where shared is True if the result came from
+            a computation started by another caller. Shared results are the same
+            object for every caller and must be treated as read-only.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self._coalesced += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                leader = True
+
+        if not leader:
+            logging.info(f"Coalescing duplicate submission {key[:12]} into in-flight request")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+            if call.waiters:
+                logging.info(f"Submission {key[:12]} served {call.waiters} duplicate request(s)")
+
+        return call.result, call.waiters > 0
@@ -0,0 +1,210 @@
+"""
+Table Output Formats
+
+parsedData tables are returned as lists of row dictionaries by default. For long
+interval workouts that repeats every column name on every row and leaves clients
+to re-parse each value, so the 'tableFormat' option selects the encoding:
+1. "rows"      - the default list of row dictionaries of strings
+2. "columnar"  - column name -> list of typed values, plus a validity mask
+3. "arrow"     - the columnar table as Arrow IPC stream bytes, base64-encoded
+                 (requires pyarrow; falls back to "columnar" without it)
+
+Typed values are seconds for time and split columns, meters for distance columns
+and plain numbers otherwise. The header row is kept, as is the original text of
+any cell that couldn't be read or carries more than its number (a rest "r"
+prefix, a unit), so no OCR output is lost. Each row is also flagged as a rest
+row or not, since a rest cell's value alone looks like a work interval's.
+"""
+
+import base64
+import logging
+import os
+import re
+from functools import lru_cache
+from typing import Any, Dict, List
+
+from shared_code.column_parser import parse_number_column, parse_time_column
+from shared_code.workout_schema import is_rest_value, resolve_columns
+
+TABLE_FORMAT_ROWS = "rows"
+TABLE_FORMAT_COLUMNAR = "columnar"
+TABLE_FORMAT_ARROW = "arrow"
+TABLE_FORMATS = (TABLE_FORMAT_ROWS, TABLE_FORMAT_COLUMNAR, TABLE_FORMAT_ARROW)
+
+DEFAULT_TABLE_FORMAT = os.environ.get("DEFAULT_TABLE_FORMAT", TABLE_FORMAT_ROWS)
+
+# Column for tables whose rows are plain text rather than column dictionaries
+CONTENT_COLUMN = "content"
+
+# Rest readings shown with an "r" prefix, e.g. "r1:00" or "r120"
+REST_READING_RE = re.compile(r"^\s*r\s*\d", re.IGNORECASE)
+
+
+@lru_cache(maxsize=1)
+def load_pyarrow():
+    """Import pyarrow on first use (it is optional and slow to import); None if not installed"""
+    try:
+        import pyarrow
+    except ImportError:
+        return None
+    return pyarrow
+
+
+def _column_units(columns: List[str]) -> Dict[str, str]:
+    canonical = resolve_columns(tuple(columns))
+    units = {}
+    for name in columns:
+        if name in canonical.get("time", ()) or name in canonical.get("split", ()):
+            units[name] = "seconds"
+        elif name in canonical.get("distance", ()):
+            units[name] = "meters"
+        else:
+            units[name] = "number"
+    return units
+
+
+def _has_letters(cell: Any) -> bool:
+    return any(c.isalpha() for c in str(cell))
+
+
+def _is_rest_row(row: Dict[str, Any]) -> bool:
+    return any(is_rest_value(value) or (isinstance(value, str) and REST_READING_RE.match(value))
+               for value in row.values())
+
+
+def columnar_table(rows: List[Any]) -> Dict[str, Any]:
+    """
+    Convert a table (row 0 is the header) to its columnar form
+
+    Returns:
+        Dictionary with:
+        - columns: column names in first-seen order
+        - header: column name -> header text
+        - rowCount: number of data rows
+        - units: column name -> "seconds", "meters" or "number"
+        - values: column name -> typed values (None where unreadable)
+        - valid: column name -> validity mask for values
+        - text: column name -> {row index: original text} for non-empty cells
+          that couldn't be read as a value or contain letters (rest markers, units)
+        - isRest: per data row, whether any cell carries a rest marker or an
+          "r"-prefixed rest reading
+    """
+    rows = [row if isinstance(row, dict) else {CONTENT_COLUMN: row} for row in rows or []]
+    header, data_rows = (rows[0], rows[1:]) if rows else ({}, [])
+
+    columns = list(header)
+    for row in data_rows:
+        for name in row:
+            if name not in columns:
+                columns.append(name)
+
+    units = _column_units(columns)
+    table = {
+        "columns": columns,
+        "header": {name: header.get(name, "") for name in columns},
+        "rowCount": len(data_rows),
+        "units": units,
+        "values": {},
+        "valid": {},
+        "text": {},
+        "isRest": [_is_rest_row(row) for row in data_rows]
+    }
+
+    for name in columns:
+        cells = [row.get(name) for row in data_rows]
+        parse = parse_number_column if units[name] == "meters" else parse_time_column
+        values, valid = parse(cells)
+        # Monitor readings have at most hundredths; rounding drops float noise from the JSON
+        table["values"][name] = [round(value, 3) if ok else None for value, ok in zip(values.tolist(), valid.tolist())]
+        table["valid"][name] = valid.tolist()
+        original = {
+            str(index): str(cell) for index, (cell, ok) in enumerate(zip(cells, table["valid"][name]))
+            if cell is not None and str(cell).strip() and (not ok or _has_letters(cell))
+        }
+        if original:
+            table["text"][name] = original
+
+    return table
+
+
+def arrow_table_bytes(table: Dict[str, Any]) -> bytes:
+    """
+    Encode a columnar table as an Arrow IPC stream
+
+    Each column becomes a float64 field (nulls where invalid); columns with kept
+    original text also get a string field named "<column>.text" holding it, and a
+    boolean "isRest" field flags rest rows. Column units and header text are
+    stored in the field metadata.
+    """
+    pa = load_pyarrow()
+    if pa is None:
+        raise RuntimeError("pyarrow is not installed")
+
+    arrays = []
+    fields = []
+    for name in table["columns"]:
+        metadata = {"unit": table["units"][name], "header": str(table["header"][name])}
+        arrays.append(pa.array(table["values"][name], type=pa.float64()))
+        fields.append(pa.field(name, pa.float64(), metadata=metadata))
+        original = table["text"].get(name)
+        if original:
+            text = [original.get(str(index)) for index in range(table["rowCount"])]
+            arrays.append(pa.array(text, type=pa.string()))
+            fields.append(pa.field(f"{name}.text", pa.string()))
+    arrays.append(pa.array(table["isRest"], type=pa.bool_()))
+    fields.append(pa.field("isRest", pa.bool_()))
+
+    batch = pa.RecordBatch.from_arrays(arrays, schema=pa.schema(fields))
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+
+def format_table(rows: List[Any], table_format: str) -> Any:
+    """Encode one table in the requested format"""
+    if table_format == TABLE_FORMAT_ROWS:
+        return rows
+
+    table = columnar_table(rows)
+    if table_format == TABLE_FORMAT_ARROW and load_pyarrow() is not None:
+        return {
+            "encoding": "arrow-ipc",
+            "rowCount": table["rowCount"],
+            "data": base64.b64encode(arrow_table_bytes(table)).decode("ascii")
+        }
+    return table
+
+
+def format_parsed_tables(data: Dict[str, Any], table_format: str = DEFAULT_TABLE_FORMAT) -> Dict[str, Any]:
+    """
+    Re-encode the tables of parsed workout data in place
+
+    Converts data["tables"] and data["standardTable"] and records the encoding
+    actually used in data["tableFormat"].
+    """
+    if not data or table_format == TABLE_FORMAT_ROWS:
+        return data
+
+    if table_format not in TABLE_FORMATS:
+        logging.warning(f"Unknown table format '{table_format}', returning rows")
+        return data
+
+    if table_format == TABLE_FORMAT_ARROW and load_pyarrow() is None:
+        logging.warning("pyarrow is not installed, returning columnar tables instead of Arrow")
+        table_format = TABLE_FORMAT_COLUMNAR
+
+    tables = data.get("tables") or {}
+    encoded = {}
+    for name, rows in tables.items():
+        encoded[name] = format_table(rows, table_format)
+    data["tables"] = encoded
+
+    # standardTable points at one of the tables; reuse its encoding
+    standard = data.get("standardTable")
+    if standard is not None:
+        shared = [name for name, rows in tables.items() if rows is standard]
+        data["standardTable"] = encoded[shared[0]] if shared else format_table(standard, table_format)
+
+    data["tableFormat"] = table_format
+    return data
@@ -0,0 +1,130 @@
+"""
+Overlap-Alignment Table Merge
+
+When a long interval table is photographed in several images, each image repeats
+the column header and usually some rows of the previous one. After stitching, the
+OCR table is a sequence of segments, one per image. This module removes the
+repeated rows by alignment instead of by counting:
+1. Rows are parsed once into IntervalRow records (times to seconds, other cells to numbers)
+2. The stream is split into segments at repeated header rows. A repeated header
+   is the only evidence of an image boundary; a table without one is returned unchanged
+3. At each boundary, the longest run of rows that starts the new segment and
+   matches the end of the rows merged so far is dropped. Rows compare fuzzily,
+   so the same row read slightly differently in two photos still matches
+4. Identical consecutive intervals inside a segment are never merged
+
+Rows compare fuzzily, so they can't be hashed for an exact-match search. Instead
+an overlap is capped at one segment's length and may only start at a row of the
+merged tail that matches the segment's first row. With c such rows, a boundary
+costs O(s + c*s) row comparisons for a segment of s rows. Photographed intervals
+differ, so c is almost always 0 or 1 and a table of n rows costs O(n); only a
+run of identical rows approaches O(s^2) for that boundary.
+"""
+
+import logging
+from typing import Any, List, Optional, Tuple
+
+from shared_code.interval_rows import IntervalRow, as_interval_rows
+
+# Numbers within this distance are the same reading (one tenth of a second or metre)
+NUMERIC_TOLERANCE = 0.1
+
+# Rows with at least this many shared columns may disagree in one column
+FUZZY_MIN_COLUMNS = 4
+
+
+def _allowed_mismatches(row: IntervalRow) -> int:
+    return 1 if len(row.cells) >= FUZZY_MIN_COLUMNS else 0
+
+
+def _cells_equal(a: Tuple[str, Optional[float]], b: Tuple[str, Optional[float]]) -> bool:
+    if a[1] is not None and b[1] is not None:
+        return abs(a[1] - b[1]) <= NUMERIC_TOLERANCE
+    return a[0] == b[0]
+
+
+def rows_match(a: IntervalRow, b: IntervalRow) -> bool:
+    """
+    Fuzzy row equality
+
+    Rows match when they have the same non-empty columns and every shared cell
+    agrees. Rows with FUZZY_MIN_COLUMNS or more columns may disagree in one cell.
+    """
+    if a.cells.keys() != b.cells.keys() or not a.cells:
+        return False
+
+    mismatches = 0
+    allowed = _allowed_mismatches(a)
+    for key, cell in a.cells.items():
+        if not _cells_equal(cell, b.cells[key]):
+            mismatches += 1
+            if mismatches > allowed:
+                return False
+    return True
+
+
+def boundary_overlap(merged: List[IntervalRow], segment: List[IntervalRow]) -> int:
+    """
+    Return how many rows at the start of segment repeat the end of merged (0 if none)
+
+    Only called at an image boundary. The longest overlap wins, so a repeated run
+    of identical intervals is skipped whole. Only the last len(segment) merged rows
+    are searched, and only from rows matching segment[0].
+    """
+    if not segment:
+        return 0
+    limit = min(len(merged), len(segment))
+    tail = merged[len(merged) - limit:]
+    # The earliest start is the longest overlap
+    for start, row in enumerate(tail):
+        if not rows_match(segment[0], row):
+            continue
+        length = limit - start
+        if all(rows_match(segment[k], tail[start + k]) for k in range(1, length)):
+            return length
+    return 0
+
+
+def merge_overlapping_rows(rows: List[Any]) -> List[Any]:
+    """
+    Merge a table read from overlapping images into one sequence of rows
+
+    Args:
+        rows: Table rows, as dictionaries or IntervalRow records; row 0 is the column header
+
+    Returns:
+        Header followed by the data rows with repeated headers and boundary overlaps
+        removed, in the same form (dictionaries or IntervalRow records) as rows.
+        A table without repeated headers is returned as given.
+    """
+    if not rows or len(rows) <= 2:
+        return rows
+
+    typed_input = isinstance(rows[0], IntervalRow)
+    parsed_rows = as_interval_rows(rows)
+    header = parsed_rows[0]
+    if not header.cells:
+        return rows
+
+    # Each photo repeats the column header; split the stream into one segment per image
+    segments: List[List[IntervalRow]] = [[]]
+    for parsed in parsed_rows[1:]:
+        if rows_match(parsed, header):
+            segments.append([])
+        else:
+            segments[-1].append(parsed)
+    if len(segments) == 1:
+        return rows
+
+    merged: List[IntervalRow] = list(segments[0])
+    skipped = 0
+    for segment in segments[1:]:
+        overlap = boundary_overlap(merged, segment)
+        skipped += overlap
+        merged.extend(segment[overlap:])
+
+    logging.info(f"Merged overlapping table rows: {len(rows)} -> {len(merged) + 1} "
+                 f"({len(segments) - 1} image boundaries, {skipped} repeated rows)")
+
+    result = [header] + merged
+    return result if typed_input else [row.raw for row in result]
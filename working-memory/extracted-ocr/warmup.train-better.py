@@ -0,0 +1,166 @@
+"""
+Instance Warm-up
+
+Moves one-time start-up costs off the first real request. A warm-up:
+1. Imports the modules the first request would otherwise load lazily (PIL)
+2. Runs a small synthetic monitor image through decode, detect, enhance and
+   encode, which spins up OpenCV's thread pool and the codec and filter paths
+3. Parses a synthetic OCR result, warming the parser and its NumPy column parser
+4. Opens a pooled TLS connection to the Document Intelligence endpoint
+5. Loads the local digit recognizer's templates when local OCR is enabled
+
+Each step is timed and failures are logged, never raised: a warm-up can only
+make the next request faster. Call warm_up() at host start or from a timer trigger.
+
+Configuration:
+    OCR_WARMUP_ON_START     Warm up in the background when the function app loads (default true)
+"""
+
+import base64
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import cv2
+import numpy as np
+
+WARMUP_ON_START = os.environ.get("OCR_WARMUP_ON_START", "true").lower() == "true"
+
+# Synthetic frame size; large enough for monitor detection to find the screen
+WARMUP_IMAGE_SIZE = (480, 640)
+
+_warmup_lock = threading.Lock()
+_last_report: Optional[Dict[str, Any]] = None
+
+
+def synthetic_monitor_image() -> np.ndarray:
+    """Return a dark frame holding a bright 'screen' with a few lines of text"""
+    height, width = WARMUP_IMAGE_SIZE
+    image = np.full((height, width, 3), 35, dtype=np.uint8)
+    cv2.rectangle(image, (width // 6, height // 6), (5 * width // 6, 5 * height // 6), (200, 210, 200), -1)
+    for row, text in enumerate(("2000m", "7:30.0", "1:52.5 24")):
+        cv2.putText(image, text, (width // 5, height // 3 + 50 * row), cv2.FONT_HERSHEY_SIMPLEX,
+                    1.2, (20, 20, 20), 2, cv2.LINE_AA)
+    return image
+
+
+def _synthetic_ocr_result() -> Dict[str, Any]:
+    def cell(text):
+        return {"type": "string", "content": text}
+
+    rows = [("time", "meter", "/500m", "s/m"), ("7:30.0", "2000", "1:52.5", "24"), ("r1:00", "", "", "")]
+    return {
+        "success": True,
+        "results": {"analyzeResult": {"documents": [{"fields": {
+            "WorkoutTitle": cell("2x1000m/1:00r"),
+            "TotalDistance": cell("2000m"),
+            "IntervalTable": {"type": "array", "valueArray": [
+                {"type": "object", "valueObject": {
+                    key: cell(value) for key, value in zip(("time", "meter", "split", "spm"), row) if value
+                }} for row in rows
+            ]}
+        }}]}}
+    }
+
+
+def _warm_image_pipeline():
+    from shared_code.image_processor import (
+        decode_base64_image, detect_and_crop_monitor_screen, encode_base64_image, enhance_image_readability
+    )
+
+    encoded = base64.b64encode(cv2.imencode(".jpg", synthetic_monitor_image())[1].tobytes()).decode("ascii")
+    image = decode_base64_image(encoded)
+    cropped, _, _ = detect_and_crop_monitor_screen(image)
+    encode_base64_image(enhance_image_readability(cropped))
+
+
+def _warm_parser():
+    from shared_code.workout_parser import parse_ocr_results
+    parse_ocr_results(_synthetic_ocr_result())
+
+
+def _warm_ocr_connection(options: Dict[str, Any]):
+    from shared_code.image_processor import get_ocr_session
+
+    endpoint = options.get("endpoint") or os.environ.get("AZURE_DOCUMENT_INTELLIGENCE_ENDPOINT")
+    if not endpoint:
+        logging.info("Warm-up: no OCR endpoint configured, skipping connection")
+        return
+    # Any response will do; the point is the TLS handshake and a pooled connection
+    get_ocr_session().head(endpoint.rstrip("/"), timeout=options.get("warmupTimeoutSeconds", 5))
+
+
+def _warm_local_ocr(options: Dict[str, Any]):
+    from shared_code import pm_digit_recognizer
+
+    if options.get("localOcr", pm_digit_recognizer.LOCAL_OCR_ENABLED):
+        pm_digit_recognizer.get_glyph_templates()
+
+
+def warm_up(options: Dict[str, Any] = None) -> Dict[str, Any]:
+    """
+    Pre-initialize expensive runtime state
+
+    Concurrent calls share one warm-up: a caller arriving while one runs waits
+    for it and gets its report.
+
+    Args:
+        options: Optional 'endpoint', 'localOcr' and 'warmupTimeoutSeconds'
+
+    Returns:
+        Dictionary with success, durationMs, steps (step name -> milliseconds)
+        and errors (step name -> message) for steps that failed
+    """
+    global _last_report
+    options = options or {}
+
+    if not _warmup_lock.acquire(blocking=False):
+        with _warmup_lock:
+            return dict(_last_report or {})
+
+    try:
+        steps = (
+            ("imports", lambda: __import__("PIL.ImageEnhance")),
+            ("imagePipeline", _warm_image_pipeline),
+            ("parser", _warm_parser),
+            ("ocrConnection", lambda: _warm_ocr_connection(options)),
+            ("localOcr", lambda: _warm_local_ocr(options)),
+        )
+
+        timings = {}
+        errors = {}
+        started = time.perf_counter()
+        for name, step in steps:
+            step_started = time.perf_counter()
+            try:
+                step()
+            except Exception as e:
+                logging.warning(f"Warm-up step {name} failed: {e}")
+                errors[name] = str(e)
+            timings[name] = round(1000.0 * (time.perf_counter() - step_started), 2)
+
+        report = {
+            "success": not errors,
+            "durationMs": round(1000.0 * (time.perf_counter() - started), 2),
+            "steps": timings,
+            "errors": errors
+        }
+        logging.info(f"Warm-up finished in {report['durationMs']}ms: {timings}")
+        _last_report = report
+        return dict(report)
+    finally:
+        _warmup_lock.release()
+
+
+def last_warmup() -> Optional[Dict[str, Any]]:
+    """Return the report of the most recent warm-up on this instance, if any"""
+    return dict(_last_report) if _last_report else None
+
+
+def start_background_warmup(options: Dict[str, Any] = None) -> threading.Thread:
+    """Run warm_up on a daemon thread so host start-up isn't blocked"""
+    thread = threading.Thread(target=warm_up, args=(options,), name="ocr-warmup", daemon=True)
+    thread.start()
+    return thread
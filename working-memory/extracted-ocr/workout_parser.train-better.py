@@ -12,10 +12,29 @@ Separating this logic from image processing allows for:
 - More maintainable codebase
 """
 
-import re
 import logging
 import traceback
-from typing import Dict, List, Any, Optional, Tuple
+from typing import Dict, List, Any, Optional, Sequence
+
+from shared_code.ocr_view import OcrResultView, clean_field_value
+from shared_code.workout_schema import (
+    DISTANCE_TITLE_RE, INTERVAL_CHOICE_TITLE_RE, INTERVAL_COUNT_TITLE_RE, INTERVAL_KEYWORD_TITLE_RE,
+    INTERVAL_TABLE_FIELDS, SUMMARY_FIELD_ALIASES, SUMMARY_FIELD_KINDS, TABLE_FIELD_PREFERENCE,
+    TIME_TITLE_RE, TITLE_FIELD_ALIASES, matching_keys
+)
+from shared_code.interval_rows import (
+    IntervalRow, as_interval_rows, get_interval_number_from_row, parse_cell, parse_interval_rows, raw_rows
+)
+from shared_code.table_merge import merge_overlapping_rows
+
+# get_interval_number_from_row moved to interval_rows and is re-exported for existing callers
+__all__ = [
+    "parse_ocr_results", "extract_document_fields", "extract_tables", "deduplicate_interval_tables",
+    "count_work_rows", "determine_interval_table_type", "extract_numeric_value", "extract_time_value",
+    "check_alternating_pattern", "deduplicate_table_rows", "deduplicate_standard_table_rows",
+    "deduplicate_variable_table_rows", "determine_workout_type", "get_field_with_alternates",
+    "parse_distance", "parse_number", "get_interval_number_from_row",
+]
 
 def parse_ocr_results(ocr_results: Dict) -> Dict:
     """
@@ -29,47 +48,37 @@ def parse_ocr_results(ocr_results: Dict) -> Dict:
                 "data": None
             }
             
+        # Index the OCR result once and share it between the extractors
+        view = OcrResultView.of(ocr_results)
+        
         # Extract document fields
-        document_fields = extract_document_fields(ocr_results)
+        document_fields = extract_document_fields(view)
         
         # Extract tables
-        tables_data = extract_tables(ocr_results)
+        tables_data = extract_tables(view)
         
         # Determine workout type
         workout_type = determine_workout_type(document_fields)
         
         # Create structured workout data with clean field values
-        workout_data = {
-            "workoutType": workout_type,
-            
-            "totalTime": clean_field_value(get_field_with_alternates(document_fields, 
-                ["TotalWorkTime", "TotalTime", "WorkoutDuration", "Duration", "Time"])),
-                
-            "totalDistance": parse_distance(clean_field_value(get_field_with_alternates(document_fields, 
-                ["TotalWorkDistance", "TotalDistance", "WorkoutDistance", "Distance", "Meters"]))),
-                
-            "averageSplit": clean_field_value(get_field_with_alternates(document_fields, 
-                ["Average500mSplit", "AverageSplit", "AvgSplit", "Pace", "AveragePace"])),
-                
-            "averageStrokeRate": parse_number(clean_field_value(get_field_with_alternates(document_fields, 
-                ["AverageStrokeRate", "AvgStrokeRate", "AvgSPM", "SPM"]))),
-                
-            "averageHeartRate": parse_number(clean_field_value(get_field_with_alternates(document_fields, 
-                ["AverageHeartRate", "AvgHeartRate", "AvgHR", "HeartRate", "HR"]))),
-                
-            "date": clean_field_value(get_field_with_alternates(document_fields, 
-                ["Date", "WorkoutDate"])),
-                
-            "workoutTitle": clean_field_value(get_field_with_alternates(document_fields, 
-                ["WorkoutTitle", "WorkoutName", "Workout", "Title", "Name", "ScreenTitle"])),
-                
-            # Include raw fields and table data
-            "tables": tables_data,
-            "fields": document_fields,
-            
-            # Add the standard table if available (most common table type)
-            "standardTable": tables_data.get("StandardTable", []) or tables_data.get("IntervalTable", []) or tables_data.get("VariableIntervalTable", [])
-        }
+        workout_data = {"workoutType": workout_type}
+        for key, aliases in SUMMARY_FIELD_ALIASES.items():
+            value = clean_field_value(get_field_with_alternates(document_fields, aliases))
+            kind = SUMMARY_FIELD_KINDS.get(key)
+            if kind == "distance":
+                value = parse_distance(value)
+            elif kind == "number":
+                value = parse_number(value)
+            workout_data[key] = value
+        
+        # Include raw fields and table data
+        workout_data["tables"] = tables_data
+        workout_data["fields"] = document_fields
+        
+        # Add the standard table if available (most common table type)
+        workout_data["standardTable"] = next(
+            (tables_data[name] for name in TABLE_FIELD_PREFERENCE if tables_data.get(name)), []
+        )
         
         # Remove empty fields
         workout_data = {k: v for k, v in workout_data.items() 
@@ -95,59 +104,27 @@ def parse_ocr_results(ocr_results: Dict) -> Dict:
             "traceback": traceback_str,
             "data": None
         }
-def clean_field_value(value: str) -> str:
-    """
-    Clean field values by fixing character encoding issues:
-    - Replace \u00a5 (¥) with 'r'
-    - Remove any non-printable characters
-    - Trim whitespace
-    """
-    if not value:
-        return ""
-        
-    # Replace ¥ character with 'r'
-    cleaned = value.replace('\u00a5', 'r')
-    
-    # Trim whitespace
-    cleaned = cleaned.strip()
-    
-    return cleaned
-
 def extract_document_fields(ocr_results: Dict) -> Dict:
     """
     Extract all document fields from OCR results with cleaned values
+
+    Accepts raw OCR results or an OcrResultView built from them.
     """
-    document_fields = {}
-    
     try:
-        results = ocr_results.get("results", {})
-        
-        # Check if there is an analyzeResult layer
-        if "analyzeResult" in results:
-            analyze_result = results["analyzeResult"]
-            
-            # Extract from documents if available
-            if "documents" in analyze_result and analyze_result["documents"]:
-                for doc in analyze_result["documents"]:
-                    if "fields" in doc:
-                        for field_name, field_data in doc["fields"].items():
-                            # Extract field value with proper cleanup
-                            if "content" in field_data:
-                                field_value = clean_field_value(field_data["content"])
-                                document_fields[field_name] = field_value
-                            elif "valueString" in field_data:
-                                field_value = clean_field_value(field_data["valueString"])
-                                document_fields[field_name] = field_value
+        return dict(OcrResultView.of(ocr_results).fields)
     except Exception as e:
         logging.error(f"Error extracting document fields: {str(e)}")
-    
-    return document_fields
+        return {}
+
 def deduplicate_interval_tables(workout_data: Dict) -> Dict:
     """
     Remove duplicate rows from interval tables when multiple images with overlapping data are processed.
     
-    For interval workouts, we use the NumIntervals field to determine the expected number of rows,
-    then intelligently remove duplicates when more rows than expected are found.
+    Each table is parsed once into IntervalRow records that every step below shares.
+    Overlapping image segments are merged by alignment at repeated header rows (see
+    table_merge), which needs no interval count. When NumIntervals is known, the
+    merge never leaves fewer intervals than it, and any rows beyond it are then
+    removed by the count-based deduplication.
     """
     # Skip deduplication if not an interval workout
     if workout_data.get("workoutType") != "interval":
@@ -161,29 +138,31 @@ def deduplicate_interval_tables(workout_data: Dict) -> Dict:
         except (ValueError, TypeError):
             logging.warning("NumIntervals could not be parsed as an integer")
     
-    if not num_intervals:
-        logging.info("Cannot deduplicate: NumIntervals not found or invalid")
-        return workout_data
-    
-    logging.info(f"Found NumIntervals={num_intervals}, checking for table deduplication")
+    if num_intervals:
+        logging.info(f"Found NumIntervals={num_intervals}, checking for table deduplication")
+    else:
+        logging.info("NumIntervals not found or invalid, only merging overlapping images")
     
     # Process tables if present
-    if "tables" in workout_data:
-        # Process IntervalTable if present
-        if "IntervalTable" in workout_data["tables"] and isinstance(workout_data["tables"]["IntervalTable"], list):
-            workout_data["tables"]["IntervalTable"] = deduplicate_table_rows(
-                workout_data["tables"]["IntervalTable"], 
-                num_intervals,
-                determine_interval_table_type(workout_data["tables"]["IntervalTable"])
-            )
+    tables = workout_data.get("tables") or {}
+    for table_name in TABLE_FIELD_PREFERENCE:
+        rows = tables.get(table_name)
+        if not isinstance(rows, list):
+            continue
+        
+        parsed = parse_interval_rows(rows)
+        table_type = determine_interval_table_type(parsed)
+        merged = merge_overlapping_rows(parsed)
         
-        # Process StandardTable if present
-        if "StandardTable" in workout_data["tables"] and isinstance(workout_data["tables"]["StandardTable"], list):
-            workout_data["tables"]["StandardTable"] = deduplicate_table_rows(
-                workout_data["tables"]["StandardTable"], 
-                num_intervals,
-                determine_interval_table_type(workout_data["tables"]["StandardTable"])
-            )
+        if num_intervals:
+            # Identical consecutive intervals can look like an overlap; never merge
+            # below the interval count the monitor reported
+            if count_work_rows(merged, table_type) < num_intervals <= count_work_rows(parsed, table_type):
+                logging.info(f"Overlap merge of {table_name} left fewer than {num_intervals} intervals, keeping rows")
+                merged = parsed
+
+            merged = deduplicate_table_rows(merged, num_intervals, table_type)
+        tables[table_name] = raw_rows(merged)
     
     # Update the standardTable reference
     if "tables" in workout_data:
@@ -191,17 +170,30 @@ def deduplicate_interval_tables(workout_data: Dict) -> Dict:
             workout_data["standardTable"] = workout_data["tables"]["IntervalTable"]
         elif "StandardTable" in workout_data["tables"] and workout_data["tables"]["StandardTable"]:
             workout_data["standardTable"] = workout_data["tables"]["StandardTable"]
+        elif "VariableIntervalTable" in workout_data["tables"] and workout_data["tables"]["VariableIntervalTable"]:
+            workout_data["standardTable"] = workout_data["tables"]["VariableIntervalTable"]
     
     return workout_data
 
-def determine_interval_table_type(rows: List[Dict]) -> str:
+def count_work_rows(rows: List[Any], table_type: str) -> int:
+    """Count the data rows of a table that are intervals rather than header or rest rows"""
+    count = 0
+    for row in as_interval_rows(rows)[1:]:
+        if not row.is_object or row.is_rest:
+            continue
+        if table_type == "variable" and row.data_columns <= 2:
+            continue
+        count += 1
+    return count
+
+def determine_interval_table_type(rows: List[Any]) -> str:
     """
     Determine the type of interval table:
     - "standard": Regular interval table with one row per interval
     - "variable": Variable interval table with work/rest pairs
     
     Args:
-        rows: List of table rows
+        rows: List of table rows (dictionaries or IntervalRow records)
         
     Returns:
         Table type as string: "standard" or "variable"
@@ -209,39 +201,19 @@ def determine_interval_table_type(rows: List[Dict]) -> str:
     if not rows or len(rows) <= 1:  # Not enough rows to determine
         return "standard"
     
-    # Check if we see rest rows (indicating variable interval format)
-    rest_indicators = ["rest", "recovery", "rec", "r:", "r="]
+    rows = as_interval_rows(rows)
     
-    # Skip the header row, check the rest
-    for i in range(1, min(5, len(rows))):  # Check up to 4 non-header rows
-        row = rows[i]
-        if not isinstance(row, dict):
-            continue
-            
-        # Look for rest indicators in the row values
-        for value in row.values():
-            if isinstance(value, str) and any(ind in value.lower() for ind in rest_indicators):
-                return "variable"
+    # Check if we see rest rows (indicating variable interval format)
+    # Skip the header row, check up to 4 non-header rows
+    if any(row.is_object and row.is_rest for row in rows[1:5]):
+        return "variable"
     
     # If no clear rest indicators, check row pattern
     # Variable format often has alternating patterns in distance or time
     if len(rows) >= 5:  # Need header + at least 2 pairs
-        distances = []
-        times = []
-        
-        for i in range(1, min(7, len(rows))):
-            row = rows[i]
-            if not isinstance(row, dict):
-                continue
-                
-            # Try to extract distance and time values
-            dist_val = extract_numeric_value(row, ["distance", "meter", "meters", "m"])
-            time_val = extract_time_value(row, ["time", "duration", "mins", "min"])
-            
-            if dist_val is not None:
-                distances.append(dist_val)
-            if time_val is not None:
-                times.append(time_val)
+        sample = [row for row in rows[1:7] if row.is_object]
+        distances = [row.meters for row in sample if row.meters is not None]
+        times = [row.seconds for row in sample if row.seconds is not None]
         
         # Check for alternating pattern in distances or times
         if check_alternating_pattern(distances) or check_alternating_pattern(times):
@@ -252,45 +224,24 @@ def determine_interval_table_type(rows: List[Dict]) -> str:
 
 def extract_numeric_value(row: Dict, field_keys: List[str]) -> Optional[float]:
     """Extract a numeric value from a row using various possible field keys"""
-    for key in row:
-        if any(field_key in key.lower() for field_key in field_keys):
-            try:
-                # Extract digits and possible decimal point
-                value_str = ''.join(c for c in str(row[key]) if c.isdigit() or c == '.')
-                if value_str:
-                    return float(value_str)
-            except (ValueError, TypeError):
-                pass
+    for key in matching_keys(tuple(row), tuple(field_keys)):
+        try:
+            # Extract digits and possible decimal point
+            value_str = ''.join(c for c in str(row[key]) if c.isdigit() or c == '.')
+            if value_str:
+                return float(value_str)
+        except (ValueError, TypeError):
+            pass
     return None
 
 def extract_time_value(row: Dict, field_keys: List[str]) -> Optional[float]:
     """Extract a time value from a row and convert to seconds"""
-    for key in row:
-        if any(field_key in key.lower() for field_key in field_keys):
-            if not row[key]:
-                continue
-                
-            value_str = str(row[key])
-            
-            # Try to handle MM:SS format
-            if ":" in value_str:
-                try:
-                    parts = value_str.split(":")
-                    if len(parts) == 2:
-                        mins = float(parts[0])
-                        secs = float(parts[1])
-                        return mins * 60 + secs
-                except (ValueError, TypeError):
-                    pass
-            
-            # Try to extract as a simple numeric value
-            try:
-                # Extract digits and possible decimal point
-                clean_value = ''.join(c for c in value_str if c.isdigit() or c == '.')
-                if clean_value:
-                    return float(clean_value)
-            except (ValueError, TypeError):
-                pass
+    for key in matching_keys(tuple(row), tuple(field_keys)):
+        if not row[key]:
+            continue
+        _, seconds = parse_cell(row[key])
+        if seconds is not None:
+            return seconds
     return None
 
 def check_alternating_pattern(values: List[float]) -> bool:
@@ -315,23 +266,20 @@ def check_alternating_pattern(values: List[float]) -> bool:
     
     return odd_similar and even_similar and means_different
 
-def deduplicate_table_rows(rows: List[Dict], expected_count: int, table_type: str) -> List[Dict]:
+def deduplicate_table_rows(rows: List[Any], expected_count: int, table_type: str) -> List[Any]:
     """
     Generic deduplication function that handles both standard and variable interval tables
     
     Args:
-        rows: List of table rows
+        rows: List of table rows (dictionaries or IntervalRow records)
         expected_count: Expected number of intervals
         table_type: "standard" or "variable"
         
     Returns:
-        Deduplicated list of rows
+        Deduplicated list of rows, in the same form as rows
     """
     if not rows or len(rows) <= 1:  # Need at least a header
         return rows
-        
-    # Preserve header (row 0)
-    header = rows[0]
     
     # For standard tables:
     # Total expected rows = header + workout intervals + (possibly) rest summary
@@ -348,20 +296,28 @@ def deduplicate_table_rows(rows: List[Dict], expected_count: int, table_type: st
     
     logging.info(f"Deduplicating {table_type} table from {len(rows)} to {total_expected_rows} rows")
     
+    typed_input = isinstance(rows[0], IntervalRow)
+    parsed = as_interval_rows(rows)
     if table_type == "standard":
-        return deduplicate_standard_table_rows(rows, expected_count)
+        result = deduplicate_standard_table_rows(parsed, expected_count)
     else:
-        return deduplicate_variable_table_rows(rows, expected_count)
+        result = deduplicate_variable_table_rows(parsed, expected_count)
+    return result if typed_input else raw_rows(result)
 
-def deduplicate_standard_table_rows(rows: List[Dict], expected_count: int) -> List[Dict]:
+def deduplicate_standard_table_rows(rows: List[Any], expected_count: int) -> List[Any]:
     """
     Deduplicate standard interval table rows with structure:
     - Row 0: Header
     - Row 1-N: Workout rows
     - Row N+1: (Optional) Rest summary row
+
+    Rows may be dictionaries or IntervalRow records and are returned in the same form.
     """
     if not rows or len(rows) <= 1:
         return rows
+
+    typed_input = isinstance(rows[0], IntervalRow)
+    rows = as_interval_rows(rows)
         
     # Preserve header (row 0)
     header = rows[0]
@@ -370,50 +326,24 @@ def deduplicate_standard_table_rows(rows: List[Dict], expected_count: int) -> Li
     rest_row = None
     workout_rows = rows[1:]
     
-    # Check if last row might be a rest summary row
-    if len(workout_rows) > 0:
-        last_row = workout_rows[-1]
-        is_rest_summary = False
-        
-        if isinstance(last_row, dict):
-            # Look for "rest" in any field value
-            for value in last_row.values():
-                if isinstance(value, str) and "rest" in value.lower():
-                    is_rest_summary = True
-                    break
-            
-            # Also check if there's only data in the second column
-            if not is_rest_summary:
-                data_columns = [key for key, value in last_row.items() 
-                              if value and str(value).strip()]
-                if len(data_columns) == 1:
-                    second_column_names = ["Meter", "meter", "distance", "Distance", "m"]
-                    if any(column in data_columns[0] for column in second_column_names):
-                        is_rest_summary = True
-        
-        if is_rest_summary:
-            rest_row = last_row
-            workout_rows = workout_rows[:-1]
+    # A rest summary has a rest marker or data only in the distance column
+    last_row = workout_rows[-1]
+    if last_row.is_object and (last_row.is_rest or last_row.distance_only()):
+        rest_row = last_row
+        workout_rows = workout_rows[:-1]
     
     # Deduplicate workout rows
     unique_workout_rows = []
-    seen_hashes = set()
+    seen_keys = set()
     
     for row in workout_rows:
-        # Create a hashable representation of the row
-        row_items = sorted((k, str(v)) for k, v in row.items() if k != "number")
-        row_hash = str(row_items)
-        
-        if row_hash not in seen_hashes:
-            seen_hashes.add(row_hash)
+        if row.key not in seen_keys:
+            seen_keys.add(row.key)
             unique_workout_rows.append(row)
     
     # If we still have too many rows, sort by interval number and take the expected count
     if len(unique_workout_rows) > expected_count:
-        sorted_rows = sorted(
-            unique_workout_rows,
-            key=lambda x: get_interval_number_from_row(x)
-        )
+        sorted_rows = sorted(unique_workout_rows, key=lambda row: row.interval_number)
         unique_workout_rows = sorted_rows[:expected_count]
     
     # Reassemble the table
@@ -422,66 +352,36 @@ def deduplicate_standard_table_rows(rows: List[Dict], expected_count: int) -> Li
         result.append(rest_row)
     
     logging.info(f"Deduplicated to {len(result)} rows (header + {len(unique_workout_rows)} workout rows + {1 if rest_row else 0} rest summary)")
-    return result
+    return result if typed_input else raw_rows(result)
 
 def extract_tables(ocr_results: Dict) -> Dict[str, List[Dict]]:
     """ 
     Extract table data from OCR results
     
+    Accepts raw OCR results or an OcrResultView built from them.
     Returns a dictionary mapping table names to lists of table rows
     """
-    tables_data = {}
-    
     try:
-        results = ocr_results.get("results", {})
-        
-        # Check for analyzeResult layer
-        if "analyzeResult" in results:
-            analyze_result = results["analyzeResult"]
-            
-            # Extract from documents if available
-            if "documents" in analyze_result and analyze_result["documents"]:
-                for doc in analyze_result["documents"]:
-                    if "fields" not in doc:
-                        continue
-                    
-                    # Look for table fields (arrays)
-                    for field_name, field_data in doc["fields"].items():
-                        # Check if this is a table field
-                        if field_data.get("type") == "array" and "valueArray" in field_data:
-                            table_rows = []
-                            
-                            for item in field_data["valueArray"]:
-                                if "valueObject" in item:
-                                    # Process structured row data
-                                    row_data = {}
-                                    for col_name, col_data in item["valueObject"].items():
-                                        if "content" in col_data:
-                                            row_data[col_name] = clean_field_value(col_data["content"])
-                                        elif "valueString" in col_data:
-                                            row_data[col_name] = clean_field_value(col_data["valueString"])
-                                    table_rows.append(row_data)
-                                elif "content" in item:
-                                    # Add simple content rows (less common)
-                                    table_rows.append(clean_field_value(item["content"]))
-                            
-                            # Add to tables data
-                            tables_data[field_name] = table_rows
+        return OcrResultView.of(ocr_results).tables()
     except Exception as e:
         logging.error(f"Error extracting tables: {str(e)}")
-    
-    return tables_data
+        return {}
 
-def deduplicate_variable_table_rows(rows: List[Dict], expected_count: int) -> List[Dict]:
+def deduplicate_variable_table_rows(rows: List[Any], expected_count: int) -> List[Any]:
     """
     Deduplicate variable interval table rows with structure:
     - Row 0: Header
     - For each interval: 
       - Work row
       - Rest row
+
+    Rows may be dictionaries or IntervalRow records and are returned in the same form.
     """
     if not rows or len(rows) <= 1:
         return rows
+
+    typed_input = isinstance(rows[0], IntervalRow)
+    rows = as_interval_rows(rows)
         
     # Preserve header (row 0)
     header = rows[0]
@@ -493,21 +393,8 @@ def deduplicate_variable_table_rows(rows: List[Dict], expected_count: int) -> Li
         work_row = rows[i]
         rest_row = rows[i+1]
         
-        # Check if this is likely a work+rest pair
-        is_rest_row = False
-        if isinstance(rest_row, dict):
-            # Check for "rest" in any field value
-            for value in rest_row.values():
-                if isinstance(value, str) and "rest" in value.lower():
-                    is_rest_row = True
-                    break
-            
-            # Also check data pattern (data mainly in first and second columns)
-            if not is_rest_row:
-                data_columns = [key for key, value in rest_row.items() 
-                              if value and str(value).strip()]
-                if 1 <= len(data_columns) <= 2:
-                    is_rest_row = True
+        # A rest row has a rest marker, or data mainly in the first and second columns
+        is_rest_row = rest_row.is_object and (rest_row.is_rest or 1 <= rest_row.data_columns <= 2)
         
         if is_rest_row:
             interval_pairs.append((work_row, rest_row))
@@ -523,24 +410,16 @@ def deduplicate_variable_table_rows(rows: List[Dict], expected_count: int) -> Li
     
     # Deduplicate interval pairs by looking at the work row (first element of each pair)
     unique_pairs = []
-    seen_hashes = set()
+    seen_keys = set()
     
     for work_row, rest_row in interval_pairs:
-        # Create a hashable representation of the work row
-        if isinstance(work_row, dict):
-            row_items = sorted((k, str(v)) for k, v in work_row.items() if k != "number")
-            row_hash = str(row_items)
-            
-            if row_hash not in seen_hashes:
-                seen_hashes.add(row_hash)
-                unique_pairs.append((work_row, rest_row))
+        if work_row.is_object and work_row.key not in seen_keys:
+            seen_keys.add(work_row.key)
+            unique_pairs.append((work_row, rest_row))
     
     # If we still have too many pairs, sort by interval number and take the expected count
     if len(unique_pairs) > expected_count:
-        sorted_pairs = sorted(
-            unique_pairs,
-            key=lambda pair: get_interval_number_from_row(pair[0])
-        )
+        sorted_pairs = sorted(unique_pairs, key=lambda pair: pair[0].interval_number)
         unique_pairs = sorted_pairs[:expected_count]
     
     # Reassemble the table with header and deduplicated interval pairs
@@ -551,40 +430,14 @@ def deduplicate_variable_table_rows(rows: List[Dict], expected_count: int) -> Li
             result.append(rest_row)
     
     logging.info(f"Deduplicated to {len(result)} rows (header + {len(unique_pairs)} interval pairs)")
-    return result
-
-def get_interval_number_from_row(row: Dict) -> int:
-    """Extract interval number from a row, with fallbacks to other numeric fields"""
-    if not isinstance(row, dict):
-        return 0
-    
-    # Try common interval number field names
-    for key in ["number", "interval", "#", "no", "no."]:
-        if key in row and row[key]:
-            try:
-                return int(str(row[key]).strip())
-            except (ValueError, TypeError):
-                pass
-    
-    # Fall back to numeric values in time or distance fields
-    for key in ["Time", "time", "Meter", "meter", "Distance", "distance"]:
-        if key in row and row[key]:
-            # Extract digits
-            digits = ''.join(c for c in str(row[key]) if c.isdigit())
-            if digits:
-                try:
-                    return int(digits)
-                except (ValueError, TypeError):
-                    pass
-    
-    return 0
+    return result if typed_input else raw_rows(result)
 
 def determine_workout_type(fields: Dict[str, Any]) -> str:
     """
     Determine the type of workout based on available fields and tables
     """
     # Get the title field with fallbacks
-    title = get_field_with_alternates(fields, ["WorkoutTitle", "Title", "Name", "ScreenTitle"])
+    title = get_field_with_alternates(fields, TITLE_FIELD_ALIASES)
     
     # Check for interval tables in the tables dictionary
     if "tables" in fields:
@@ -601,7 +454,7 @@ def determine_workout_type(fields: Dict[str, Any]) -> str:
     
     # Check direct array fields in the document
     for field_name, field_data in fields.items():
-        if field_name in ["IntervalTable", "VariableIntervalTable"] and isinstance(field_data, dict):
+        if field_name in INTERVAL_TABLE_FIELDS and isinstance(field_data, dict):
             if field_data.get("type") == "array" and field_data.get("valueArray") and len(field_data["valueArray"]) > 0:
                 logging.info(f"Found {field_name} with {len(field_data['valueArray'])} rows - classified as interval workout")
                 return "interval"
@@ -626,27 +479,27 @@ def determine_workout_type(fields: Dict[str, Any]) -> str:
         title_lower = title.lower().strip()
         
         # Check for interval patterns
-        if re.search(r'\d+\s*[xX]\s*\d+', title):  # NxM pattern (e.g., "4x500m")
+        if INTERVAL_COUNT_TITLE_RE.search(title):  # NxM pattern (e.g., "4x500m")
             logging.info(f"Title '{title}' matches interval pattern (NxM) - classified as interval workout")
             return "interval"
         
         # Check for "N or M" pattern with ellipses
-        elif re.search(r'\.\.\.\d+\s*or\s*\d+', title):
+        elif INTERVAL_CHOICE_TITLE_RE.search(title):
             logging.info(f"Title '{title}' matches interval pattern (...N or M) - classified as interval workout")
             return "interval"
         
         # Check for interval keywords
-        elif any(keyword in title_lower for keyword in ["interval", "intervals", "rest", "recovery", "work/rest"]):
+        elif INTERVAL_KEYWORD_TITLE_RE.search(title_lower):
             logging.info(f"Title '{title}' contains interval keywords - classified as interval workout")
             return "interval"
             
         # Check for single distance patterns
-        elif re.search(r'\d+\s*[mM]', title):
+        elif DISTANCE_TITLE_RE.search(title):
             logging.info(f"Title '{title}' matches single distance pattern - classified as single_distance workout")
             return "single_distance"
             
         # Check for time patterns
-        elif re.search(r'\d+\s*[mM]in', title) or re.search(r'\d+:\d+', title):
+        elif TIME_TITLE_RE.search(title):
             logging.info(f"Title '{title}' matches time pattern - classified as single_time workout")
             return "single_time"
     
@@ -654,7 +507,7 @@ def determine_workout_type(fields: Dict[str, Any]) -> str:
     return "single_distance"
 
 
-def get_field_with_alternates(fields: Dict[str, str], field_names: List[str]) -> str:
+def get_field_with_alternates(fields: Dict[str, str], field_names: Sequence[str]) -> str:
     """
     Try to get a field value using multiple possible field names
     """
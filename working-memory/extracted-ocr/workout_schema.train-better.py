@@ -0,0 +1,103 @@
+"""
+Workout Field Schema
+
+Field names and text patterns the workout parser relies on, compiled once at import:
+1. Canonical summary fields mapped to the model field names that can carry them
+2. Table column aliases, resolved per set of row keys and cached
+3. Precompiled title patterns for workout type detection
+4. A single matcher for rest/recovery indicators in table cells
+
+Supporting a new model field name is a change to the data in this module; the
+parser itself does not need to change.
+"""
+
+import re
+from functools import lru_cache
+from typing import Dict, Tuple
+
+# Canonical summary field -> model field names, in order of preference
+SUMMARY_FIELD_ALIASES: Dict[str, Tuple[str, ...]] = {
+    "totalTime": ("TotalWorkTime", "TotalTime", "WorkoutDuration", "Duration", "Time"),
+    "totalDistance": ("TotalWorkDistance", "TotalDistance", "WorkoutDistance", "Distance", "Meters"),
+    "averageSplit": ("Average500mSplit", "AverageSplit", "AvgSplit", "Pace", "AveragePace"),
+    "averageStrokeRate": ("AverageStrokeRate", "AvgStrokeRate", "AvgSPM", "SPM"),
+    "averageHeartRate": ("AverageHeartRate", "AvgHeartRate", "AvgHR", "HeartRate", "HR"),
+    "date": ("Date", "WorkoutDate"),
+    "workoutTitle": ("WorkoutTitle", "WorkoutName", "Workout", "Title", "Name", "ScreenTitle"),
+}
+
+# How summary values are converted: "distance" and "number" parse to integers,
+# anything not listed stays cleaned text
+SUMMARY_FIELD_KINDS: Dict[str, str] = {
+    "totalDistance": "distance",
+    "averageStrokeRate": "number",
+    "averageHeartRate": "number",
+}
+
+# Fields consulted when classifying the workout from its title
+TITLE_FIELD_ALIASES: Tuple[str, ...] = ("WorkoutTitle", "Title", "Name", "ScreenTitle")
+
+# Table fields, in the order the standardTable shortcut prefers them
+TABLE_FIELD_PREFERENCE: Tuple[str, ...] = ("StandardTable", "IntervalTable", "VariableIntervalTable")
+
+# Table fields whose presence marks an interval workout
+INTERVAL_TABLE_FIELDS: Tuple[str, ...] = ("IntervalTable", "VariableIntervalTable")
+
+# Canonical table column -> lower-case aliases. Aliases of up to two characters
+# must equal the column name; longer aliases may appear anywhere in it.
+COLUMN_ALIASES: Dict[str, Tuple[str, ...]] = {
+    "distance": ("distance", "meter", "meters", "m"),
+    "time": ("time", "duration", "mins", "min"),
+    "split": ("split", "pace", "/500"),
+    "spm": ("spm", "s/m", "rate"),
+}
+
+# Row keys holding the interval number, and fallbacks used to order rows without one
+INTERVAL_NUMBER_KEYS: Tuple[str, ...] = ("number", "interval", "#", "no", "no.")
+INTERVAL_ORDER_FALLBACK_KEYS: Tuple[str, ...] = ("Time", "time", "Meter", "meter", "Distance", "distance")
+
+# Rest/recovery markers in table cells (matched against lower-cased values)
+REST_INDICATOR_RE = re.compile(r"rest|rec|r:|r=")
+
+# Title patterns, checked in this order by determine_workout_type
+INTERVAL_COUNT_TITLE_RE = re.compile(r"\d+\s*[xX]\s*\d+")           # "4x500m"
+INTERVAL_CHOICE_TITLE_RE = re.compile(r"\.\.\.\d+\s*or\s*\d+")      # "...4 or 5"
+INTERVAL_KEYWORD_TITLE_RE = re.compile(r"interval|rest|recovery|work/rest")
+DISTANCE_TITLE_RE = re.compile(r"\d+\s*[mM]")
+TIME_TITLE_RE = re.compile(r"\d+\s*[mM]in|\d+:\d+")
+
+
+def _alias_matches(alias: str, key: str) -> bool:
+    return alias == key if len(alias) <= 2 else alias in key
+
+
+@lru_cache(maxsize=256)
+def resolve_columns(keys: Tuple[str, ...]) -> Dict[str, Tuple[str, ...]]:
+    """
+    Map each canonical column to the row keys that carry it
+
+    Rows from the same table share their keys, so this runs once per table layout.
+
+    Args:
+        keys: Row keys in row order
+
+    Returns:
+        Canonical column name -> matching keys in row order (columns without a match are omitted)
+    """
+    columns = {}
+    for column, aliases in COLUMN_ALIASES.items():
+        matches = tuple(key for key in keys if any(_alias_matches(alias, key.lower()) for alias in aliases))
+        if matches:
+            columns[column] = matches
+    return columns
+
+
+@lru_cache(maxsize=256)
+def matching_keys(keys: Tuple[str, ...], aliases: Tuple[str, ...]) -> Tuple[str, ...]:
+    """Return the keys that match any of the given lower-case aliases, in row order"""
+    return tuple(key for key in keys if any(_alias_matches(alias, key.lower()) for alias in aliases))
+
+
+def is_rest_value(value) -> bool:
+    """True if a table cell looks like a rest/recovery marker"""
+    return isinstance(value, str) and REST_INDICATOR_RE.search(value.lower()) is not None